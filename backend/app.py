@@ -1,16 +1,41 @@
 """Main application entry point."""
 import os
+import math
+import time
+import hmac
 import logging
-from flask import Flask, jsonify, request, abort, session
+from flask import Flask, Request, Response, jsonify, request, abort, session, g
 from celery import Celery
-from werkzeug.exceptions import HTTPException
+from werkzeug.exceptions import HTTPException, TooManyRequests
 from config import Config
 from extensions import init_extensions
 from blueprints.auth.routes import auth_bp
 from blueprints.dashboard.routes import dashboard_bp
 from blueprints.nlp.routes import nlp_bp
 from blueprints.documents.routes import documents_bp
+from blueprints.nlp.ai_engine import warm_up_models
 from middleware.security import validate_request, csrf_protect
+from services.rate_limiter import RateLimiter, route_cost
+from services.metrics import Histogram, render_metrics
+from services.file_store import file_store
+import services.task_metrics  # noqa: F401 -- exposes Celery task metrics on /metrics
+
+rate_limiter = RateLimiter()
+
+REQUEST_SECONDS = Histogram('http_request_duration_seconds', 'Latency of HTTP requests.',
+                            ['endpoint', 'method', 'status'])
+# Endpoints served without the JSON, session and rate limit checks
+PUBLIC_ENDPOINTS = {'metrics'}
+
+
+class UploadRequest(Request):
+    """
+    Request whose uploaded file parts are spooled straight into the file store,
+    hashed while the body is parsed, so an upload is written to disk once.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return file_store.spool()
 
 
 def create_app(config_class=Config):
@@ -20,6 +45,7 @@ def create_app(config_class=Config):
     :return: Configured Flask app.
     """
     app = Flask(__name__)
+    app.request_class = UploadRequest
     app.config.from_object(config_class)
 
     # Initialize extensions (e.g., database, migrations, etc.)
@@ -34,6 +60,13 @@ def create_app(config_class=Config):
     # Register error handlers
     register_error_handlers(app)
 
+    # Expose metrics for Prometheus
+    register_metrics(app)
+
+    # Load NLP models up front when running under a pre-fork server (gunicorn --preload)
+    if app.config.get('PRELOAD_MODELS'):
+        warm_up_models()
+
     return app
 
 
@@ -54,9 +87,29 @@ def configure_global_middleware(app):
     :param app: The Flask app instance.
     """
     @app.before_request
+    def start_timer():
+        """Start timing the request, before any check can reject it."""
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def record_request_time(response):
+        """Record the request's latency."""
+        start = g.get('request_start')
+        if start is not None:
+            REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=request.endpoint or 'unknown',
+                                    method=request.method, status=response.status_code)
+        return response
+
+    @app.before_request
+    def before_request():
+        """Skip the global checks for public endpoints such as /metrics."""
+        if request.endpoint in PUBLIC_ENDPOINTS:
+            return None
+        return secure_request()
+
     @validate_request
     @csrf_protect
-    def before_request():
+    def secure_request():
         """Global request validation, security enforcement, and additional logic."""
 
         # Log the incoming request details
@@ -68,24 +121,51 @@ def configure_global_middleware(app):
             logging.warning("Unauthorized access attempt detected.")
             abort(401, description="Unauthorized")
 
-        # Rate limiting logic
+        # Rate limiting logic: per user and per IP, weighted by route cost
         client_ip = request.remote_addr
-        if not check_rate_limit(client_ip):
-            logging.warning("Rate limit exceeded for IP: %s", client_ip)
-            abort(429, description="Too many requests, slow down!")
+        decision = check_rate_limit(session['user_id'], client_ip, request.method, request.endpoint)
+        if not decision.allowed:
+            logging.warning("Rate limit exceeded for user %s from IP: %s", session['user_id'], client_ip)
+            raise TooManyRequests(description="Too many requests, slow down!",
+                                  retry_after=max(1, math.ceil(decision.retry_after)))
 
         # Additional checks can be added here
 
 
-def check_rate_limit(client_ip):
+def check_rate_limit(user_id, client_ip, method, endpoint):
     """
-    Placeholder function to check if a client IP has exceeded the rate limit.
-    This should be replaced with your actual rate-limiting logic.
+    Check a request against the user's and the client IP's token buckets.
+    Expensive routes (e.g. submitting to /nlp/query) spend more tokens than cheap ones.
+    :param user_id: The authenticated user making the request.
     :param client_ip: The IP address of the client making the request.
-    :return: True if the request is within the rate limit, False otherwise.
+    :param method: The HTTP method, which with the endpoint decides the cost.
+    :param endpoint: The Flask endpoint name.
+    :return: Decision with `allowed`, `remaining` tokens and `retry_after` seconds.
     """
-    # Implement your rate limiting logic here
-    return True
+    return rate_limiter.check({"user": str(user_id), "ip": client_ip}, route_cost(method, endpoint))
+
+
+def register_metrics(app):
+    """
+    Serve every registered metric in Prometheus text format on /metrics.
+    Scrapes must send `Authorization: Bearer <METRICS_TOKEN>`. Without a
+    token configured the endpoint is only served in debug and testing;
+    elsewhere it is refused, since metric labels reveal routes and load.
+    :param app: The Flask app instance.
+    """
+    if not app.config.get('METRICS_TOKEN'):
+        logging.warning("METRICS_TOKEN is not set: /metrics is only served in debug and testing")
+
+    @app.route('/metrics', endpoint='metrics')
+    def metrics():
+        """Prometheus scrape endpoint."""
+        token = app.config.get('METRICS_TOKEN')
+        if not token:
+            if not (app.debug or app.testing):
+                abort(403, description="Metrics are disabled; set METRICS_TOKEN to enable them")
+        elif not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}"):
+            abort(401, description="Unauthorized")
+        return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
 
 
 def register_error_handlers(app):
@@ -97,12 +177,13 @@ def register_error_handlers(app):
     def handle_http_exception(error):
         """Handle HTTP errors and return JSON responses."""
         logging.error("HTTP Exception: %s", error)
+        # Keep the exception's headers (e.g. Retry-After, WWW-Authenticate), replace its HTML body
         response = error.get_response()
         response.data = jsonify({
             "code": error.code,
             "name": error.name,
             "description": error.description
-        })
+        }).get_data()
         response.content_type = "application/json"
         return response, error.code
 
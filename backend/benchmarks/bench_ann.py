@@ -0,0 +1,79 @@
+"""
+Benchmark: recall@k and latency of the IVF case index against exact search.
+
+Usage (from backend/): python -m benchmarks.bench_ann [--cases 100000] [--dim 768]
+    [--nlist N] [--nprobe 4 8 16 32]
+"""
+import argparse
+import tempfile
+import time
+import numpy as np
+from blueprints.nlp.ann_index import IVFCaseIndex
+from blueprints.nlp.case_index import CaseEmbeddingIndex
+
+
+def synthetic_cases(num_cases, dim, clusters, rng):
+    """Clustered unit vectors, a rough stand-in for judgment embeddings."""
+    centers = rng.standard_normal((clusters, dim), dtype=np.float32)
+    labels = rng.integers(0, clusters, size=num_cases)
+    return centers[labels] + 0.5 * rng.standard_normal((num_cases, dim), dtype=np.float32)
+
+
+def build_exact(path, vectors):
+    """Bulk-load vectors into a fresh exact index."""
+    index = CaseEmbeddingIndex.create(path, dim=vectors.shape[1], capacity=len(vectors))
+    for start in range(0, len(vectors), 10000):
+        for offset, vector in enumerate(vectors[start:start + 10000]):
+            index.add(f"case-{start + offset}", vector)
+    index.save()
+    return index
+
+
+def percentile_ms(timings, pct):
+    """Percentile of a list of durations in seconds, in milliseconds."""
+    return float(np.percentile(timings, pct)) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--cases', type=int, default=100000)
+    parser.add_argument('--dim', type=int, default=768)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--nlist', type=int, default=None)
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[4, 8, 16, 32, 64])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = synthetic_cases(args.cases, args.dim, max(10, args.cases // 500), rng)
+    queries = vectors[rng.choice(args.cases, size=args.queries)] \
+        + 0.3 * rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+
+    with tempfile.TemporaryDirectory() as path:
+        exact = build_exact(path, vectors)
+        start = time.perf_counter()
+        ivf = IVFCaseIndex.build(exact, nlist=args.nlist)
+        print(f"cases={args.cases} dim={args.dim} nlist={ivf.nlist} "
+              f"build={time.perf_counter() - start:.1f}s")
+
+        truth, timings = [], []
+        for query in queries:
+            start = time.perf_counter()
+            truth.append({case_id for case_id, _ in exact.search(query, k=args.k)})
+            timings.append(time.perf_counter() - start)
+        print(f"{'exact':>10}  recall@{args.k}=1.000  "
+              f"p50={percentile_ms(timings, 50):7.2f}ms  p99={percentile_ms(timings, 99):7.2f}ms")
+
+        for nprobe in args.nprobe:
+            hits, timings = 0, []
+            for query, expected in zip(queries, truth):
+                start = time.perf_counter()
+                found = ivf.search(query, k=args.k, nprobe=nprobe)
+                timings.append(time.perf_counter() - start)
+                hits += len(expected & {case_id for case_id, _ in found})
+            print(f"{'nprobe=' + str(nprobe):>10}  recall@{args.k}={hits / (len(queries) * args.k):.3f}  "
+                  f"p50={percentile_ms(timings, 50):7.2f}ms  p99={percentile_ms(timings, 99):7.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
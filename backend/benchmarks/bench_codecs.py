@@ -0,0 +1,61 @@
+"""
+Benchmark: cache codecs vs. pickle, in bytes stored and encode/decode time.
+
+Usage (from backend/): python -m benchmarks.bench_codecs [--repeat 200]
+"""
+import argparse
+import pickle
+import time
+import numpy as np
+from services import codecs
+
+
+def sample_values():
+    """Representative cached values: a query result dict and embedding arrays."""
+    rng = np.random.default_rng(0)
+    result = {
+        "result": {
+            "langchain_result": "The appellant may seek relief under the statute. " * 80,
+            "web_info": "Snippet from a judgment of the High Court on breach of contract. " * 5,
+            "linked_case": "Civil Appeal No. 1234 of 2019",
+        },
+        "processing_time": 1727913600.123,
+    }
+    return {
+        'query result': result,
+        'embedding (768,)': rng.standard_normal(768).astype(np.float32),
+        'chunk vectors (512, 768)': rng.standard_normal((512, 768)).astype(np.float32),
+    }
+
+
+def time_per_call(func, repeat):
+    """Mean seconds per call."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    compressions = ['none', 'zlib'] + [name for name in ('zstd', 'lz4') if name in codecs._compressors_by_name]
+    print(f"{'value':<26} {'format':<16} {'bytes':>10} {'encode':>10} {'decode':>10}")
+    for label, value in sample_values().items():
+        pickled = pickle.dumps(value)
+        print(f"{label:<26} {'pickle':<16} {len(pickled):>10} "
+              f"{time_per_call(lambda: pickle.dumps(value), args.repeat) * 1e6:>8.1f}us "
+              f"{time_per_call(lambda: pickle.loads(pickled), args.repeat) * 1e6:>8.1f}us")
+        for compression in compressions:
+            codecs.CACHE_COMPRESSION = compression
+            encoded = codecs.encode(value)
+            codec_name = codecs._codecs[encoded[1]].name
+            print(f"{'':<26} {codec_name + '+' + compression:<16} {len(encoded):>10} "
+                  f"{time_per_call(lambda: codecs.encode(value), args.repeat) * 1e6:>8.1f}us "
+                  f"{time_per_call(lambda: codecs.decode(encoded), args.repeat) * 1e6:>8.1f}us")
+
+
+if __name__ == '__main__':
+    main()
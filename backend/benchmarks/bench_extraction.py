@@ -0,0 +1,89 @@
+"""
+Benchmark: PDF text extraction, legacy string concatenation vs. streamed and
+page-parallel extraction, over synthetic 10/100/1000-page PDFs.
+
+Usage (from backend/): python -m benchmarks.bench_extraction [--pages 10 100 1000] [--workers N]
+"""
+import argparse
+import os
+import tempfile
+import time
+from blueprints.nlp.extraction import iter_pdf_pages
+
+LINES_PER_PAGE = 40
+LINE_TEXT = "The appellant contends that the impugned order is contrary to the statute"
+
+
+def write_synthetic_pdf(path, num_pages):
+    """Write a minimal uncompressed PDF with LINES_PER_PAGE lines of Helvetica text per page."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_refs = []
+    for page in range(num_pages):
+        lines = b"".join(b"(%s %d.%d) Tj T* " % (LINE_TEXT.encode(), page, line)
+                         for line in range(LINES_PER_PAGE))
+        stream = b"BT /F1 10 Tf 12 TL 40 800 Td " + lines + b"ET"
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects))
+        page_refs.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(page_refs), num_pages)
+
+    with open(path, 'wb') as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        f.writelines(b"%010d 00000 n \n" % offset for offset in offsets)
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+                % (len(objects) + 1, xref))
+
+
+def legacy_extract(path):
+    """The original parse_document loop: one reader, repeated string concatenation."""
+    from PyPDF2 import PdfReader
+    with open(path, 'rb') as f:
+        reader = PdfReader(f)
+        text = ''
+        for page in reader.pages:
+            text += page.extract_text()
+        return text
+
+
+def timed(func):
+    """Run func once and return (seconds, result)."""
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--pages', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    print(f"{'pages':>6} {'legacy':>10} {'streamed':>10} {'parallel':>10} {'first 5pp':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        for num_pages in args.pages:
+            path = os.path.join(directory, f"synthetic_{num_pages}.pdf")
+            write_synthetic_pdf(path, num_pages)
+
+            legacy_time, legacy_text = timed(lambda: legacy_extract(path))
+            streamed_time, streamed_text = timed(
+                lambda: '\n'.join(iter_pdf_pages(path, parallel_threshold=num_pages + 1)))
+            parallel_time, parallel_text = timed(
+                lambda: '\n'.join(iter_pdf_pages(path, workers=args.workers, parallel_threshold=0)))
+            range_time, _ = timed(lambda: '\n'.join(iter_pdf_pages(path, page_range=(0, 5))))
+
+            assert streamed_text == parallel_text
+            assert len(streamed_text) >= len(legacy_text)
+            print(f"{num_pages:>6} {legacy_time * 1000:>8.0f}ms {streamed_time * 1000:>8.0f}ms "
+                  f"{parallel_time * 1000:>8.0f}ms {range_time * 1000:>8.0f}ms")
+
+
+if __name__ == '__main__':
+    main()
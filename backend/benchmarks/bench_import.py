@@ -0,0 +1,46 @@
+"""
+Benchmark: cold import time of the NLP engine.
+
+Each run imports the module in a fresh interpreter, so nothing is shared
+between runs. Exits non-zero when the median exceeds --max-seconds, which
+makes it usable as a regression guard in CI.
+
+Usage (from backend/): python -m benchmarks.bench_import [--module blueprints.nlp.ai_engine]
+    [--runs 5] [--max-seconds 1.5]
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+IMPORT_SNIPPET = (
+    "import time, sys; start = time.perf_counter(); import {module}; "
+    "sys.stdout.write(str(time.perf_counter() - start))"
+)
+
+
+def time_import(module):
+    """Seconds spent importing a module in a fresh interpreter."""
+    output = subprocess.run([sys.executable, '-c', IMPORT_SNIPPET.format(module=module)],
+                            capture_output=True, text=True, check=True)
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--module', default='blueprints.nlp.ai_engine')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--max-seconds', type=float, default=1.5)
+    args = parser.parse_args()
+
+    timings = [time_import(args.module) for _ in range(args.runs)]
+    median = statistics.median(timings)
+    print(f"import {args.module}: median={median * 1000:.1f}ms "
+          f"min={min(timings) * 1000:.1f}ms max={max(timings) * 1000:.1f}ms")
+    if median > args.max_seconds:
+        print(f"FAIL: median import time exceeds {args.max_seconds:.2f}s", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
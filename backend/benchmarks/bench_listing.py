@@ -0,0 +1,101 @@
+"""
+Benchmark: document listing latency by page depth, keyset cursor vs. OFFSET,
+over a SQLite fixture with one heavy user.
+
+Usage (from backend/): python -m benchmarks.bench_listing [--rows 1000000] [--limit 50]
+"""
+import argparse
+import os
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from flask import Flask
+import blueprints.auth.models  # noqa: F401 -- documents reference the users table
+from blueprints.documents.models import Document, db
+from blueprints.documents.listing import LISTING_COLUMNS, page_query, serialize_row
+
+OWNER_ID = 1
+INSERT_BATCH = 50000
+
+
+def build_fixture(rows):
+    """Insert `rows` documents for OWNER_ID (plus 10% for another user) in bulk."""
+    start = datetime(2020, 1, 1)
+    table = Document.__table__
+    for offset in range(0, int(rows * 1.1), INSERT_BATCH):
+        batch = [{
+            "id": str(uuid.UUID(int=number)),
+            "title": f"Document {number}",
+            "description": "Petition filed before the High Court",
+            "filename": f"document-{number}.pdf",
+            "file_path": f"/uploads/document-{number}.pdf",
+            # A few rows share a timestamp, so the id tie-break matters
+            "upload_date": start + timedelta(seconds=number // 3),
+            "owner_id": OWNER_ID if number < rows else OWNER_ID + 1,
+        } for number in range(offset, min(offset + INSERT_BATCH, int(rows * 1.1)))]
+        db.session.execute(table.insert(), batch)
+    db.session.commit()
+
+
+def offset_page(depth, limit):
+    """The pre-pagination approach, paged with OFFSET for comparison."""
+    return (Document.query.with_entities(*LISTING_COLUMNS)
+            .filter(Document.owner_id == OWNER_ID)
+            .order_by(Document.upload_date.desc(), Document.id.desc())
+            .offset(depth * limit).limit(limit).all())
+
+
+def cursor_at(depth, limit):
+    """Cursor for the page at `depth` (found once with OFFSET, outside the timing)."""
+    if depth == 0:
+        return None
+    # The cursor points at the last row of the previous page
+    previous = (Document.query.with_entities(Document.upload_date, Document.id)
+                .filter(Document.owner_id == OWNER_ID)
+                .order_by(Document.upload_date.desc(), Document.id.desc())
+                .offset(depth * limit - 1).limit(1).one())
+    return previous.upload_date, previous.id
+
+
+def best_of(func, repeat):
+    """Fastest of `repeat` runs, in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(directory, 'bench.db')
+        db.init_app(app)
+        with app.app_context():
+            db.create_all()
+            start = time.perf_counter()
+            build_fixture(args.rows)
+            print(f"fixture: {args.rows} rows in {time.perf_counter() - start:.1f}s")
+
+            pages = args.rows // args.limit
+            depths = sorted({0, 1, 10, 100, 1000, pages // 2, pages - 1} & set(range(pages)))
+            print(f"{'page':>8} {'keyset':>10} {'offset':>10}")
+            for depth in depths:
+                after = cursor_at(depth, args.limit)
+                keyset_ms = best_of(lambda: [serialize_row(row) for row in
+                                             page_query(OWNER_ID, after, args.limit)], args.repeat)
+                offset_ms = best_of(lambda: [serialize_row(row) for row in
+                                             offset_page(depth, args.limit)], args.repeat)
+                print(f"{depth:>8} {keyset_ms:>8.2f}ms {offset_ms:>8.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""
+Load benchmark: drives the app built with create_app (stub models, stub search
+API, SQLite, Redis) over HTTP and runs the Celery tasks eagerly, at a given
+concurrency. Reports p50/p95/p99 latency, throughput, errors and peak RSS per
+scenario as JSON, so runs from different releases can be diffed.
+
+Usage (from backend/):
+    python -m benchmarks.bench_load [--concurrency 8] [--requests 200]
+        [--scenarios query upload list task_query_batch task_document task_document_batch]
+        [--llm-latency-ms 50] [--search-latency-ms 20] [--fake-redis] [--output results.json]
+"""
+import argparse
+import io
+import os
+import threading
+import time
+from benchmarks.harness import (prepare_environment, build_app, install_stub_models, start_search_stub,
+                                auth_headers, serve_app, run_load, run_metadata, write_report,
+                                scratch_directory)
+
+SCENARIOS = ('query', 'upload', 'list', 'task_query_batch', 'task_document', 'task_document_batch')
+
+
+def query_text(index: int, distinct: int) -> str:
+    """The index-th query of a pool of `distinct` queries (repeats hit the cache)."""
+    return f"Is the landlord liable for breach of contract in case {index % distinct}"
+
+
+def pdf_bytes(index: int, distinct: int, pages: int) -> bytes:
+    """A synthetic PDF; `distinct` different files, so duplicates are deduplicated."""
+    from benchmarks.bench_extraction import write_synthetic_pdf
+    with scratch_directory() as directory:
+        path = os.path.join(directory, 'upload.pdf')
+        write_synthetic_pdf(path, pages)
+        with open(path, 'rb') as f:
+            # Bytes after %%EOF are ignored by readers but change the hash
+            return f.read() + b"\n%% bench upload %d\n" % (index % distinct)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help='Calls per scenario')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--distinct-queries', type=int, default=50)
+    parser.add_argument('--distinct-uploads', type=int, default=20)
+    parser.add_argument('--upload-pages', type=int, default=5)
+    parser.add_argument('--listing-rows', type=int, default=10000)
+    parser.add_argument('--batch-size', type=int, default=32, help='Items per batch task')
+    parser.add_argument('--llm-latency-ms', type=float, default=50.0)
+    parser.add_argument('--search-latency-ms', type=float, default=20.0)
+    parser.add_argument('--fake-redis', action='store_true', help='Use fakeredis instead of REDIS_URL')
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    args = parser.parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+
+    search = start_search_stub(args.search_latency_ms / 1000)
+    with scratch_directory() as workdir:
+        prepare_environment(workdir, f"http://127.0.0.1:{search.server_port}/")
+        app = build_app(fake_redis=args.fake_redis)
+        install_stub_models(args.llm_latency_ms / 1000)
+        server, base_url = serve_app(app)
+        headers = auth_headers(app)
+
+        import requests
+        from extensions import db
+        from blueprints.documents.models import Document
+        from services.async_tasks import (process_queries_batch_async, process_document_async,
+                                          process_documents_batch)
+
+        sessions = threading.local()
+
+        def http():
+            if not hasattr(sessions, 'session'):
+                sessions.session = requests.Session()
+                sessions.session.headers.update(headers)
+            return sessions.session
+
+        uploads = [pdf_bytes(i, args.distinct_uploads, args.upload_pages)
+                   for i in range(min(args.distinct_uploads, args.requests))]
+
+        def call_query(index):
+            # Submit, then poll the job until it is answered
+            response = http().post(f"{base_url}/nlp/query", json={'query': query_text(index, args.distinct_queries)})
+            if response.status_code != 202:
+                return response.status_code
+            while True:
+                response = http().get(base_url + response.headers['Location'])
+                if response.status_code != 202:
+                    return response.status_code
+                time.sleep(0.01)
+
+        def call_upload(index):
+            files = {'file': (f"document-{index}.pdf", io.BytesIO(uploads[index % len(uploads)]),
+                              'application/pdf')}
+            return http().post(f"{base_url}/documents/upload", files=files,
+                               data={'title': f"Document {index}", 'owner_id': '1'}).status_code
+
+        def call_list(index):
+            return http().get(f"{base_url}/documents/documents",
+                              params={'owner_id': 1, 'limit': 50}).status_code
+
+        def document_ids():
+            with app.app_context():
+                return [row.id for row in db.session.query(Document.id)
+                        .filter(Document.content_hash.isnot(None)).all()]
+
+        def call_task_query_batch(index):
+            queries = [query_text(index * args.batch_size + i, args.distinct_queries * 4)
+                       for i in range(args.batch_size)]
+            with app.app_context():
+                return process_queries_batch_async.apply(args=[queries]).successful()
+
+        results = []
+        for scenario in args.scenarios:
+            if scenario == 'query':
+                results.append(run_load(scenario, call_query, args.requests, args.concurrency))
+            elif scenario == 'upload':
+                results.append(run_load(scenario, call_upload, args.requests, args.concurrency))
+            elif scenario == 'list':
+                from benchmarks.bench_listing import build_fixture
+                with app.app_context():
+                    build_fixture(args.listing_rows)
+                results.append(run_load(scenario, call_list, args.requests, args.concurrency))
+            elif scenario == 'task_query_batch':
+                results.append(run_load(scenario, call_task_query_batch,
+                                        max(1, args.requests // args.batch_size), args.concurrency))
+            elif scenario == 'task_document':
+                ids = document_ids()
+                if not ids:
+                    results.append({'scenario': scenario, 'skipped': 'run the upload scenario first'})
+                    continue
+
+                def call_task_document(index, ids=ids):
+                    with app.app_context():
+                        return process_document_async.apply(args=[ids[index % len(ids)]]).successful()
+                results.append(run_load(scenario, call_task_document, args.requests, args.concurrency))
+            elif scenario == 'task_document_batch':
+                ids = document_ids()
+                if not ids:
+                    results.append({'scenario': scenario, 'skipped': 'run the upload scenario first'})
+                    continue
+
+                def call_task_document_batch(index, ids=ids):
+                    with app.app_context():
+                        return process_documents_batch.apply(
+                            args=[ids], kwargs={'chunk_size': args.batch_size}).successful()
+                results.append(run_load(scenario, call_task_document_batch, 1, 1))
+
+        server.shutdown()
+    search.shutdown()
+    write_report(output, {'benchmark': 'load', 'meta': run_metadata(args), 'results': results})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Micro-benchmarks of the per-request building blocks: query preprocessing,
+classification, cosine similarity and document parsing (cold and cached).
+Uses the stub models of benchmarks.harness unless --real-models is given, in
+which case spaCy is loaded as in production; the classifier is always real.
+Reports per-call latency percentiles in microseconds as JSON.
+
+Usage (from backend/):
+    python -m benchmarks.bench_micro [--iterations 1000] [--pages 50] [--real-models] [--output micro.json]
+"""
+import argparse
+import os
+import time
+from typing import Any, Callable, Dict
+import numpy as np
+from benchmarks.harness import (install_stub_models, percentile, peak_rss_mb, run_metadata, write_report,
+                                scratch_directory, EMBEDDING_DIM)
+
+QUERY = "Is the landlord liable for breach of contract when the tenant's goods are damaged?"
+
+
+def measure(name: str, call: Callable[[int], Any], iterations: int, warmup: int = 10) -> Dict[str, Any]:
+    """
+    Time `iterations` sequential calls after `warmup` untimed ones.
+    :param name: Benchmark name.
+    :param call: Callable taking the iteration index.
+    :param iterations: Timed calls.
+    :param warmup: Untimed calls first.
+    :return: Latency percentiles and mean in microseconds, and calls per second.
+    """
+    for index in range(warmup):
+        call(index)
+    timings = []
+    for index in range(iterations):
+        start = time.perf_counter()
+        call(index)
+        timings.append((time.perf_counter() - start) * 1e6)
+    total = sum(timings) / 1e6
+    return {
+        'benchmark': name,
+        'iterations': iterations,
+        'p50_us': percentile(timings, 50),
+        'p95_us': percentile(timings, 95),
+        'p99_us': percentile(timings, 99),
+        'mean_us': float(np.mean(timings)),
+        'calls_per_s': iterations / total if total else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=1000)
+    parser.add_argument('--pages', type=int, default=50, help='Pages of the parsed PDF')
+    parser.add_argument('--parse-iterations', type=int, default=20)
+    parser.add_argument('--real-models', action='store_true', help='Load spaCy')
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    args = parser.parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+
+    with scratch_directory() as workdir:
+        os.environ['EXTRACTION_CACHE_DIR'] = os.path.join(workdir, 'extraction_cache')
+        from blueprints.nlp import ai_engine
+        from benchmarks.bench_extraction import write_synthetic_pdf
+
+        if args.real_models:
+            ai_engine.warm_up_models(['spacy'])
+        else:
+            install_stub_models()
+        ai_engine.warm_up_models(['classifier'])
+
+        rng = np.random.default_rng(0)
+        vectors = rng.standard_normal((2, EMBEDDING_DIM)).astype(np.float32)
+        pdf_path = os.path.join(workdir, 'document.pdf')
+        write_synthetic_pdf(pdf_path, args.pages)
+        processed = ai_engine.preprocess_queries([QUERY])[0]
+
+        results = [
+            # A lone caller waits out the micro-batch window
+            measure('preprocess_query', lambda i: ai_engine.preprocess_query(f"{QUERY} {i}"), args.iterations),
+            measure('preprocess_queries_per_item',
+                    lambda i: ai_engine.preprocess_queries([f"{QUERY} {i}"]), args.iterations),
+            measure('classify_query_ml', lambda i: ai_engine.classify_query_ml(processed), args.iterations),
+            measure('classify_queries_batch_64',
+                    lambda i: ai_engine.classify_queries([processed] * 64), args.iterations // 64 or 1),
+            measure('cosine_similarity', lambda i: ai_engine.cosine_similarity(vectors[0], vectors[1]),
+                    args.iterations),
+            # A page range bypasses the extraction cache
+            measure('parse_document_cold',
+                    lambda i: ai_engine.parse_document(pdf_path, (0, args.pages)), args.parse_iterations, warmup=1),
+            measure('parse_document_cached', lambda i: ai_engine.parse_document(pdf_path),
+                    args.parse_iterations, warmup=1),
+        ]
+        for result in results:
+            result['peak_rss_mb'] = peak_rss_mb()
+
+    write_report(output, {'benchmark': 'micro', 'meta': run_metadata(args), 'results': results})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Micro-benchmark: legacy pure-Python cosine loop vs. the vectorized similarity layer.
+
+Usage (from backend/): python -m benchmarks.bench_similarity [--cases 10000] [--dim 768]
+"""
+import argparse
+import time
+import numpy as np
+from blueprints.nlp.similarity import l2_normalize, rank
+
+
+def legacy_cosine_similarity(embedding1, embedding2):
+    """The original list-comprehension implementation from ai_engine."""
+    embedding1_flat = embedding1[0][0]
+    embedding2_flat = embedding2[0][0]
+
+    norm1 = sum([x ** 2 for x in embedding1_flat]) ** 0.5
+    norm2 = sum([y ** 2 for y in embedding2_flat]) ** 0.5
+
+    return sum([x * y for x, y in zip(embedding1_flat, embedding2_flat)]) / (norm1 * norm2)
+
+
+def bench_legacy(query, cases):
+    """Rank every case with the legacy function, one Python call per case."""
+    query_nested = [[query.tolist()]]
+    best, highest = None, 0
+    for i, case in enumerate(cases):
+        similarity = legacy_cosine_similarity(query_nested, [[case]])
+        if similarity > highest:
+            best, highest = i, similarity
+    return best
+
+
+def bench_vectorized(query, case_matrix, k):
+    """Rank every case with one matmul and argpartition top-k."""
+    return rank(query, case_matrix, k=k, normalized=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--cases', type=int, default=10000)
+    parser.add_argument('--dim', type=int, default=768)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    case_matrix = rng.standard_normal((args.cases, args.dim), dtype=np.float32)
+    query = rng.standard_normal(args.dim, dtype=np.float32)
+    case_lists = case_matrix.tolist()
+
+    start = time.perf_counter()
+    legacy_best = bench_legacy(query, case_lists)
+    legacy_time = time.perf_counter() - start
+
+    normalized_matrix = l2_normalize(case_matrix)
+    normalized_query = l2_normalize(query)
+    timings = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        matches = bench_vectorized(normalized_query, normalized_matrix, args.k)
+        timings.append(time.perf_counter() - start)
+    vectorized_time = min(timings)
+
+    assert matches[0][0] == legacy_best, "vectorized ranking disagrees with legacy ranking"
+    print(f"cases={args.cases} dim={args.dim} k={args.k}")
+    print(f"legacy loop:     {legacy_time * 1000:10.2f} ms")
+    print(f"vectorized top-k:{vectorized_time * 1000:10.2f} ms")
+    print(f"speedup:         {legacy_time / vectorized_time:10.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,287 @@
+"""
+Shared pieces of the load and micro-benchmarks: stub models, a local stub of
+the search API, an isolated app built with ``create_app``, a concurrent load
+driver and JSON reporting.
+
+The stubs keep runs reproducible and independent of model downloads and
+external services; they stand in for the models, not for the code around
+them, so caching, batching, the database and Redis are exercised for real.
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import platform
+import resource
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+import numpy as np
+
+# The app's modules import each other from backend/, whatever the working directory
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+STOP_WORDS = frozenset("a an and are as at be by for from has in is it of on or that the to was were "
+                       "will with".split())
+EMBEDDING_DIM = 768
+
+
+class StubToken:
+    """The token attributes preprocessing reads."""
+    __slots__ = ('lemma_', 'is_stop', 'is_punct')
+
+    def __init__(self, text: str):
+        self.lemma_ = text.lower()
+        self.is_stop = self.lemma_ in STOP_WORDS
+        self.is_punct = not any(char.isalnum() for char in text)
+
+
+class StubNLP:
+    """Whitespace tokenizer with the part of the spaCy Language API we use."""
+    pipe_names: List[str] = []
+
+    def pipe(self, texts, batch_size=None, n_process=1, disable=()):
+        for text in texts:
+            yield [StubToken(word) for word in text.split()]
+
+
+def stub_embeddings(texts: List[str]) -> List[np.ndarray]:
+    """Deterministic unit vectors seeded from each text."""
+    vectors = []
+    for text in texts:
+        rng = np.random.default_rng(zlib.crc32(text.encode('utf-8')))
+        vector = rng.standard_normal(EMBEDDING_DIM).astype(np.float32)
+        vectors.append(vector / np.linalg.norm(vector))
+    return vectors
+
+
+def install_stub_models(llm_latency: float = 0.0):
+    """
+    Replace the NLP models with stubs: spaCy, document embeddings and the LLM
+    call (which sleeps `llm_latency` seconds). The query classifier is cheap
+    enough to run for real, from QUERY_CLASSIFIER_PATH or its seed fallback.
+    :param llm_latency: Simulated LLM response time in seconds.
+    """
+    from blueprints.nlp import ai_engine
+
+    ai_engine.models.set('spacy', StubNLP())
+    ai_engine.models.set('case_index', None)
+    ai_engine.embed_documents = stub_embeddings
+
+    def stub_llm(processed_query: str) -> str:
+        time.sleep(llm_latency)
+        return f"Stub legal advice for: {processed_query}"
+
+    ai_engine.run_langchain = stub_llm
+
+
+def start_search_stub(latency: float = 0.0) -> ThreadingHTTPServer:
+    """
+    Serve a Custom Search API lookalike on a free local port.
+    :param latency: Seconds each response is delayed by.
+    :return: The running server; its URL is http://127.0.0.1:<server_port>/.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            body = json.dumps({"items": [{"snippet": "Stub search result about the query."}]}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, name='search-stub', daemon=True).start()
+    return server
+
+
+def prepare_environment(workdir: str, search_url: str):
+    """
+    Point every setting with on-disk or network state at `workdir` and the stubs.
+    Must run before the app (or ai_engine) is imported, since settings are read at import.
+    :param workdir: Scratch directory for the database, uploads and caches.
+    :param search_url: URL of the stub search API.
+    """
+    os.chdir(workdir)
+    os.environ.update({
+        'DATABASE_URL': 'sqlite:///' + os.path.join(workdir, 'bench.db'),
+        'CELERY_BROKER_URL': 'memory://',
+        'CELERY_RESULT_BACKEND': 'cache+memory://',
+        'SEARCH_API_URL': search_url,
+        'GOOGLE_API_KEY': 'bench',
+        'SEARCH_ENGINE_ID': 'bench',
+        'EXTRACTION_CACHE_DIR': os.path.join(workdir, 'extraction_cache'),
+        'CASE_INDEX_PATH': os.path.join(workdir, 'case_index'),
+        # Measure the application, not the limiter rejecting the load generator
+        'RATE_LIMIT_USER_CAPACITY': '1e12',
+        'RATE_LIMIT_IP_CAPACITY': '1e12',
+    })
+
+
+def build_app(fake_redis: bool = False):
+    """
+    Build the app with create_app, create its tables and seed a user.
+    :param fake_redis: Use an in-process fakeredis server instead of REDIS_URL.
+    :return: The Flask app.
+    """
+    from app import create_app
+    from extensions import db, redis_client, celery
+    from blueprints.auth.models import User
+
+    app = create_app()
+    if fake_redis:
+        import fakeredis
+        redis_client._redis_client = fakeredis.FakeRedis()
+    # Eager results are stored so query jobs can be polled as in production
+    celery.conf.update(task_always_eager=True, task_eager_propagates=True, task_store_eager_result=True,
+                       broker_url='memory://', result_backend='cache+memory://')
+    with app.app_context():
+        db.create_all()
+        if db.session.get(User, 1) is None:
+            db.session.add(User(id=1, email='bench@example.com', name='Bench'))
+            db.session.commit()
+    return app
+
+
+def auth_headers(app, user_id: int = 1) -> Dict[str, str]:
+    """
+    Headers that get a request past authentication: a signed session cookie
+    (user and CSRF token), the CSRF header and a JWT for JWT-protected routes.
+    :param app: The Flask app.
+    :param user_id: The user to act as.
+    :return: Header dict.
+    """
+    from flask_jwt_extended import create_access_token
+
+    csrf_token = 'bench-csrf-token'
+    cookie = app.session_interface.get_signing_serializer(app).dumps(
+        {'user_id': user_id, '_csrf_token': csrf_token})
+    with app.app_context():
+        token = create_access_token(identity=str(user_id))
+    return {
+        'Cookie': f"{app.config.get('SESSION_COOKIE_NAME', 'session')}={cookie}",
+        'X-CSRF-TOKEN': csrf_token,
+        'Authorization': f"Bearer {token}",
+    }
+
+
+def serve_app(app):
+    """
+    Run the app on a threaded local WSGI server.
+    :param app: The Flask app.
+    :return: (server, base URL).
+    """
+    from werkzeug.serving import make_server
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='bench-app', daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far, in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / 1024 if sys.platform != 'darwin' else peak / (1024 * 1024)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of values."""
+    if not values:
+        return 0.0
+    return float(np.percentile(np.asarray(values), pct, method='nearest'))
+
+
+def run_load(name: str, call: Callable[[int], Any], total: int, concurrency: int) -> Dict[str, Any]:
+    """
+    Make `total` calls from `concurrency` threads and summarize them.
+    A call fails if it raises or returns False or an HTTP status of 400 or more.
+    :param name: Scenario name.
+    :param call: Callable taking the call index.
+    :param total: Number of calls.
+    :param concurrency: Number of concurrent callers.
+    :return: Latency percentiles (ms), throughput, error count and peak RSS.
+    """
+    latencies: List[float] = [0.0] * total
+    outcomes: Dict[str, int] = {}
+    lock = threading.Lock()
+
+    def timed(index: int):
+        start = time.perf_counter()
+        try:
+            result = call(index)
+            outcome = str(result) if isinstance(result, int) and not isinstance(result, bool) \
+                else ('ok' if result is not False else 'failed')
+        except Exception as err:
+            outcome = type(err).__name__
+        latencies[index] = time.perf_counter() - start
+        with lock:
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(timed, range(total)))
+    elapsed = time.perf_counter() - start
+
+    errors = sum(count for outcome, count in outcomes.items()
+                 if outcome not in ('ok',) and not (outcome.isdigit() and int(outcome) < 400))
+    latencies_ms = [latency * 1000 for latency in latencies]
+    return {
+        'scenario': name,
+        'requests': total,
+        'concurrency': concurrency,
+        'errors': errors,
+        'outcomes': outcomes,
+        'throughput_per_s': total / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies_ms, 50),
+        'p95_ms': percentile(latencies_ms, 95),
+        'p99_ms': percentile(latencies_ms, 99),
+        'mean_ms': float(np.mean(latencies_ms)) if latencies_ms else 0.0,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def run_metadata(args) -> Dict[str, Any]:
+    """Where and how a run was made, so results can be compared across releases."""
+    try:
+        revision = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                  check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'git_revision': revision,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'arguments': vars(args),
+    }
+
+
+def write_report(path: Optional[str], report: Dict[str, Any]):
+    """
+    Write the report as JSON (to stdout when no path is given).
+    :param path: Output file, or None.
+    :param report: Report to write.
+    """
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if path:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+def scratch_directory() -> tempfile.TemporaryDirectory:
+    """Temporary working directory for one run."""
+    return tempfile.TemporaryDirectory(prefix='legal-bench-')
@@ -1,9 +1,7 @@
 """User models."""
 from datetime import datetime
-from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash, check_password_hash
-
-db = SQLAlchemy()
+from extensions import db
 
 class User(db.Model):
     """
@@ -4,12 +4,13 @@ from flask import Blueprint, redirect, url_for, session, request, jsonify
 from flask import current_app as app
 from oauthlib.oauth2 import WebApplicationClient
 import requests
+from config import Config
 from blueprints.auth.models import User, db
 
 auth_bp = Blueprint('auth_bp', __name__)
 
 # Initialize the OAuth2 client
-client = WebApplicationClient(app.config['GOOGLE_CLIENT_ID'])
+client = WebApplicationClient(Config.GOOGLE_CLIENT_ID)
 
 @auth_bp.route('/login')
 def login():
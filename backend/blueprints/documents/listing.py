@@ -0,0 +1,94 @@
+"""Keyset-paginated, column-projected document listing."""
+import json
+import base64
+import binascii
+from datetime import datetime
+from typing import Any, Dict, Iterator, Optional, Tuple
+from sqlalchemy import tuple_
+from blueprints.documents.models import Document
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Only the columns the listing returns are loaded
+LISTING_COLUMNS = (Document.id, Document.title, Document.description,
+                   Document.filename, Document.upload_date)
+
+Cursor = Tuple[datetime, str]
+
+
+def encode_cursor(upload_date: datetime, document_id: str) -> str:
+    """
+    Opaque cursor pointing just after a document in listing order.
+    :param upload_date: Upload date of the last document on the page.
+    :param document_id: ID of the last document on the page.
+    :return: URL-safe cursor string.
+    """
+    raw = json.dumps([upload_date.isoformat(), document_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Cursor:
+    """
+    Parse a cursor produced by encode_cursor.
+    :param cursor: Cursor string from a previous page.
+    :return: (upload_date, document_id) of the last document already returned.
+    :raises ValueError: If the cursor is malformed.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        upload_date, document_id = json.loads(raw)
+        return datetime.fromisoformat(upload_date), str(document_id)
+    except (binascii.Error, TypeError, ValueError) as err:
+        raise ValueError("Invalid cursor") from err
+
+
+def page_query(owner_id, after: Optional[Cursor] = None, limit: int = DEFAULT_PAGE_SIZE):
+    """
+    Query for one page of a user's documents, newest first.
+    The (upload_date, id) row comparison lets the database seek straight to the
+    cursor through the (owner_id, upload_date, id) index, so every page costs
+    the same however deep it is, unlike OFFSET.
+    :param owner_id: Owner of the documents.
+    :param after: Cursor of the last document already returned, if any.
+    :param limit: Number of rows to fetch.
+    :return: SQLAlchemy query yielding LISTING_COLUMNS rows.
+    """
+    query = Document.query.with_entities(*LISTING_COLUMNS).filter(Document.owner_id == owner_id)
+    if after is not None:
+        query = query.filter(tuple_(Document.upload_date, Document.id) < tuple_(*after))
+    return query.order_by(Document.upload_date.desc(), Document.id.desc()).limit(limit)
+
+
+def serialize_row(row) -> Dict[str, Any]:
+    """Listing entry for a projected document row."""
+    return {
+        "id": row.id,
+        "title": row.title,
+        "description": row.description,
+        "filename": row.filename,
+        "upload_date": row.upload_date.isoformat(),
+        "file_url": Document.download_url(row.id),
+    }
+
+
+def iter_page_json(owner_id, after: Optional[Cursor] = None,
+                   limit: int = DEFAULT_PAGE_SIZE) -> Iterator[str]:
+    """
+    Stream one page of the listing as a JSON object, document by document:
+    {"documents": [...], "next_cursor": "..." or null}.
+    :param owner_id: Owner of the documents.
+    :param after: Cursor of the last document already returned, if any.
+    :param limit: Page size.
+    :return: Iterator of JSON text fragments.
+    """
+    yield '{"documents":['
+    count, last, next_cursor = 0, None, None
+    # One extra row tells whether there is a next page without a COUNT query
+    for row in page_query(owner_id, after, limit + 1):
+        if count == limit:
+            next_cursor = encode_cursor(last.upload_date, last.id)
+            break
+        yield (',' if count else '') + json.dumps(serialize_row(row))
+        count, last = count + 1, row
+    yield '],"next_cursor":' + json.dumps(next_cursor) + '}'
@@ -1,25 +1,42 @@
 """Define the Document model."""
 from datetime import datetime
 import uuid
-import os
-from flask_sqlalchemy import SQLAlchemy
+from typing import Optional
+from urllib.parse import quote
+import numpy as np
+from extensions import db
+from services.file_store import file_store
 
-db = SQLAlchemy()
+# Path of documents_bp.download_document: the blueprint is mounted at /documents
+# and the route is /documents/<doc_id>/download. Built by hand rather than with
+# url_for so listings can be serialized without a request context, and without
+# a URL map lookup per row.
+DOWNLOAD_PATH = '/documents/documents/{doc_id}/download'
 
 class Document(db.Model):
     """
     Document model for storing document information.
     """
     __tablename__ = 'documents'
+    __table_args__ = (
+        # Serves the keyset-paginated listing: owner filter plus (upload_date, id) order
+        db.Index('ix_documents_owner_upload_date', 'owner_id', 'upload_date', 'id'),
+    )
 
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     title = db.Column(db.String(150), nullable=False)
     description = db.Column(db.Text, nullable=True)
     filename = db.Column(db.String(200), nullable=False)
     upload_date = db.Column(db.DateTime, default=datetime.utcnow)
+    # Relative to the file store root; identical uploads share one stored file
     file_path = db.Column(db.String(200), nullable=False)
+    # SHA-256 of the file bytes; identical uploads share one stored file
+    content_hash = db.Column(db.String(64), nullable=True, index=True)
+    size = db.Column(db.BigInteger, nullable=True)
     owner_id = db.Column(db.Integer,
                          db.ForeignKey('users.id'), nullable=False)
+    analyses = db.relationship('DocumentAnalysis', backref='document', lazy='dynamic',
+                               cascade='all, delete-orphan', passive_deletes=True)
 
     def __repr__(self):
         return f'<Document {self.title} - {self.filename}>'
@@ -27,13 +44,61 @@ class Document(db.Model):
     @property
     def file_url(self):
         """Generate the file URL for serving the document."""
-        return os.path.join('/uploads/', self.filename)
+        return self.download_url(self.id)
 
-    def save_file(self, file):
-        """Save the file to the filesystem."""
-        file.save(self.file_path)
+    @staticmethod
+    def download_url(document_id):
+        """Download URL of a document, without loading it."""
+        return DOWNLOAD_PATH.format(doc_id=quote(str(document_id)))
 
-    def delete_file(self):
-        """Delete the file from the filesystem."""
-        if os.path.exists(self.file_path):
-            os.remove(self.file_path)
+    @property
+    def stored_path(self):
+        """Absolute path of the document's file in the store."""
+        return file_store.resolve(self.file_path)
+
+
+class DocumentAnalysis(db.Model):
+    """
+    NLP analysis of a document, computed once per model version.
+    Looked up by (document_id, model_version), or by (text_hash, model_version)
+    so identical files uploaded as separate documents reuse one analysis.
+    """
+    __tablename__ = 'document_analyses'
+    __table_args__ = (
+        db.UniqueConstraint('document_id', 'model_version', name='uq_document_analyses_document_version'),
+        db.Index('ix_document_analyses_text_hash_version', 'text_hash', 'model_version'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    document_id = db.Column(db.String(36), db.ForeignKey('documents.id', ondelete='CASCADE'),
+                            nullable=False)
+    model_version = db.Column(db.String(128), nullable=False)
+    text_hash = db.Column(db.String(64), nullable=False)
+    # Document vector as raw float32 bytes
+    embedding = db.Column(db.LargeBinary, nullable=True)
+    classification = db.Column(db.String(64), nullable=True)
+    # Best matching cases, as [case_id, similarity] pairs in descending order
+    linked_cases = db.Column(db.JSON, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<DocumentAnalysis {self.document_id} - {self.model_version}>'
+
+    @staticmethod
+    def encode_embedding(vector) -> Optional[bytes]:
+        """Serialize a document vector for the embedding column."""
+        if vector is None:
+            return None
+        return np.asarray(vector, dtype=np.float32).tobytes()
+
+    @property
+    def embedding_vector(self) -> Optional[np.ndarray]:
+        """The stored document vector."""
+        if self.embedding is None:
+            return None
+        return np.frombuffer(self.embedding, dtype=np.float32)
+
+    @property
+    def linked_case(self) -> Optional[str]:
+        """The best matching case, if any."""
+        return self.linked_cases[0][0] if self.linked_cases else None
@@ -1,15 +1,18 @@
 """Routes for the documents blueprint."""
 import os
-from flask import Blueprint, request, jsonify, send_from_directory, abort, current_app as app
+import mimetypes
+from flask import (Blueprint, Response, request, jsonify, send_file, abort,
+                   stream_with_context, current_app as app)
 from werkzeug.utils import secure_filename
 from blueprints.documents.models import Document, db
+from blueprints.documents.listing import (iter_page_json, decode_cursor,
+                                          DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
 from blueprints.auth.models import User  # Assuming the User model is available
+from services.file_store import file_store, UploadTooLarge
 
 documents_bp = Blueprint('documents_bp', __name__)
 
-# Ensure this directory exists
-UPLOAD_FOLDER = os.path.join(os.getcwd(), 'uploads')
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+ALLOWED_EXTENSIONS = ('.pdf', '.docx')
 
 @documents_bp.route('/upload', methods=['POST'])
 def upload_document():
@@ -29,21 +32,34 @@ def upload_document():
         return jsonify({"error": "No selected file"}), 400
 
     filename = secure_filename(file.filename)
-    file_path = os.path.join(UPLOAD_FOLDER, filename)
-
-    document = Document(
-        title=title,
-        description=description,
-        filename=filename,
-        file_path=file_path,
-        owner_id=owner_id
-    )
-    document.save_file(file)
-
-    db.session.add(document)
-    db.session.commit()
-
-    return jsonify({"message": "File uploaded successfully", "document_id": document.id}), 201
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in ALLOWED_EXTENSIONS:
+        return jsonify({"error": "Only PDF and DOCX files are supported"}), 400
+
+    # Spooled into the store and hashed while the body was parsed (UploadRequest);
+    # saving renames it into place, and identical bytes are stored once.
+    # The row is committed under the file's lock, so a concurrent delete of
+    # another document with the same bytes sees it and keeps the file.
+    try:
+        with file_store.save(file.stream, suffix=extension,
+                             max_bytes=app.config.get('MAX_CONTENT_LENGTH')) as stored:
+            document = Document(
+                title=title,
+                description=description,
+                filename=filename,
+                file_path=stored.path,
+                content_hash=stored.digest,
+                size=stored.size,
+                owner_id=owner_id
+            )
+
+            db.session.add(document)
+            db.session.commit()
+    except UploadTooLarge:
+        return jsonify({"error": "File is too large"}), 413
+
+    return jsonify({"message": "File uploaded successfully", "document_id": document.id,
+                    "sha256": stored.digest, "deduplicated": stored.deduplicated}), 201
 
 @documents_bp.route('/documents/<doc_id>', methods=['GET'])
 def get_document(doc_id):
@@ -66,7 +82,40 @@ def download_document(doc_id):
     Route to download the document file.
     """
     document = Document.query.get_or_404(doc_id)
-    return send_from_directory(UPLOAD_FOLDER, document.filename, as_attachment=True)
+
+    accel_prefix = app.config.get('DOWNLOAD_ACCEL_REDIRECT_PREFIX')
+    if accel_prefix:
+        return accel_redirect_response(document, accel_prefix)
+
+    # Conditional (ETag/Last-Modified -> 304) and Range (206) handling come from
+    # Werkzeug; the body is streamed through wsgi.file_wrapper (sendfile) when
+    # the server provides one. Stored files never change, so the content hash
+    # is a strong ETag.
+    response = send_file(document.stored_path, download_name=document.filename, as_attachment=True,
+                         conditional=True, etag=document.content_hash or True,
+                         last_modified=document.upload_date)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+def accel_redirect_response(document, prefix):
+    """
+    Hand the download to a fronting nginx, which then serves the bytes itself,
+    including Range and conditional requests.
+    :param document: The document to serve.
+    :param prefix: Internal nginx location that maps onto the file store root.
+    :return: Empty response carrying the X-Accel-Redirect header.
+    """
+    relative_path = os.path.relpath(document.stored_path, file_store.root)
+    if relative_path.startswith('..'):
+        abort(404)
+    response = Response(status=200)
+    response.headers['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + relative_path.replace(os.sep, '/')
+    response.headers['Content-Disposition'] = f'attachment; filename="{document.filename}"'
+    response.headers['Content-Type'] = mimetypes.guess_type(document.filename)[0] or 'application/octet-stream'
+    if document.content_hash:
+        response.set_etag(document.content_hash)
+    return response
 
 @documents_bp.route('/documents/<doc_id>', methods=['DELETE'])
 def delete_document(doc_id):
@@ -74,31 +123,40 @@ def delete_document(doc_id):
     Route to delete a document.
     """
     document = Document.query.get_or_404(doc_id)
+    file_path = document.file_path
 
     # Remove from the database
     db.session.delete(document)
     db.session.commit()
 
-    # Remove the file from the filesystem
-    document.delete_file()
+    # Remove the file from the filesystem, unless another document has the same bytes;
+    # the store re-checks under the file's lock, which uploads hold while committing
+    file_store.release(file_path, lambda: Document.query.with_entities(Document.id)
+                       .filter(Document.file_path == file_path).first() is not None)
 
     return jsonify({"message": "Document deleted successfully"}), 200
 
 @documents_bp.route('/documents', methods=['GET'])
 def list_documents():
     """
-    Route to list all documents for a user.
+    Route to list a user's documents, newest first, one page at a time.
+    Pass the returned `next_cursor` as `cursor` to get the next page.
     """
     owner_id = request.args.get('owner_id')
     if not owner_id:
         return jsonify({"error": "Owner ID is required"}), 400
 
-    documents = Document.query.filter_by(owner_id=owner_id).all()
-    return jsonify([{
-        "id": doc.id,
-        "title": doc.title,
-        "description": doc.description,
-        "filename": doc.filename,
-        "upload_date": doc.upload_date.isoformat(),
-        "file_url": doc.file_url
-    } for doc in documents])
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    if limit < 1:
+        return jsonify({"error": "Limit must be positive"}), 400
+    limit = min(limit, MAX_PAGE_SIZE)
+
+    after = None
+    if request.args.get('cursor'):
+        try:
+            after = decode_cursor(request.args['cursor'])
+        except ValueError:
+            return jsonify({"error": "Invalid cursor"}), 400
+
+    return Response(stream_with_context(iter_page_json(owner_id, after, limit)),
+                    mimetype='application/json')
@@ -1,22 +1,30 @@
 import time
 import os
+import math
 import logging
 import re
 import json
-from functools import lru_cache
-from typing import Dict, Any, Optional
-import spacy
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as StageTimeoutError
+from typing import Dict, Any, Optional, Iterable, List, Tuple, Callable
+import numpy as np
 import requests
+from flask import current_app, has_app_context
 from cachetools import TTLCache
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.svm import SVC
-from sklearn.pipeline import Pipeline
-from transformers import pipeline, AutoModelForSequenceClassification, AutoTokenizer
-from PyPDF2 import PdfReader
-from docx import Document
-from langchain.llm import LLMChain
-from langchain.prompts import PromptTemplate
 from dotenv import load_dotenv
+from blueprints.nlp.ann_index import open_case_index, DEFAULT_NPROBE
+from blueprints.nlp.similarity import pool_embeddings, pool_batch, cosine_scores, rank
+from blueprints.nlp.model_registry import ModelRegistry
+from blueprints.nlp.batching import MicroBatcher
+from blueprints.nlp.extraction import iter_document_pages, PageRange
+from blueprints.nlp.query_classifier import QueryClassifier, train_query_classifier, SEED_EXAMPLES
+from blueprints.nlp.chunking import DocumentEmbedding, embed_document_stream, iter_segments
+from services.extraction_cache import ExtractionCache, file_digest
+from services.caching import TieredCache, normalize_query
+from services.context_store import QueryContextStore
+from services.http_client import get_session
+from services.concurrency import SingleFlight, WorkCounter
+from services.metrics import span, Counter, Collected
 
 # Load environment variables from .env file
 load_dotenv()
@@ -24,68 +32,276 @@ load_dotenv()
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Load spaCy's English NLP model
-nlp = spacy.load('en_core_web_sm')
-
-# In-memory cache to store recent queries and their results
-cache = TTLCache(maxsize=100, ttl=300)
+# Bump MODEL_VERSION when a model change should invalidate cached answers.
+MODEL_VERSION = os.getenv('MODEL_VERSION', '1')
+
+# Session-like structure for retaining query context, bounded per user
+query_contexts = QueryContextStore(
+    max_turns=int(os.getenv('QUERY_CONTEXT_MAX_TURNS', '10')),
+    max_tokens=int(os.getenv('QUERY_CONTEXT_MAX_TOKENS', '512')),
+    idle_ttl=int(os.getenv('QUERY_CONTEXT_IDLE_TTL', '1800')),
+    max_users=int(os.getenv('QUERY_CONTEXT_MAX_USERS', '10000')),
+    use_redis=os.getenv('QUERY_CONTEXT_REDIS', 'False').lower() == 'true')
+
+# Token pooling used to turn BERT outputs into document vectors ('mean' or 'cls')
+EMBEDDING_POOLING = os.getenv('EMBEDDING_POOLING', 'mean')
+
+# Precomputed case embeddings, built offline with `python -m blueprints.nlp.case_index`
+CASE_INDEX_PATH = os.getenv('CASE_INDEX_PATH', os.path.join(os.getcwd(), 'data', 'case_index'))
+# 'exact' scans every case; 'ivf' scans CASE_INDEX_NPROBE inverted lists
+# (build with `python -m blueprints.nlp.ann_index`)
+CASE_INDEX_BACKEND = os.getenv('CASE_INDEX_BACKEND', 'exact')
+CASE_INDEX_NPROBE = int(os.getenv('CASE_INDEX_NPROBE', str(DEFAULT_NPROBE)))
+# Directory of the query classifier built by blueprints/nlp/query_classifier.py
+QUERY_CLASSIFIER_PATH = os.getenv('QUERY_CLASSIFIER_PATH', os.path.join(os.getcwd(), 'data', 'query_classifier'))
+
+# spaCy batching: bulk jobs may raise PREPROCESS_N_PROCESS (not inside a Celery
+# prefork pool, whose daemonic workers cannot start child processes)
+PREPROCESS_BATCH_SIZE = int(os.getenv('PREPROCESS_BATCH_SIZE', '256'))
+PREPROCESS_N_PROCESS = int(os.getenv('PREPROCESS_N_PROCESS', '1'))
+# Request-path micro-batching window for concurrent preprocess_query calls
+PREPROCESS_MAX_BATCH = int(os.getenv('PREPROCESS_MAX_BATCH', '32'))
+PREPROCESS_MAX_WAIT = float(os.getenv('PREPROCESS_MAX_WAIT_MS', '2')) / 1000
+
+# Embedding micro-batching: token windows from concurrent callers share one padded forward pass
+EMBED_MAX_BATCH = int(os.getenv('EMBED_MAX_BATCH', '16'))
+EMBED_MAX_WAIT = float(os.getenv('EMBED_MAX_WAIT_MS', '5')) / 1000
+EMBED_MAX_LENGTH = 512
+# Long documents are embedded in overlapping windows of EMBED_MAX_LENGTH tokens
+CHUNK_OVERLAP = int(os.getenv('CHUNK_OVERLAP', '64'))
+# Batches of documents are sized up from at most this many leading characters;
+# longer texts take the windowed path without being tokenized up front
+EMBED_SHORT_CHARS = int(os.getenv('EMBED_SHORT_CHARS', str(EMBED_MAX_LENGTH * 10)))
+
+# Custom Search results, cached per normalized query
+SEARCH_API_URL = os.getenv('SEARCH_API_URL', 'https://www.googleapis.com/customsearch/v1')
+# Seconds to connect to and to wait for each read from the search API, per
+# attempt; with the session's two retries a search gives up within its stage deadline
+SEARCH_TIMEOUT = float(os.getenv('SEARCH_TIMEOUT', '3'))
+web_search_cache = TTLCache(maxsize=int(os.getenv('WEB_SEARCH_CACHE_SIZE', '1024')),
+                            ttl=int(os.getenv('WEB_SEARCH_CACHE_TTL', '3600')))
+web_search_cache_lock = threading.Lock()
+web_search_flight = SingleFlight()
+
+# Web search, document linking and the LLM call are independent of each other and,
+# in concurrent mode, run in parallel on a bounded pool with a deadline each,
+# counted from when the stage starts running
+QUERY_CONCURRENT_STAGES = os.getenv('QUERY_CONCURRENT_STAGES', 'True').lower() == 'true'
+QUERY_STAGE_WORKERS = int(os.getenv('QUERY_STAGE_WORKERS', '8'))
+STAGE_DEADLINES = {
+    'web_search': float(os.getenv('STAGE_DEADLINE_WEB_SEARCH', '10')),
+    'document': float(os.getenv('STAGE_DEADLINE_DOCUMENT', '30')),
+    'llm': float(os.getenv('STAGE_DEADLINE_LLM', '60')),
+}
+# Longest a stage may wait for a free stage worker before it is dropped
+STAGE_QUEUE_TIMEOUT = float(os.getenv('STAGE_QUEUE_TIMEOUT', '5'))
+stage_executor = ThreadPoolExecutor(max_workers=QUERY_STAGE_WORKERS, thread_name_prefix='query-stage')
+# Query stages waiting for, and running on, a stage worker
+stage_work = WorkCounter()
+STAGE_TIMEOUTS = Counter('legal_stage_timeouts_total', 'Query stages that missed their deadline.', ['stage'])
+STAGE_SATURATED = Counter('legal_stage_saturated_total',
+                          'Query stages dropped because no stage worker was free in time.', ['stage'])
+
+# Query results: per-process L1 in front of Redis, shared by every worker.
+# A miss is computed by one process while the others wait, so the lock has to
+# outlive the longest a query's stages can take: queueing plus the slowest deadline.
+QUERY_CACHE_LOCK_TTL = (STAGE_QUEUE_TIMEOUT + max(STAGE_DEADLINES.values())
+                        + float(os.getenv('QUERY_CACHE_LOCK_MARGIN', '15')))
+query_cache = TieredCache('nlp:query', MODEL_VERSION,
+                          l1_maxsize=int(os.getenv('QUERY_CACHE_L1_SIZE', '1024')),
+                          l1_ttl=int(os.getenv('QUERY_CACHE_L1_TTL', '60')),
+                          l2_ttl=int(os.getenv('QUERY_CACHE_TTL', '600')),
+                          lock_ttl=math.ceil(QUERY_CACHE_LOCK_TTL), lock_wait=QUERY_CACHE_LOCK_TTL)
+
+# Extracted text and embeddings of uploaded files, keyed by a hash of their bytes
+extraction_cache = ExtractionCache(
+    os.getenv('EXTRACTION_CACHE_DIR', os.path.join(os.getcwd(), 'data', 'extraction_cache')),
+    max_bytes=int(os.getenv('EXTRACTION_CACHE_MAX_BYTES', str(1024 ** 3))),
+    use_redis=os.getenv('EXTRACTION_CACHE_REDIS', 'False').lower() == 'true')
+
+# Cases stored per document analysis
+DOCUMENT_LINKED_CASES = int(os.getenv('DOCUMENT_LINKED_CASES', '5'))
+# Documents are classified from passages of their opening text: spaCy rejects
+# texts over its max_length, and the classifier is trained on query-sized texts
+DOCUMENT_CLASSIFY_CHARS = int(os.getenv('DOCUMENT_CLASSIFY_CHARS', '100000'))
+DOCUMENT_PASSAGE_CHARS = int(os.getenv('DOCUMENT_PASSAGE_CHARS', '2000'))
+
+# Pipeline components preprocessing never reads (it only needs lemmas and stop/punct flags)
+UNUSED_SPACY_COMPONENTS = ('parser', 'ner')
+
+# Models are built on first use, not at import. Heavy libraries (spaCy,
+# transformers, scikit-learn) are imported inside the loaders for the same reason.
+models = ModelRegistry()
+
+def load_spacy():
+    """
+    Load spaCy's English NLP model.
+    """
+    import spacy
+    return spacy.load('en_core_web_sm')
 
-# Session-like structure for retaining query context
-query_sessions = {}
+def load_tokenizer():
+    """
+    Load the BERT tokenizer.
+    """
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained('bert-base-uncased')
 
-# Advanced ML model setup for classification with a pipeline
-classifier = Pipeline([
-    ('vectorizer', TfidfVectorizer()),
-    ('svc', SVC(probability=True))
-])
+def load_semantic_model():
+    """
+    Load the BERT model used for semantic search.
+    """
+    from transformers import AutoModelForSequenceClassification
+    return AutoModelForSequenceClassification.from_pretrained('bert-base-uncased')
 
-# Setup the Hugging Face pipeline for semantic search
-tokenizer = AutoTokenizer.from_pretrained('bert-base-uncased')
-semantic_model = AutoModelForSequenceClassification.from_pretrained('bert-base-uncased')
-semantic_search = pipeline('feature-extraction', model=semantic_model, tokenizer=tokenizer)
+def load_classifier():
+    """
+    Load the query classifier trained offline with
+    `python -m blueprints.nlp.query_classifier`. Without one, fit a stand-in on
+    a few seed examples so classification still works in development.
+    """
+    try:
+        classifier = QueryClassifier.open(QUERY_CLASSIFIER_PATH)
+        logging.info("Loaded query classifier with labels %s from %s",
+                     classifier.labels, QUERY_CLASSIFIER_PATH)
+        return classifier
+    except FileNotFoundError:
+        logging.warning("No query classifier found at %s; using one fitted on seed examples.",
+                        QUERY_CLASSIFIER_PATH)
+        texts, labels = zip(*SEED_EXAMPLES)
+        return train_query_classifier(texts, labels)
+
+def load_case_index():
+    """
+    Load the memory-mapped case embedding index, if one has been built.
+    """
+    options = {'nprobe': CASE_INDEX_NPROBE} if CASE_INDEX_BACKEND == 'ivf' else {}
+    try:
+        index = open_case_index(CASE_INDEX_PATH, backend=CASE_INDEX_BACKEND, **options)
+        logging.info("Loaded %s case index with %d cases from %s",
+                     CASE_INDEX_BACKEND, len(index), CASE_INDEX_PATH)
+        return index
+    except FileNotFoundError:
+        logging.warning("No case index found at %s; case linking is disabled.", CASE_INDEX_PATH)
+        return None
 
-# Function to train the model (example)
-def train_classifier():
-    # Placeholder training data (should be replaced with real data)
-    training_data = ["breach of contract", "legal precedent", "statute"]
-    labels = ["contract", "case_law", "statute"]
+models.register('spacy', load_spacy)
+models.register('tokenizer', load_tokenizer)
+models.register('semantic_model', load_semantic_model)
+models.register('classifier', load_classifier)
+models.register('case_index', load_case_index)
 
-    X = classifier.named_steps['vectorizer'].fit_transform(training_data)
-    classifier.fit(X, labels)
+def current_case_index():
+    """
+    The loaded case index, reloaded first if it was rebuilt on disk.
+    """
+    case_index = models.get('case_index')
+    if case_index is not None:
+        case_index = case_index.refresh()
+        models.set('case_index', case_index)
+    return case_index
 
-# Call the training function (in practice, this would be done offline)
-train_classifier()
+def warm_up_models(names: Optional[Iterable[str]] = None):
+    """
+    Load models before serving. Call from the parent process of a pre-fork
+    server so that workers share the loaded models copy-on-write.
+    """
+    models.warm_up(names)
 
-def preprocess_query(query: str) -> str:
+def preprocess_queries(queries: List[str], batch_size: int = PREPROCESS_BATCH_SIZE,
+                       n_process: int = PREPROCESS_N_PROCESS) -> List[str]:
     """
-    Preprocess the query to improve the results from the LLaMA model.
+    Preprocess a batch of queries with a single spaCy `nlp.pipe` pass.
     - Tokenize
     - Remove stopwords and punctuation
     - Lemmatize the tokens
-    - Named Entity Recognition (NER) to emphasize legal terms
+    The parser and NER components are disabled since only lemmas and
+    stop/punct flags are used.
     """
-    doc = nlp(query)
+    nlp = models.get('spacy')
+    disable = [name for name in UNUSED_SPACY_COMPONENTS if name in nlp.pipe_names]
+
+    processed_queries = []
+    for doc in nlp.pipe(queries, batch_size=batch_size, n_process=n_process, disable=disable):
+        processed_queries.append(' '.join(
+            token.lemma_.lower() for token in doc if not token.is_stop and not token.is_punct
+        ))
+    return processed_queries
 
-    processed_tokens = [
-        token.lemma_.lower() for token in doc if not token.is_stop and not token.is_punct
-    ]
+# Concurrent request threads share one nlp.pipe call per window
+preprocess_batcher = MicroBatcher(lambda queries: preprocess_queries(queries, n_process=1),
+                                  max_batch_size=PREPROCESS_MAX_BATCH,
+                                  max_wait=PREPROCESS_MAX_WAIT, name='preprocess-batcher')
 
-    processed_query = ' '.join(processed_tokens)
+def preprocess_query(query: str) -> str:
+    """
+    Preprocess the query to improve the results from the LLaMA model.
+    Requests arriving together are preprocessed in one micro-batch.
+    """
+    processed_query = preprocess_batcher(query)
     logging.debug("Preprocessed query: %s", processed_query)
     return processed_query
 
+def classify_queries(queries: List[str]) -> List[str]:
+    """
+    Classify a batch of preprocessed queries in one vectorize-and-predict pass.
+    """
+    if not queries:
+        return []
+    return models.get('classifier').predict(queries)
+
+def classify_document(text: str) -> Optional[str]:
+    """
+    Classify a document from the passages of its first DOCUMENT_CLASSIFY_CHARS
+    characters, preprocessed in one spaCy pass. The label is the one with the
+    highest total score over the passages, so no single call sees the whole
+    document.
+    :param text: Extracted document text.
+    :return: Label, or None for a document without text.
+    """
+    passages = [passage for passage in iter_segments(text[:DOCUMENT_CLASSIFY_CHARS], DOCUMENT_PASSAGE_CHARS)
+                if passage.strip()]
+    if not passages:
+        return None
+    classifier = models.get('classifier')
+    scores = classifier.decision_function(preprocess_queries(passages))
+    return classifier.labels[int(np.argmax(scores.sum(axis=0)))]
+
 def classify_query_ml(query: str) -> str:
     """
     Classify the query using a machine learning model.
     """
-    X_query = classifier.named_steps['vectorizer'].transform([query])
-    classification = classifier.predict(X_query)
-    logging.debug("Query classification: %s", classification[0])
-    return classification[0]
+    classification = classify_queries([query])[0]
+    logging.debug("Query classification: %s", classification)
+    return classification
+
+def _fetch_web_search(query: str, api_key: str, search_engine_id: str) -> Tuple[str, bool]:
+    """
+    Call the Custom Search API over the shared session.
+    Returns the snippet and whether it is a real answer worth caching.
+    """
+    try:
+        response = get_session().get(
+            SEARCH_API_URL, params={'q': query, 'key': api_key, 'cx': search_engine_id},
+            timeout=SEARCH_TIMEOUT)
+        response.raise_for_status()
+        search_results = response.json()
+
+        # Extract relevant content (e.g., the first result's snippet)
+        if 'items' in search_results:
+            return search_results['items'][0]['snippet'], True
+
+        return "No relevant results found.", True
+
+    except requests.exceptions.RequestException as e:
+        logging.error("Web search failed: %s", str(e))
+        return "Web search failed.", False
 
 def web_search(query: str) -> str:
     """
     Perform a web search to retrieve external information.
+    Results are cached per normalized query, and concurrent searches for the
+    same query share a single outbound request.
     """
     api_key = os.getenv('GOOGLE_API_KEY')
     search_engine_id = os.getenv('SEARCH_ENGINE_ID')
@@ -94,109 +310,431 @@ def web_search(query: str) -> str:
         logging.error("API key or Search Engine ID not set in .env file.")
         return "API key or Search Engine ID not set."
 
-    url = f"https://www.googleapis.com/customsearch/v1?q={query}&key={api_key}&cx={search_engine_id}"
+    key = normalize_query(query)
+    with web_search_cache_lock:
+        if key in web_search_cache:
+            logging.debug("Web search cache hit for query: %s", key)
+            return web_search_cache[key]
 
-    try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        search_results = response.json()
+    def fetch():
+        snippet, cacheable = _fetch_web_search(key, api_key, search_engine_id)
+        if cacheable:
+            with web_search_cache_lock:
+                web_search_cache[key] = snippet
+        return snippet
 
-        # Extract relevant content (e.g., the first result's snippet)
-        if 'items' in search_results:
-            return search_results['items'][0]['snippet']
-        
-        return "No relevant results found."
-
-    except requests.exceptions.RequestException as e:
-        logging.error("Web search failed: %s", str(e))
-        return "Web search failed."
+    return web_search_flight.do(key, fetch)
 
-def parse_document(file_path: str) -> str:
+def parse_document(file_path: str, page_range: Optional[PageRange] = None) -> str:
     """
     Parse a user-uploaded document (PDF, DOCX) and extract text.
+    Pages are extracted as a stream (in parallel for large PDFs) and joined once.
+    Pass a zero-based (start, stop) `page_range` to extract only part of the document.
+    Full extractions are cached under the hash of the file bytes.
     """
     try:
-        if file_path.endswith('.pdf'):
-            with open(file_path, 'rb') as f:
-                reader = PdfReader(f)
-                text = ''
-                for page in reader.pages:
-                    text += page.extract_text()
-                return text
-
-        elif file_path.endswith('.docx'):
-            doc = Document(file_path)
-            return '\n'.join([para.text for para in doc.paragraphs])
-
-        else:
+        if not file_path.endswith(('.pdf', '.docx')):
             logging.error("Unsupported file format: %s", file_path)
             return "Unsupported file format."
 
+        if page_range is not None:
+            return '\n'.join(iter_document_pages(file_path, page_range))
+
+        digest = file_digest(file_path)
+        text = extraction_cache.get_text(digest)
+        if text is None:
+            text = '\n'.join(iter_document_pages(file_path))
+            extraction_cache.put_text(digest, text)
+        else:
+            logging.debug("Extraction cache hit for %s", file_path)
+        return text
+
     except Exception as e:
         logging.error("Failed to parse document %s: %s", file_path, str(e))
         return "Error processing document."
 
-def link_documents_to_case(doc_text: str, case_database: Dict[str, str]) -> Optional[str]:
+def _forward_pooled(inputs) -> np.ndarray:
+    """
+    Run one BERT forward pass over padded inputs and pool the last hidden layer.
+    """
+    import torch
+
+    with torch.no_grad():
+        outputs = models.get('semantic_model')(**inputs, output_hidden_states=True)
+    return pool_batch(outputs.hidden_states[-1].numpy(), inputs['attention_mask'].numpy(),
+                      EMBEDDING_POOLING)
+
+def embed_token_windows(windows: List[List[int]]) -> np.ndarray:
+    """
+    Embed a batch of pre-tokenized windows (without special tokens).
+    """
+    tokenizer = models.get('tokenizer')
+    inputs = tokenizer.pad(
+        {'input_ids': [tokenizer.build_inputs_with_special_tokens(ids) for ids in windows]},
+        return_tensors='pt')
+    return _forward_pooled(inputs)
+
+# Collects token windows from concurrent callers (document chunks and batches
+# of short documents) into shared padded forward passes
+embed_batcher = MicroBatcher(lambda windows: list(embed_token_windows(windows)),
+                             max_batch_size=EMBED_MAX_BATCH, max_wait=EMBED_MAX_WAIT,
+                             name='embed-batcher')
+
+def embed_windows_batched(windows: List[List[int]]) -> np.ndarray:
+    """
+    Embed pre-tokenized windows through the shared micro-batcher, so they ride
+    in the same forward passes as windows from other concurrent callers.
+    """
+    futures = [embed_batcher.submit(ids) for ids in windows]
+    return np.stack([future.result() for future in futures])
+
+def embed_document(text: str, keep_chunks: bool = True) -> DocumentEmbedding:
+    """
+    Embed a document of any length: the text is tokenized in streaming segments,
+    cut into overlapping token windows, embedded in batches and aggregated into a
+    document vector plus per-chunk vectors.
+    """
+    tokenizer = models.get('tokenizer')
+    window = EMBED_MAX_LENGTH - tokenizer.num_special_tokens_to_add()
+    return embed_document_stream(iter_segments(text), tokenizer, embed_windows_batched,
+                                 window=window, overlap=CHUNK_OVERLAP,
+                                 batch_size=EMBED_MAX_BATCH, keep_chunks=keep_chunks)
+
+def embedding_version() -> str:
+    """
+    Identifies the model and pooling behind document vectors, for cache keys.
+    """
+    return f"bert-base-uncased:{EMBEDDING_POOLING}:{EMBED_MAX_LENGTH}:{CHUNK_OVERLAP}"
+
+def link_documents_to_case(doc_text: str, case_database: Optional[Dict[str, str]] = None) -> Optional[str]:
     """
     Link the content of a document to relevant legal cases by comparing semantic similarity.
+    Cases are looked up in the precomputed case index, so only the document itself
+    goes through the model. An explicit `case_database` is embedded on the fly instead.
     """
     try:
-        doc_embedding = semantic_search(doc_text)
-
-        best_match = None
-        highest_similarity = 0
-        for case_name, case_text in case_database.items():
-            case_embedding = semantic_search(case_text)
-            similarity = cosine_similarity(doc_embedding, case_embedding)
-   
-            if similarity > highest_similarity:
-                highest_similarity = similarity
-                best_match = case_name
- 
-        return best_match
+        doc_vector = embed_document(doc_text, keep_chunks=False).vector
+        if doc_vector is None:
+            return None
+
+        if case_database:
+            # Embedded like documents, so the vectors are comparable
+            embedded = [(name, vector) for name, vector
+                        in zip(case_database, embed_documents(list(case_database.values())))
+                        if vector is not None]
+            if not embedded:
+                return None
+            case_names = [name for name, _ in embedded]
+            case_matrix = np.stack([vector for _, vector in embedded])
+            matches = rank(doc_vector, case_matrix, k=1)
+            if matches and matches[0][1] > 0:
+                return case_names[matches[0][0]]
+            return None
+
+        case_index = current_case_index()
+        if case_index is None:
+            return None
+
+        matches = case_index.search(doc_vector, k=1)
+        return matches[0][0] if matches else None
 
     except Exception as e:
         logging.error("Failed to link document to case: %s", str(e))
         return None
 
-def cosine_similarity(embedding1, embedding2):
+def link_uploaded_document(file_path: str) -> Optional[str]:
     """
-    Calculate cosine similarity between two embeddings.
+    Link an uploaded file to the most similar case. A stored DocumentAnalysis of
+    the same bytes is used as-is; otherwise the document vector is cached under
+    the hash of the file bytes, so a repeat or duplicate upload skips both
+    parsing and embedding.
     """
-    # Ensure both embeddings are flattened and of the same length
-    embedding1_flat = embedding1[0][0]
-    embedding2_flat = embedding2[0][0]
+    try:
+        digest = file_digest(file_path)
+        analysis = precomputed_analysis(digest)
+        if analysis is not None:
+            logging.debug("Using precomputed analysis for %s", file_path)
+            return analysis.linked_case
+
+        case_index = current_case_index()
+        if case_index is None:
+            return None
+
+        doc_vector = extraction_cache.get_embedding(digest, embedding_version())
+        if doc_vector is None:
+            doc_vector = embed_document(parse_document(file_path), keep_chunks=False).vector
+            if doc_vector is None:
+                return None
+            extraction_cache.put_embedding(digest, embedding_version(), doc_vector)
+
+        matches = case_index.search(doc_vector, k=1)
+        return matches[0][0] if matches else None
 
-    norm1 = sum([x ** 2 for x in embedding1_flat]) ** 0.5
-    norm2 = sum([y ** 2 for y in embedding2_flat]) ** 0.5
+    except Exception as e:
+        logging.error("Failed to link document %s to case: %s", file_path, str(e))
+        return None
 
-    return sum([x * y for x, y in zip(embedding1_flat, embedding2_flat)]) / (norm1 * norm2)
+def embed_documents(texts: List[str]) -> List[Optional[np.ndarray]]:
+    """
+    Embed many documents at once. Only a bounded prefix of each text is tokenized
+    to tell short from long: documents that fit in a single window go to the
+    embedding micro-batcher together, and the rest are streamed once through
+    embed_document. Either way the vectors are the token-weighted mean over
+    windows, comparable across documents and cases.
+    """
+    tokenizer = models.get('tokenizer')
+    window = EMBED_MAX_LENGTH - tokenizer.num_special_tokens_to_add()
+    prefixes = [text[:EMBED_SHORT_CHARS] for text in texts]
+    token_ids = tokenizer(prefixes, add_special_tokens=False, truncation=True,
+                          max_length=window + 1)['input_ids']
+
+    vectors: List[Optional[np.ndarray]] = [None] * len(texts)
+    # The prefix ids are the whole document only when the prefix is the whole text
+    short = [i for i, ids in enumerate(token_ids)
+             if 0 < len(ids) <= window and len(texts[i]) <= EMBED_SHORT_CHARS]
+    if short:
+        for i, vector in zip(short, embed_windows_batched([token_ids[i] for i in short])):
+            vectors[i] = vector
+    for i, ids in enumerate(token_ids):
+        if len(ids) > window or len(texts[i]) > EMBED_SHORT_CHARS:
+            vectors[i] = embed_document(texts[i], keep_chunks=False).vector
+    return vectors
+
+def analyze_documents(file_paths: List[str]) -> List[Dict[str, Any]]:
+    """
+    Analyze a batch of documents: extract text, classify it from its opening
+    passages, embed it and link it to the closest case.
+    Documents that fail are reported with an "error" instead of failing the batch.
+    :param file_paths: Paths of the documents to analyze.
+    :return: One result per path, in order.
+    """
+    results: List[Dict[str, Any]] = [{} for _ in file_paths]
+    texts, pending = [], []
+    for i, file_path in enumerate(file_paths):
+        try:
+            digest = file_digest(file_path)
+        except OSError as e:
+            logging.error("Failed to read document %s: %s", file_path, str(e))
+            results[i] = {"error": "Document file is missing."}
+            continue
+        text = parse_document(file_path)
+        if text in ("Unsupported file format.", "Error processing document."):
+            results[i] = {"error": text}
+            continue
+        results[i] = {"text_hash": digest}
+        texts.append(text)
+        pending.append(i)
+
+    if not pending:
+        return results
+
+    version = embedding_version()
+    # Embed only the documents whose vector is not cached yet
+    vectors = [extraction_cache.get_embedding(results[i]["text_hash"], version) for i in pending]
+    missing = [j for j, vector in enumerate(vectors) if vector is None]
+    if missing:
+        for j, vector in zip(missing, embed_documents([texts[j] for j in missing])):
+            vectors[j] = vector
+            if vector is not None:
+                extraction_cache.put_embedding(results[pending[j]]["text_hash"], version, vector)
+
+    case_index = current_case_index()
+    for j, i in enumerate(pending):
+        try:
+            classification = classify_document(texts[j])
+        except Exception as e:
+            logging.error("Failed to classify document %s: %s", file_paths[i], str(e))
+            results[i] = {"error": "Error classifying document."}
+            continue
+        linked_cases = []
+        if case_index is not None and vectors[j] is not None:
+            linked_cases = [[case_id, float(score)] for case_id, score
+                            in case_index.search(vectors[j], k=DOCUMENT_LINKED_CASES)]
+        results[i].update({
+            "classification": classification,
+            "linked_cases": linked_cases,
+            "embedding": vectors[j],
+        })
+    return results
+
+def analysis_version() -> str:
+    """
+    Identifies everything a stored DocumentAnalysis depends on; rows of other
+    versions are ignored and recomputed.
+    """
+    return f"{MODEL_VERSION}:{embedding_version()}"
+
+def precomputed_analysis(text_hash: str):
+    """
+    The stored analysis of any document with these bytes, for the current models.
+    :param text_hash: SHA-256 of the file bytes.
+    :return: A DocumentAnalysis, or None if there is none (or no database).
+    """
+    from blueprints.documents.models import DocumentAnalysis
+    try:
+        return (DocumentAnalysis.query
+                .filter_by(text_hash=text_hash, model_version=analysis_version())
+                .first())
+    except Exception as e:
+        logging.warning("Document analysis lookup failed for %s: %s", text_hash, str(e))
+        return None
 
-@lru_cache(maxsize=32)
-def cache_result(query: str, result: Dict[str, Any]) -> Dict[str, Any]:
+def cosine_similarity(embedding1, embedding2) -> float:
     """
-    Cache the result for frequently asked queries.
+    Calculate cosine similarity between two embeddings.
+    Accepts pooled vectors or raw pipeline outputs, which are pooled first.
     """
-    cache[query] = result
-    logging.debug("Cached result for query: %s", query)
-    return result
+    vector1 = np.asarray(embedding1, dtype=np.float32)
+    vector2 = np.asarray(embedding2, dtype=np.float32)
+    if vector1.ndim > 1:
+        vector1 = pool_embeddings(vector1, EMBEDDING_POOLING)
+    if vector2.ndim > 1:
+        vector2 = pool_embeddings(vector2, EMBEDDING_POOLING)
+    return float(cosine_scores(vector1, vector2[np.newaxis, :])[0])
 
 def manage_query_context(user_id: str, query: str) -> str:
     """
     Manage the retention and context of queries for a specific user.
+    Only the most recent turns (bounded by count and tokens) are kept.
     """
-    if user_id not in query_sessions:
-        query_sessions[user_id] = []
+    return query_contexts.append(user_id, query)
 
-    # Retain the current query context
-    query_sessions[user_id].append(query)
+def run_langchain(processed_query: str) -> str:
+    """
+    Run the LangChain LLM chain on the processed query.
+    """
+    from langchain.llm import LLMChain
+    from langchain.prompts import PromptTemplate
+    prompt_template = PromptTemplate(
+        input_variables=["query"],
+        template="Given the query '{query}', provide relevant legal advice."
+    )
+    langchain_chain = LLMChain(llm=ollama.llama, prompt_template=prompt_template)
+    return langchain_chain.run(query=processed_query)
+
+def _timed_stage(name: str, stage: Callable[[], Any], app=None,
+                 on_start: Optional[Callable[[], None]] = None) -> Callable[[], Any]:
+    """
+    Wrap a stage so its own run time is recorded, even past its deadline.
+    Pass the caller's Flask `app` to run the stage in an app context of its own,
+    since stage threads do not inherit the caller's (the database needs one),
+    and `on_start` to be called when a worker picks the stage up.
+    """
+    def run():
+        if on_start is not None:
+            on_start()
+        with span(name):
+            if app is None:
+                return stage()
+            with app.app_context():
+                return stage()
+    return run
+
+def run_query_stages(stages: Dict[str, Callable[[], Any]]) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Run independent query stages and collect their results.
+    In concurrent mode all stages are submitted at once. Each must be picked up
+    by a stage worker within STAGE_QUEUE_TIMEOUT, or it is dropped (the pool is
+    saturated), and is then given its STAGE_DEADLINES entry, counted from when
+    it started, to finish. A stage that is dropped, misses its deadline or
+    raises yields None and is reported as incomplete, so end-to-end latency is
+    bounded by the queue timeout plus the slowest deadline, not their sum.
+    A late stage cannot be interrupted and keeps its worker until it returns;
+    its work is bounded by its own timeouts (e.g. SEARCH_TIMEOUT).
+    """
+    results: Dict[str, Any] = {}
+    incomplete: List[str] = []
+
+    if not QUERY_CONCURRENT_STAGES:
+        stages = {name: _timed_stage(name, stage) for name, stage in stages.items()}
+        for name, stage in stages.items():
+            try:
+                results[name] = stage()
+            except Exception as e:
+                logging.error("Query stage %s failed: %s", name, str(e))
+                results[name] = None
+                incomplete.append(name)
+        return results, incomplete
+
+    app = current_app._get_current_object() if has_app_context() else None
+    start_times: Dict[str, float] = {}
+    started = {name: threading.Event() for name in stages}
+
+    def marker(name: str) -> Callable[[], None]:
+        def mark():
+            start_times[name] = time.monotonic()
+            started[name].set()
+        return mark
+
+    submitted = time.monotonic()
+    futures = {name: stage_work.submit(stage_executor, _timed_stage(name, stage, app, marker(name)))
+               for name, stage in stages.items()}
+    for name, future in futures.items():
+        queue_wait = STAGE_QUEUE_TIMEOUT - (time.monotonic() - submitted)
+        if not started[name].wait(max(0.0, queue_wait)):
+            # Only a stage that is still queued can be cancelled; one a worker
+            # has just picked up is waited for as usual
+            if future.cancel():
+                STAGE_SATURATED.inc(stage=name)
+                logging.warning("Query stage %s was dropped: no stage worker free within %.1fs "
+                                "(%d workers, %d other stages queued)", name, STAGE_QUEUE_TIMEOUT,
+                                QUERY_STAGE_WORKERS, stage_work.queued)
+                results[name] = None
+                incomplete.append(name)
+                continue
+            started[name].wait()
+
+        remaining = STAGE_DEADLINES.get(name, 30.0) - (time.monotonic() - start_times[name])
+        try:
+            results[name] = future.result(timeout=max(0.0, remaining))
+        except StageTimeoutError:
+            STAGE_TIMEOUTS.inc(stage=name)
+            logging.warning("Query stage %s missed its %.1fs deadline", name, STAGE_DEADLINES.get(name, 30.0))
+            results[name] = None
+            incomplete.append(name)
+        except Exception as e:
+            logging.error("Query stage %s failed: %s", name, str(e))
+            results[name] = None
+            incomplete.append(name)
+    return results, incomplete
+
+def answer_query(processed_query: str, user_document_path: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Answer a processed query from the web, the uploaded document and the LLM.
+    """
+    # Steps 4-6 are independent: web search, document linking and the LLM call
+    stages = {
+        # Step 4: Web search for additional information
+        'web_search': lambda: web_search(processed_query),
+        # Step 6: Use LangChain for query processing
+        'llm': lambda: run_langchain(processed_query),
+    }
+    # Step 5: Document parsing and linking to cases (optional)
+    if user_document_path:
+        stages['document'] = lambda: link_uploaded_document(user_document_path)
+
+    stage_results, incomplete_stages = run_query_stages(stages)
+
+    linked_case = stage_results.get('document')
+    if user_document_path:
+        if linked_case:
+            logging.info("Document linked to case: %s", linked_case)
+        else:
+            logging.info("No case linked from the document.")
 
-    # Combine current and previous queries for context
-    combined_query = " ".join(query_sessions[user_id])
+    # Combine results from LangChain, LLaMA, and web/document information
+    combined_result = {
+        "langchain_result": stage_results['llm'],
+        "web_info": stage_results['web_search'],
+        "linked_case": linked_case
+    }
+    if incomplete_stages:
+        combined_result["incomplete_stages"] = incomplete_stages
 
-    return combined_query
+    return {"result": combined_result, "processing_time": time.time()}
 
-def process_legal_query(query: str, user_id: Optional[str] = None, user_document_path: Optional[str] = None) -> Dict[str, Any]:
+def process_legal_query(query: str, user_id: Optional[str] = None, user_document_path: Optional[str] = None,
+                        processed_query: Optional[str] = None) -> Dict[str, Any]:
     """
     Process the legal query using LLaMA and external sources.
     - Preprocess the query
@@ -205,6 +743,7 @@ def process_legal_query(query: str, user_id: Optional[str] = None, user_document
     - Cache results for frequent queries
     - Handle context if provided
     - Use LangChain for enhanced query processing
+    Pass `processed_query` when the query was already preprocessed in a batch.
     """
     try:
         # Validate the input query
@@ -212,54 +751,33 @@ def process_legal_query(query: str, user_id: Optional[str] = None, user_document
             raise ValueError("Invalid query format detected.")
         
         # Step 1: Preprocess the query
-        processed_query = preprocess_query(query)
+        if processed_query is None:
+            with span('preprocess'):
+                processed_query = preprocess_query(query)
 
         # Step 2: Manage query context
         if user_id:
-            processed_query = manage_query_context(user_id, processed_query)
+            with span('context'):
+                processed_query = manage_query_context(user_id, processed_query)
 
         # Step 3: Classify the query using ML
-        query_type = classify_query_ml(processed_query)
+        with span('classify'):
+            query_type = classify_query_ml(processed_query)
         
         logging.info("Processing a %s query: %s", query_type, processed_query)
 
-        # Check cache before querying the model
-        if processed_query in cache:
-            logging.info("Cache hit for query: %s", processed_query)
-            return cache[processed_query]
-
-        # Step 4: Web search for additional information
-        web_info = web_search(processed_query)
-
-        # Step 5: Document parsing and linking to cases (optional)
-        linked_case = None
+        # The linked case depends on the uploaded file, so it is part of the cache key
+        cache_query = processed_query
         if user_document_path:
-            doc_text = parse_document(user_document_path)
-            linked_case = link_documents_to_case(doc_text, case_database={})
-            if linked_case:
-                logging.info("Document linked to case: %s", linked_case)
-            else:
-                logging.info("No case linked from the document.")
-
-        # Step 6: Use LangChain for query processing
-        prompt_template = PromptTemplate(
-            input_variables=["query"],
-            template="Given the query '{query}', provide relevant legal advice."
-        )
-        langchain_chain = LLMChain(llm=ollama.llama, prompt_template=prompt_template)
-        langchain_result = langchain_chain.run(query=processed_query)
+            cache_query = f"{processed_query} document:{file_digest(user_document_path)}"
 
-        # Combine results from LangChain, LLaMA, and web/document information
-        combined_result = {
-            "langchain_result": langchain_result,
-            "web_info": web_info,
-            "linked_case": linked_case
-        }
-
-        # Cache the result
-        cached_result = cache_result(processed_query, {"result": combined_result, "processing_time": time.time()})
-
-        return cached_result
+        # Check cache before querying the model; concurrent misses compute once
+        with span('answer'):
+            return query_cache.get_or_compute(
+                cache_query,
+                lambda: answer_query(processed_query, user_document_path),
+                # Partial results are returned as-is but never cached
+                cacheable=lambda result: "incomplete_stages" not in result["result"])
 
     except ValueError as ve:
         logging.warning("Validation error: %s", str(ve))
@@ -278,3 +796,24 @@ def validate_query_input(query: str) -> bool:
         logging.warning("Invalid input detected: %s", query)
         return False
     return True
+
+# Scrape-time views of state kept by the objects above
+Collected('legal_query_cache_events_total', 'Query cache lookups and evictions by outcome.',
+          'counter', ['event'],
+          lambda: {(event,): value for event, value in query_cache.stats().items() if event != 'l1_size'})
+Collected('legal_query_cache_l1_entries', 'Entries in the in-process query cache.', 'gauge', [],
+          lambda: {(): query_cache.stats()['l1_size']})
+Collected('legal_stage_queue_depth', 'Query stages waiting for a stage worker.', 'gauge', [],
+          lambda: {(): stage_work.queued})
+Collected('legal_stages_running', 'Query stages running on a stage worker.', 'gauge', [],
+          lambda: {(): stage_work.running})
+Collected('nlp_model_loaded', 'Whether each registered model is loaded in this process.', 'gauge',
+          ['model'], lambda: {(name,): int(models.is_loaded(name)) for name in models.registered()})
+Collected('nlp_model_load_seconds', 'Time spent loading each loaded model.', 'gauge', ['model'],
+          lambda: {(name,): seconds for name, seconds in models.load_times().items()})
+Collected('nlp_batcher_queue_depth', 'Items waiting for a micro-batch.', 'gauge', ['batcher'],
+          lambda: {(batcher.name,): batcher.pending() for batcher in (preprocess_batcher, embed_batcher)})
+Collected('nlp_batcher_stats', 'Micro-batch counters and recent latency percentiles (ms).', 'gauge',
+          ['batcher', 'stat'],
+          lambda: {(batcher.name, stat): value for batcher in (preprocess_batcher, embed_batcher)
+                   for stat, value in batcher.stats.snapshot().items()})
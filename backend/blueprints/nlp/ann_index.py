@@ -0,0 +1,258 @@
+"""Approximate nearest neighbour (IVF) backend for the case embedding index."""
+import os
+import logging
+import argparse
+from typing import List, Optional, Tuple
+import numpy as np
+from blueprints.nlp.case_index import CaseEmbeddingIndex
+from blueprints.nlp.similarity import l2_normalize, top_k
+
+CENTROIDS_FILE = 'ivf_centroids.npy'
+ASSIGNMENTS_FILE = 'ivf_assignments.npy'
+DEFAULT_NPROBE = 16
+ASSIGN_BATCH_SIZE = 65536
+
+
+def default_nlist(num_vectors: int) -> int:
+    """Pick a number of inverted lists of roughly 4 * sqrt(n)."""
+    return int(max(1, min(num_vectors, 4 * np.sqrt(max(num_vectors, 1)))))
+
+
+def train_centroids(vectors: np.ndarray, nlist: int, iterations: int = 10,
+                    seed: int = 0) -> np.ndarray:
+    """
+    Spherical k-means over L2-normalized vectors.
+    :param vectors: Training sample of shape (n, dim), already normalized.
+    :param nlist: Number of centroids.
+    :param iterations: Number of Lloyd iterations.
+    :param seed: Random seed for initialization.
+    :return: Normalized centroids of shape (nlist, dim).
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=nlist, replace=False)].copy()
+    for _ in range(iterations):
+        labels = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        empty = np.bincount(labels, minlength=nlist) == 0
+        # Re-seed empty lists with random vectors so every list stays in use
+        sums[empty] = vectors[rng.choice(len(vectors), size=int(empty.sum()))]
+        centroids = l2_normalize(sums)
+    return centroids
+
+
+class IVFCaseIndex:
+    """
+    Inverted-file index layered on top of a ``CaseEmbeddingIndex``.
+
+    Cases are partitioned by their nearest centroid; a query scores the centroids,
+    then only the vectors in the ``nprobe`` closest lists. Larger ``nprobe`` raises
+    recall at the cost of latency; ``nlist`` is fixed when the index is built.
+    The underlying exact index remains the source of truth for vectors and ids,
+    so adds and removes go through it and only the list assignment is kept here.
+    """
+
+    def __init__(self, exact: CaseEmbeddingIndex, centroids: np.ndarray,
+                 assignments: np.ndarray, nprobe: int = DEFAULT_NPROBE):
+        self.exact = exact
+        self.centroids = centroids
+        self.nprobe = nprobe
+        self._assignments = assignments
+        self._list_rows = None
+        self._list_offsets = None
+        self._lists_mtime = self._stat_lists()
+
+    @property
+    def path(self) -> str:
+        """Directory holding the index files."""
+        return self.exact.path
+
+    @property
+    def nlist(self) -> int:
+        """Number of inverted lists."""
+        return self.centroids.shape[0]
+
+    def __len__(self) -> int:
+        return len(self.exact)
+
+    def __contains__(self, case_id: str) -> bool:
+        return case_id in self.exact
+
+    @classmethod
+    def build(cls, exact: CaseEmbeddingIndex, nlist: Optional[int] = None,
+              iterations: int = 10, sample_size: Optional[int] = None,
+              nprobe: int = DEFAULT_NPROBE) -> 'IVFCaseIndex':
+        """
+        Train centroids on a sample of the exact index and assign every case to a list.
+        :param exact: Index holding the case vectors.
+        :param nlist: Number of lists (default: 4 * sqrt(n)).
+        :param iterations: k-means iterations.
+        :param sample_size: Training sample size (default: 64 vectors per list).
+        :param nprobe: Lists to scan per query.
+        :return: The built index, also saved next to the exact index.
+        """
+        rows = np.flatnonzero(exact._live[:exact._size])
+        if len(rows) == 0:
+            raise ValueError("Cannot build an IVF index over an empty case index")
+        nlist = min(nlist or default_nlist(len(rows)), len(rows))
+        sample_size = min(len(rows), sample_size or 64 * nlist)
+        rng = np.random.default_rng(0)
+        sample = np.asarray(exact._matrix[np.sort(rng.choice(rows, size=sample_size, replace=False))])
+        centroids = train_centroids(sample, nlist, iterations=iterations)
+
+        index = cls(exact, centroids, np.full(exact._matrix.shape[0], -1, dtype=np.int32), nprobe)
+        for start in range(0, len(rows), ASSIGN_BATCH_SIZE):
+            batch = rows[start:start + ASSIGN_BATCH_SIZE]
+            index._assignments[batch] = np.argmax(exact._matrix[batch] @ centroids.T, axis=1)
+        index._save_lists()
+        logging.info("Built IVF index with %d lists over %d cases", nlist, len(rows))
+        return index
+
+    @classmethod
+    def open(cls, path: str, writable: bool = False,
+             nprobe: int = DEFAULT_NPROBE) -> 'IVFCaseIndex':
+        """
+        Open an IVF index previously built next to an exact index.
+        :param path: Directory holding the index files.
+        :param writable: Open the vectors read-write to allow add/remove.
+        :param nprobe: Lists to scan per query.
+        :return: The loaded index.
+        """
+        exact = CaseEmbeddingIndex.open(path, writable=writable)
+        centroids = np.load(os.path.join(path, CENTROIDS_FILE))
+        assignments = np.load(os.path.join(path, ASSIGNMENTS_FILE))
+        if len(assignments) < exact._matrix.shape[0]:
+            assignments = np.concatenate([
+                assignments, np.full(exact._matrix.shape[0] - len(assignments), -1, dtype=np.int32)])
+        return cls(exact, centroids, assignments, nprobe)
+
+    def _stat_lists(self) -> float:
+        try:
+            return os.path.getmtime(os.path.join(self.path, ASSIGNMENTS_FILE))
+        except OSError:
+            return 0.0
+
+    def refresh(self) -> 'IVFCaseIndex':
+        """
+        Reload the index if another process has rewritten it since it was opened.
+        :return: The up-to-date index (``self`` when nothing changed).
+        """
+        if self.exact.refresh() is self.exact and self._stat_lists() == self._lists_mtime:
+            return self
+        return IVFCaseIndex.open(self.path, writable=self.exact._matrix.mode != 'r',
+                                 nprobe=self.nprobe)
+
+    def _save_lists(self):
+        """Atomically rewrite the centroids and list assignments."""
+        for name, array in ((CENTROIDS_FILE, self.centroids), (ASSIGNMENTS_FILE, self._assignments)):
+            tmp_path = os.path.join(self.path, name + '.tmp.npy')
+            np.save(tmp_path, array)
+            os.replace(tmp_path, os.path.join(self.path, name))
+        self._lists_mtime = self._stat_lists()
+
+    def save(self):
+        """Persist the exact index, the centroids and the list assignments."""
+        self.exact.save()
+        self._save_lists()
+
+    def add(self, case_id: str, embedding: np.ndarray):
+        """
+        Insert or replace a case and assign it to its nearest list.
+        :param case_id: Case identifier.
+        :param embedding: Pooled case embedding.
+        """
+        self.exact.add(case_id, embedding)
+        row = self.exact._rows[case_id]
+        if row >= len(self._assignments):
+            grown = np.full(self.exact._matrix.shape[0], -1, dtype=np.int32)
+            grown[:len(self._assignments)] = self._assignments
+            self._assignments = grown
+        self._assignments[row] = int(np.argmax(self.centroids @ self.exact._matrix[row]))
+        self._list_rows = None
+
+    def add_many(self, items):
+        """
+        Insert or replace several cases and persist the index once.
+        :param items: Mapping of case id to pooled embedding.
+        """
+        for case_id, embedding in items.items():
+            self.add(case_id, embedding)
+        self.save()
+
+    def remove(self, case_id: str) -> bool:
+        """
+        Remove a case from the index.
+        :param case_id: Case identifier.
+        :return: True if the case was present.
+        """
+        row = self.exact._rows.get(case_id)
+        if row is None:
+            return False
+        self.exact.remove(case_id)
+        self._assignments[row] = -1
+        self._list_rows = None
+        return True
+
+    def _build_lists(self):
+        """Group rows by list id: rows of list i are _list_rows[offsets[i]:offsets[i + 1]]."""
+        assigned = np.flatnonzero(self._assignments >= 0)
+        labels = self._assignments[assigned]
+        order = np.argsort(labels, kind='stable')
+        self._list_rows = assigned[order]
+        self._list_offsets = np.searchsorted(labels[order], np.arange(self.nlist + 1))
+
+    def search(self, query: np.ndarray, k: int = 1,
+               nprobe: Optional[int] = None) -> List[Tuple[str, float]]:
+        """
+        Approximate top-k cases by cosine similarity.
+        :param query: Pooled query embedding.
+        :param k: Number of results to return.
+        :param nprobe: Override the number of lists to scan.
+        :return: Up to ``k`` ``(case_id, similarity)`` pairs, best first.
+        """
+        if not len(self.exact):
+            return []
+        if self._list_rows is None:
+            self._build_lists()
+        query = l2_normalize(query)
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        probes = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        rows = np.concatenate([self._list_rows[self._list_offsets[i]:self._list_offsets[i + 1]]
+                               for i in probes])
+        if len(rows) == 0:
+            return []
+        rows.sort()
+        scores = np.asarray(self.exact._matrix[rows] @ query)
+        return [(self.exact._ids[rows[i]], score) for i, score in top_k(scores, k)]
+
+
+BACKENDS = {
+    'exact': CaseEmbeddingIndex,
+    'ivf': IVFCaseIndex,
+}
+
+
+def open_case_index(path: str, backend: str = 'exact', writable: bool = False, **options):
+    """
+    Open the case index with the configured search backend.
+    :param path: Directory holding the index files.
+    :param backend: One of ``BACKENDS``.
+    :param writable: Open read-write to allow add/remove.
+    :param options: Backend-specific knobs, e.g. ``nprobe`` for 'ivf'.
+    :return: The loaded index.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown case index backend {backend!r}; expected one of {list(BACKENDS)}")
+    return BACKENDS[backend].open(path, writable=writable, **options)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build an IVF index over an existing case index.")
+    parser.add_argument('path', help="Case index directory")
+    parser.add_argument('--nlist', type=int, default=None)
+    parser.add_argument('--iterations', type=int, default=10)
+    parser.add_argument('--sample-size', type=int, default=None)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    IVFCaseIndex.build(CaseEmbeddingIndex.open(args.path), nlist=args.nlist,
+                       iterations=args.iterations, sample_size=args.sample_size)
@@ -0,0 +1,155 @@
+"""In-process micro-batching of per-item model calls from concurrent callers."""
+import os
+import time
+import queue
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List
+
+
+class BatchStats:
+    """
+    Per-batch size and latency figures for a ``MicroBatcher``.
+    Latencies are kept for the most recent ``window`` batches only.
+    """
+
+    def __init__(self, window: int = 1000):
+        self.batches = 0
+        self.items = 0
+        self.errors = 0
+        self._sizes = deque(maxlen=window)
+        self._run_times = deque(maxlen=window)
+        self._wait_times = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, size: int, wait_time: float, run_time: float, failed: bool = False):
+        """
+        Record one processed batch.
+        :param size: Number of items in the batch.
+        :param wait_time: Seconds the oldest item spent queued before the batch ran.
+        :param run_time: Seconds spent in ``process_batch``.
+        :param failed: Whether ``process_batch`` raised.
+        """
+        with self._lock:
+            self.batches += 1
+            self.items += size
+            self.errors += int(failed)
+            self._sizes.append(size)
+            self._run_times.append(run_time)
+            self._wait_times.append(wait_time)
+
+    @staticmethod
+    def _percentile(values: List[float], pct: float) -> float:
+        if not values:
+            return 0.0
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+    def snapshot(self) -> Dict[str, float]:
+        """Current counters and recent latency percentiles (in milliseconds)."""
+        with self._lock:
+            sizes, run_times, wait_times = list(self._sizes), list(self._run_times), list(self._wait_times)
+            snapshot = {'batches': self.batches, 'items': self.items, 'errors': self.errors}
+        snapshot['mean_batch_size'] = sum(sizes) / len(sizes) if sizes else 0.0
+        for pct in (50, 95, 99):
+            snapshot[f'run_p{pct}_ms'] = self._percentile(run_times, pct) * 1000
+            snapshot[f'wait_p{pct}_ms'] = self._percentile(wait_times, pct) * 1000
+        return snapshot
+
+
+class MicroBatcher:
+    """
+    Collects items submitted by concurrent callers and hands them to
+    ``process_batch`` together.
+
+    A background thread waits for the first item, then keeps collecting until
+    either ``max_batch_size`` items are queued or ``max_wait`` seconds have
+    passed since that first item, and runs one batch. Each caller gets a
+    ``Future`` resolved with its own result, so a lone request only pays
+    ``max_wait`` extra latency while a burst is served by a single call.
+    ``process_batch`` must return one result per item, in order; if it raises
+    or returns a different number of results, every caller in the batch gets
+    the exception.
+    """
+
+    def __init__(self, process_batch: Callable[[List[Any]], List[Any]],
+                 max_batch_size: int = 32, max_wait: float = 0.005, name: str = 'batcher'):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.name = name
+        self.stats = BatchStats()
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def _ensure_worker(self):
+        """Start the worker thread, again in a forked child where it does not exist."""
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def submit(self, item: Any) -> Future:
+        """
+        Queue an item for the next batch.
+        :param item: Input for ``process_batch``.
+        :return: Future resolved with the item's result.
+        """
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((item, future, time.monotonic()))
+        return future
+
+    def pending(self) -> int:
+        """Items queued and not yet picked up by a batch."""
+        return self._queue.qsize()
+
+    def __call__(self, item: Any, timeout: float = None) -> Any:
+        """Submit an item and wait for its result."""
+        return self.submit(item).result(timeout=timeout)
+
+    def _collect(self) -> List[tuple]:
+        """Block for the first item, then gather more until the batch is full or the window closes."""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            items = [item for item, _, _ in batch]
+            start = time.monotonic()
+            wait_time = start - batch[0][2]
+            try:
+                results = list(self.process_batch(items))
+                if len(results) != len(items):
+                    # Results cannot be matched to callers, so none of them is trusted
+                    raise ValueError(f"process_batch returned {len(results)} results for {len(items)} items")
+            except Exception as e:
+                self.stats.record(len(items), wait_time, time.monotonic() - start, failed=True)
+                logging.error("%s: batch of %d failed: %s", self.name, len(items), str(e))
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            run_time = time.monotonic() - start
+            self.stats.record(len(items), wait_time, run_time)
+            logging.debug("%s: ran batch of %d in %.1fms (waited %.1fms)",
+                          self.name, len(items), run_time * 1000, wait_time * 1000)
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
@@ -0,0 +1,267 @@
+"""Persistent, memory-mapped embedding index over the case database."""
+import os
+import sys
+import json
+import shutil
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+from blueprints.nlp.similarity import l2_normalize, top_k
+
+EMBEDDINGS_FILE = 'embeddings.npy'
+IDS_FILE = 'ids.json'
+DEFAULT_DIM = 768
+MIN_CAPACITY = 1024
+
+
+class CaseEmbeddingIndex:
+    """
+    Case embeddings stored as a float32 matrix in a memory-mapped ``.npy`` file,
+    with a sidecar JSON table mapping each row to its case id.
+
+    Rows are L2-normalized on insert, so a single matrix-vector product gives the
+    cosine similarity of a query against every case. Removed cases are tombstoned
+    (their id slot becomes ``None``) and their rows are reused by later inserts;
+    ``compact`` rewrites the file without the holes.
+
+    Other processes may have the matrix mapped, so a published matrix file is
+    never truncated or rewritten in place: a new matrix is written to a
+    temporary file and renamed over it, and the id table is replaced last.
+    Readers keep the old pages until they refresh onto the new table.
+    """
+
+    def __init__(self, path: str, matrix: np.ndarray, ids: List[Optional[str]], size: int):
+        self.path = path
+        self._matrix = matrix
+        self._ids = ids
+        self._size = size
+        self._rows = {case_id: row for row, case_id in enumerate(ids[:size]) if case_id is not None}
+        self._free = [row for row, case_id in enumerate(ids[:size]) if case_id is None]
+        self._live = np.zeros(matrix.shape[0], dtype=bool)
+        self._live[list(self._rows.values())] = True
+        self._ids_mtime = self._stat_ids()
+
+    @property
+    def dim(self) -> int:
+        """Dimensionality of the stored embeddings."""
+        return self._matrix.shape[1]
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, case_id: str) -> bool:
+        return case_id in self._rows
+
+    @classmethod
+    def create(cls, path: str, dim: int = DEFAULT_DIM, capacity: int = MIN_CAPACITY) -> 'CaseEmbeddingIndex':
+        """
+        Create an empty index on disk, replacing any index already there.
+        :param path: Directory that will hold the index files.
+        :param dim: Embedding dimensionality.
+        :param capacity: Number of rows to preallocate.
+        :return: The new index.
+        """
+        os.makedirs(path, exist_ok=True)
+        matrix = _publish_matrix(path, np.empty((0, dim), dtype=np.float32), capacity)
+        index = cls(path, matrix, [None] * capacity, 0)
+        index.save()
+        return index
+
+    @classmethod
+    def open(cls, path: str, writable: bool = False) -> 'CaseEmbeddingIndex':
+        """
+        Open an existing index. The matrix is memory-mapped, so forked workers
+        share its pages through the OS page cache.
+        :param path: Directory holding the index files.
+        :param writable: Open the matrix read-write to allow add/remove.
+        :return: The loaded index.
+        """
+        matrix = np.load(os.path.join(path, EMBEDDINGS_FILE), mmap_mode='r+' if writable else 'r')
+        with open(os.path.join(path, IDS_FILE), 'r', encoding='utf-8') as f:
+            table = json.load(f)
+        if table['dim'] != matrix.shape[1] or table['size'] > matrix.shape[0]:
+            raise ValueError(f"Index at {path} is corrupt: id table of {table['size']} rows of dim "
+                             f"{table['dim']} does not fit matrix of shape {matrix.shape}")
+        ids = table['ids'] + [None] * (matrix.shape[0] - len(table['ids']))
+        return cls(path, matrix, ids, table['size'])
+
+    def _stat_ids(self) -> float:
+        try:
+            return os.path.getmtime(os.path.join(self.path, IDS_FILE))
+        except OSError:
+            return 0.0
+
+    def refresh(self) -> 'CaseEmbeddingIndex':
+        """
+        Reload the index if another process has rewritten it since it was opened.
+        :return: The up-to-date index (``self`` when nothing changed).
+        """
+        if self._stat_ids() == self._ids_mtime:
+            return self
+        writable = self._matrix.mode != 'r'
+        return CaseEmbeddingIndex.open(self.path, writable=writable)
+
+    def save(self):
+        """Flush the matrix and atomically rewrite the id table."""
+        self._matrix.flush()
+        tmp_path = os.path.join(self.path, IDS_FILE + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'dim': self.dim, 'size': self._size, 'ids': self._ids[:self._size]}, f)
+        os.replace(tmp_path, os.path.join(self.path, IDS_FILE))
+        self._ids_mtime = self._stat_ids()
+
+    def _resize(self, capacity: int):
+        """Copy the live prefix into a larger memory-mapped file and swap it in."""
+        self._matrix = _publish_matrix(self.path, self._matrix[:self._size], capacity)
+        self._ids.extend([None] * (capacity - len(self._ids)))
+        live = np.zeros(capacity, dtype=bool)
+        live[:len(self._live)] = self._live
+        self._live = live
+
+    def add(self, case_id: str, embedding: np.ndarray):
+        """
+        Insert or replace the embedding of a single case.
+        :param case_id: Case identifier.
+        :param embedding: Pooled case embedding of length ``dim``.
+        """
+        vector = l2_normalize(embedding)
+        if vector.shape != (self.dim,):
+            raise ValueError(f"Expected embedding of shape ({self.dim},), got {vector.shape}")
+
+        row = self._rows.get(case_id)
+        if row is None:
+            if self._free:
+                row = self._free.pop()
+            else:
+                if self._size == self._matrix.shape[0]:
+                    self._resize(max(MIN_CAPACITY, self._matrix.shape[0] * 2))
+                row = self._size
+                self._size += 1
+            self._rows[case_id] = row
+            self._ids[row] = case_id
+            self._live[row] = True
+        self._matrix[row] = vector
+
+    def add_many(self, items: Dict[str, np.ndarray]):
+        """
+        Insert or replace several cases and persist the index once.
+        :param items: Mapping of case id to pooled embedding.
+        """
+        for case_id, embedding in items.items():
+            self.add(case_id, embedding)
+        self.save()
+
+    def remove(self, case_id: str) -> bool:
+        """
+        Remove a case from the index. The row is tombstoned and reused later.
+        :param case_id: Case identifier.
+        :return: True if the case was present.
+        """
+        row = self._rows.pop(case_id, None)
+        if row is None:
+            return False
+        self._ids[row] = None
+        self._live[row] = False
+        self._matrix[row] = 0.0
+        self._free.append(row)
+        return True
+
+    def compact(self):
+        """Rewrite the index without tombstoned rows."""
+        order = sorted(self._rows.values())
+        capacity = max(MIN_CAPACITY, len(order))
+        matrix = _publish_matrix(self.path, self._matrix[order], capacity)
+        ids = [self._ids[row] for row in order] + [None] * (capacity - len(order))
+        self.__init__(self.path, matrix, ids, len(order))
+        self.save()
+
+    def search(self, query: np.ndarray, k: int = 1) -> List[Tuple[str, float]]:
+        """
+        Rank cases by cosine similarity to the query embedding.
+        :param query: Pooled query embedding of length ``dim``.
+        :param k: Number of results to return.
+        :return: Up to ``k`` ``(case_id, similarity)`` pairs, best first.
+        """
+        if not self._rows:
+            return []
+        scores = np.asarray(self._matrix[:self._size] @ l2_normalize(query))
+        scores[~self._live[:self._size]] = -np.inf
+        return [(self._ids[row], score) for row, score in top_k(scores, k)]
+
+
+def _publish_matrix(path: str, rows: np.ndarray, capacity: int) -> np.ndarray:
+    """
+    Write a matrix of `capacity` rows, starting with `rows`, to a temporary file
+    and rename it over the index matrix, so a process that has the old file
+    mapped keeps reading valid pages instead of faulting on a truncated file.
+    :param path: Index directory.
+    :param rows: Rows to copy into the start of the new matrix.
+    :param capacity: Total rows of the new matrix.
+    :return: The published matrix, memory-mapped read-write.
+    """
+    tmp_path = os.path.join(path, EMBEDDINGS_FILE + '.tmp')
+    matrix = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32,
+                                       shape=(capacity, rows.shape[1]))
+    matrix[:len(rows)] = rows
+    matrix.flush()
+    del matrix
+    os.replace(tmp_path, os.path.join(path, EMBEDDINGS_FILE))
+    return np.load(os.path.join(path, EMBEDDINGS_FILE), mmap_mode='r+')
+
+
+def build_case_index(path: str, case_database: Dict[str, str],
+                     embed_batch: Callable[[List[str]], List[Optional[np.ndarray]]],
+                     batch_size: int = 64) -> CaseEmbeddingIndex:
+    """
+    Build a fresh index from a mapping of case id to case text. Run offline:
+    this is the only place where every case goes through the model.
+    The index is built in a sibling staging directory and its files are then
+    moved into `path` (matrix first, id table last), so workers serving an
+    existing index there keep using it until the new one is complete.
+    :param path: Directory to write the index to.
+    :param case_database: Mapping of case id to case text.
+    :param embed_batch: Function returning the pooled embedding of each of a
+                        list of texts (None for an empty text). It must embed
+                        cases the way documents are embedded, so their vectors
+                        are comparable.
+    :param batch_size: Cases embedded per call.
+    :return: The built index.
+    """
+    staging = path.rstrip(os.sep) + '.building'
+    shutil.rmtree(staging, ignore_errors=True)
+    index = None
+    case_ids = list(case_database)
+    for start in range(0, len(case_ids), batch_size):
+        batch = case_ids[start:start + batch_size]
+        for case_id, embedding in zip(batch, embed_batch([case_database[case_id] for case_id in batch])):
+            if embedding is None:
+                logging.warning("Case %s has no text to embed; skipping it", case_id)
+                continue
+            if index is None:
+                index = CaseEmbeddingIndex.create(staging, dim=len(embedding),
+                                                  capacity=max(MIN_CAPACITY, len(case_database)))
+            index.add(case_id, embedding)
+        logging.info("Embedded %d/%d cases", min(start + batch_size, len(case_ids)), len(case_ids))
+    if index is None:
+        index = CaseEmbeddingIndex.create(staging)
+    index.save()
+    del index
+
+    os.makedirs(path, exist_ok=True)
+    os.replace(os.path.join(staging, EMBEDDINGS_FILE), os.path.join(path, EMBEDDINGS_FILE))
+    os.replace(os.path.join(staging, IDS_FILE), os.path.join(path, IDS_FILE))
+    shutil.rmtree(staging, ignore_errors=True)
+    index = CaseEmbeddingIndex.open(path, writable=True)
+    logging.info("Built case index with %d cases at %s", len(index), path)
+    return index
+
+
+if __name__ == '__main__':
+    # Usage: python -m blueprints.nlp.case_index <cases.json> <index_dir>
+    # where cases.json maps case id to case text.
+    # Cases are embedded like documents (token-weighted mean over windows).
+    from blueprints.nlp.ai_engine import embed_documents
+
+    with open(sys.argv[1], 'r', encoding='utf-8') as cases_file:
+        cases = json.load(cases_file)
+    build_case_index(sys.argv[2], cases, embed_documents)
@@ -0,0 +1,143 @@
+"""Streaming token-window chunking and aggregation for long documents."""
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, List, Optional
+import numpy as np
+
+DEFAULT_SEGMENT_CHARS = 20000
+
+
+@dataclass
+class Chunk:
+    """A window of token ids and the character span of the text it covers."""
+    index: int
+    token_ids: List[int]
+    start_char: int
+    end_char: int
+
+
+def iter_segments(text: str, size: int = DEFAULT_SEGMENT_CHARS) -> Iterator[str]:
+    """
+    Split a text into pieces of about ``size`` characters, cutting at whitespace,
+    so no single tokenizer call has to hold the whole document.
+    :param text: Full text.
+    :param size: Target segment length in characters.
+    :return: Iterator of consecutive segments that concatenate back to ``text``.
+    """
+    start = 0
+    while start < len(text):
+        end = min(start + size, len(text))
+        if end < len(text):
+            cut = text.rfind(' ', start, end)
+            if cut > start:
+                end = cut + 1
+        yield text[start:end]
+        start = end
+
+
+def iter_token_windows(segments: Iterable[str], tokenizer, window: int,
+                       overlap: int = 64) -> Iterator[Chunk]:
+    """
+    Tokenize text segments as they arrive and yield fixed-size token windows.
+    Consecutive windows share ``overlap`` tokens so passages that straddle a
+    boundary are still seen whole by one window. Only the current window's
+    tokens and one segment's worth of tokens are held at a time.
+    :param segments: Iterable of consecutive text pieces (pages, paragraphs, ...).
+    :param tokenizer: Fast Hugging Face tokenizer (needs offset mappings).
+    :param window: Tokens per window, excluding special tokens.
+    :param overlap: Tokens shared by consecutive windows.
+    :return: Iterator of chunks.
+    """
+    if not 0 <= overlap < window:
+        raise ValueError(f"overlap must be in [0, {window}), got {overlap}")
+    ids, starts, ends = [], [], []
+    base = 0
+    index = 0
+    for segment in segments:
+        encoding = tokenizer(segment, add_special_tokens=False, return_offsets_mapping=True)
+        ids.extend(encoding['input_ids'])
+        starts.extend(base + start for start, _ in encoding['offset_mapping'])
+        ends.extend(base + end for _, end in encoding['offset_mapping'])
+        base += len(segment)
+        while len(ids) >= window:
+            yield Chunk(index, ids[:window], starts[0], ends[window - 1])
+            index += 1
+            del ids[:window - overlap], starts[:window - overlap], ends[:window - overlap]
+    if ids and (index == 0 or len(ids) > overlap):
+        yield Chunk(index, ids, starts[0], ends[-1])
+
+
+class DocumentEmbedding:
+    """
+    Running aggregate of chunk embeddings.
+
+    The document vector is the token-count-weighted mean of the chunk vectors,
+    maintained incrementally so chunks can be discarded after they are added.
+    Chunk vectors (and spans) are kept for passage-level matching unless
+    ``keep_chunks`` is off, in which case memory stays constant.
+    """
+
+    def __init__(self, keep_chunks: bool = True):
+        self.keep_chunks = keep_chunks
+        self.chunks: List[Chunk] = []
+        self.num_chunks = 0
+        self._chunk_vectors: List[np.ndarray] = []
+        self._sum: Optional[np.ndarray] = None
+        self._weight = 0
+
+    def add(self, chunks: List[Chunk], vectors: np.ndarray):
+        """
+        Fold a batch of embedded chunks into the aggregate.
+        :param chunks: The chunks that were embedded.
+        :param vectors: Their pooled embeddings, shape (len(chunks), dim).
+        """
+        weights = np.array([len(chunk.token_ids) for chunk in chunks], dtype=np.float32)
+        weighted = (vectors * weights[:, np.newaxis]).sum(axis=0)
+        self._sum = weighted if self._sum is None else self._sum + weighted
+        self._weight += float(weights.sum())
+        self.num_chunks += len(chunks)
+        if self.keep_chunks:
+            for chunk, vector in zip(chunks, vectors):
+                # Token ids are not needed once the chunk is embedded
+                self.chunks.append(Chunk(chunk.index, [], chunk.start_char, chunk.end_char))
+                self._chunk_vectors.append(np.asarray(vector, dtype=np.float32))
+
+    @property
+    def vector(self) -> Optional[np.ndarray]:
+        """The pooled document vector, or None for an empty document."""
+        if self._sum is None:
+            return None
+        return self._sum / self._weight
+
+    @property
+    def chunk_vectors(self) -> np.ndarray:
+        """Per-chunk embeddings as a (chunks, dim) matrix."""
+        if not self._chunk_vectors:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.stack(self._chunk_vectors)
+
+
+def embed_document_stream(segments: Iterable[str], tokenizer,
+                          embed_windows: Callable[[List[List[int]]], np.ndarray],
+                          window: int, overlap: int = 64, batch_size: int = 16,
+                          keep_chunks: bool = True) -> DocumentEmbedding:
+    """
+    Chunk a document as it streams in and embed the chunks in batches.
+    :param segments: Iterable of consecutive text pieces.
+    :param tokenizer: Fast Hugging Face tokenizer.
+    :param embed_windows: Embeds a batch of token-id windows, returning (batch, dim).
+    :param window: Tokens per window, excluding special tokens.
+    :param overlap: Tokens shared by consecutive windows.
+    :param batch_size: Windows per forward pass.
+    :param keep_chunks: Keep per-chunk vectors for passage-level matching.
+    :return: The aggregated document embedding.
+    """
+    document = DocumentEmbedding(keep_chunks=keep_chunks)
+    batch: List[Chunk] = []
+    for chunk in iter_token_windows(segments, tokenizer, window, overlap):
+        batch.append(chunk)
+        if len(batch) == batch_size:
+            document.add(batch, embed_windows([c.token_ids for c in batch]))
+            batch = []
+    if batch:
+        document.add(batch, embed_windows([c.token_ids for c in batch]))
+    return document
@@ -0,0 +1,182 @@
+"""Streaming, page-parallel text extraction from uploaded documents."""
+import os
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterator, List, Optional, Tuple
+
+# PDFs with at least this many pages (in the requested range) are extracted in a process pool
+PARALLEL_PAGE_THRESHOLD = int(os.getenv('PDF_PARALLEL_PAGE_THRESHOLD', '50'))
+# Size of the process pool shared by every extraction in this process
+PDF_EXTRACT_WORKERS = int(os.getenv('PDF_EXTRACT_WORKERS', str(min(4, os.cpu_count() or 1))))
+# Minimum pages handed to a pool worker per task; each task re-opens the PDF,
+# so ranges are split into about two blocks per worker
+MIN_PAGES_PER_TASK = 16
+# DOCX has no pages; paragraphs are yielded in groups of this size instead
+DOCX_PARAGRAPHS_PER_PAGE = 50
+
+PageRange = Tuple[int, int]
+
+
+def count_pdf_pages(file_path: str) -> int:
+    """
+    Number of pages in a PDF.
+    :param file_path: Path to the PDF.
+    :return: Page count.
+    """
+    from PyPDF2 import PdfReader
+    with open(file_path, 'rb') as f:
+        return len(PdfReader(f).pages)
+
+
+def _resolve_range(num_pages: int, page_range: Optional[PageRange]) -> PageRange:
+    """Clamp a (start, stop) page range, zero-based and stop-exclusive, to the document."""
+    if page_range is None:
+        return 0, num_pages
+    start, stop = page_range
+    return max(0, start), min(num_pages, stop)
+
+
+def _extract_pages(file_path: str, start: int, stop: int) -> List[str]:
+    """Extract pages [start, stop) of a PDF. Runs in a pool worker for large files."""
+    from PyPDF2 import PdfReader
+    with open(file_path, 'rb') as f:
+        reader = PdfReader(f)
+        return [reader.pages[number].extract_text() or '' for number in range(start, stop)]
+
+
+def _can_fork() -> bool:
+    """Daemonic processes (e.g. Celery prefork pool workers) cannot start a process pool."""
+    return not multiprocessing.current_process().daemon
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+
+
+def _after_fork_in_child():
+    """A forked child must not use its parent's pool or a lock another thread held."""
+    global _pool_lock
+    _pool_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def _pool_context():
+    """
+    Start workers with forkserver (or spawn) rather than fork: the caller has
+    batcher and stage threads that may hold locks a forked child would inherit.
+    The fork server belongs to the process that started it, so a child forked
+    after its parent created a pool uses spawn.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    inherited = _pool_pid is not None and _pool_pid != os.getpid()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods and not inherited else 'spawn')
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    """
+    The extraction pool of this process, created on first use. It is shared
+    by concurrent extractions, so N simultaneous uploads queue on
+    PDF_EXTRACT_WORKERS processes instead of starting N pools, and workers are
+    started once rather than per document. A forked child (e.g. a gunicorn
+    worker) gets a pool of its own.
+    """
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(max_workers=PDF_EXTRACT_WORKERS, mp_context=_pool_context())
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _reset_pool():
+    """Drop a broken pool so the next extraction starts a fresh one."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def iter_pdf_pages(file_path: str, page_range: Optional[PageRange] = None,
+                   workers: Optional[int] = None,
+                   parallel_threshold: int = PARALLEL_PAGE_THRESHOLD) -> Iterator[str]:
+    """
+    Yield the text of each PDF page, in order.
+    Small ranges are read sequentially with a single reader; large ranges are
+    split into page blocks extracted in the shared process pool, and yielded
+    as each block completes in order. If the pool breaks, the remaining pages
+    are read sequentially.
+    :param file_path: Path to the PDF.
+    :param page_range: Optional zero-based (start, stop) range, stop exclusive.
+    :param workers: Workers to split the range across (default: the pool size; 1 disables the pool).
+    :param parallel_threshold: Minimum pages in range to use the pool.
+    :return: Iterator of page texts.
+    """
+    from PyPDF2 import PdfReader
+
+    workers = workers or PDF_EXTRACT_WORKERS
+    with open(file_path, 'rb') as f:
+        reader = PdfReader(f)
+        start, stop = _resolve_range(len(reader.pages), page_range)
+        if stop - start < parallel_threshold or workers <= 1 or not _can_fork():
+            for number in range(start, stop):
+                yield reader.pages[number].extract_text() or ''
+            return
+
+    block_size = max(MIN_PAGES_PER_TASK, -(-(stop - start) // (2 * workers)))
+    blocks = [(block, min(block + block_size, stop)) for block in range(start, stop, block_size)]
+    done = start
+    try:
+        futures = [_get_pool().submit(_extract_pages, file_path, block_start, block_stop)
+                   for block_start, block_stop in blocks]
+        try:
+            for future, (_, block_stop) in zip(futures, blocks):
+                pages = future.result()
+                done = block_stop
+                yield from pages
+        finally:
+            # Abandoned (or failed) extractions do not keep the pool busy
+            for future in futures:
+                future.cancel()
+    except BrokenProcessPool as e:
+        logging.error("PDF extraction pool broke on %s, reading sequentially: %s", file_path, str(e))
+        _reset_pool()
+        yield from _extract_pages(file_path, done, stop)
+
+
+def iter_docx_pages(file_path: str, page_range: Optional[PageRange] = None) -> Iterator[str]:
+    """
+    Yield a DOCX file's text in groups of DOCX_PARAGRAPHS_PER_PAGE paragraphs.
+    :param file_path: Path to the DOCX.
+    :param page_range: Optional zero-based (start, stop) range over those groups.
+    :return: Iterator of paragraph-group texts.
+    """
+    from docx import Document
+    paragraphs = Document(file_path).paragraphs
+    num_pages = -(-len(paragraphs) // DOCX_PARAGRAPHS_PER_PAGE)
+    start, stop = _resolve_range(num_pages, page_range)
+    for number in range(start, stop):
+        group = paragraphs[number * DOCX_PARAGRAPHS_PER_PAGE:(number + 1) * DOCX_PARAGRAPHS_PER_PAGE]
+        yield '\n'.join(para.text for para in group)
+
+
+def iter_document_pages(file_path: str, page_range: Optional[PageRange] = None) -> Iterator[str]:
+    """
+    Yield a document's text page by page (PDF or DOCX).
+    :param file_path: Path to the document.
+    :param page_range: Optional zero-based (start, stop) page range, stop exclusive.
+    :return: Iterator of page texts.
+    """
+    if file_path.endswith('.pdf'):
+        return iter_pdf_pages(file_path, page_range)
+    if file_path.endswith('.docx'):
+        return iter_docx_pages(file_path, page_range)
+    logging.error("Unsupported file format: %s", file_path)
+    raise ValueError(f"Unsupported file format: {file_path}")
@@ -0,0 +1,100 @@
+"""Registry of lazily loaded NLP models."""
+import gc
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+
+class ModelRegistry:
+    """
+    Holds a loader per model name and builds each model on first use.
+
+    Loading happens at most once per process, under a per-model lock, so
+    concurrent requests that race on a cold model wait for the same load
+    instead of building duplicates.
+    """
+
+    def __init__(self):
+        self._loaders: Dict[str, Callable[[], Any]] = {}
+        self._models: Dict[str, Any] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._load_times: Dict[str, float] = {}
+
+    def register(self, name: str, loader: Callable[[], Any]):
+        """
+        Register a loader. Nothing is loaded until ``get`` is called.
+        :param name: Model name.
+        :param loader: Zero-argument callable returning the model.
+        """
+        self._loaders[name] = loader
+        self._locks[name] = threading.Lock()
+
+    def get(self, name: str) -> Any:
+        """
+        Return a model, loading it on first use.
+        :param name: Model name.
+        :return: The loaded model.
+        """
+        try:
+            return self._models[name]
+        except KeyError:
+            pass
+        if name not in self._loaders:
+            raise KeyError(f"No model registered under {name!r}")
+        with self._locks[name]:
+            if name not in self._models:
+                start = time.perf_counter()
+                self._models[name] = self._loaders[name]()
+                self._load_times[name] = time.perf_counter() - start
+                logging.info("Loaded model %s in %.2fs", name, self._load_times[name])
+        return self._models[name]
+
+    def set(self, name: str, model: Any):
+        """
+        Replace a loaded model, e.g. after reloading it from disk.
+        :param name: Model name.
+        :param model: The new model.
+        """
+        self._models[name] = model
+
+    def registered(self) -> List[str]:
+        """Names of every registered model, loaded or not."""
+        return list(self._loaders)
+
+    def is_loaded(self, name: str) -> bool:
+        """Whether a model has been loaded in this process."""
+        return name in self._models
+
+    def loaded(self) -> List[str]:
+        """Names of the models loaded in this process."""
+        return list(self._models)
+
+    def load_times(self) -> Dict[str, float]:
+        """Seconds spent loading each loaded model."""
+        return dict(self._load_times)
+
+    def unload(self, name: Optional[str] = None):
+        """
+        Drop a loaded model (or all of them) so the next ``get`` reloads it.
+        :param name: Model name, or None for every model.
+        """
+        if name is None:
+            self._models.clear()
+        else:
+            self._models.pop(name, None)
+
+    def warm_up(self, names: Optional[Iterable[str]] = None, freeze: bool = True):
+        """
+        Load models eagerly. Call this in the parent of a pre-fork server
+        (gunicorn --preload, the Celery prefork master) so the children share
+        the loaded pages copy-on-write instead of each loading its own copy.
+        :param names: Models to load, or None for every registered model.
+        :param freeze: Move everything allocated so far into the permanent GC
+            generation, so garbage collection in the children does not touch
+            (and therefore copy) the model pages.
+        """
+        for name in names if names is not None else list(self._loaders):
+            self.get(name)
+        if freeze:
+            gc.freeze()
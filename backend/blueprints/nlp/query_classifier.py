@@ -0,0 +1,219 @@
+"""Linear query classifier over hashed n-gram features, trained offline and memory-mapped."""
+import os
+import re
+import json
+import logging
+import argparse
+from typing import Any, Dict, List, Sequence, Tuple
+import numpy as np
+
+WEIGHTS_FILE = 'weights.npy'
+META_FILE = 'classifier.json'
+# Hashed feature space; 2**18 features x 3 labels is 3 MiB of float32 weights
+DEFAULT_N_FEATURES = 2 ** 18
+DEFAULT_NGRAM_RANGE = (1, 2)
+# Words of two or more characters, as scikit-learn's text vectorizers split them
+TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+
+# Used when no trained classifier has been built, so classification keeps
+# working (coarsely) in development
+SEED_EXAMPLES = [
+    ("breach of contract", "contract"),
+    ("legal precedent", "case_law"),
+    ("statute", "statute"),
+]
+
+
+def hash_features(text: str, n_features: int = DEFAULT_N_FEATURES,
+                  ngram_range: Tuple[int, int] = DEFAULT_NGRAM_RANGE) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Hash the word n-grams of a text into an L2-normalized sparse feature row.
+    The features are identical to scikit-learn's HashingVectorizer with
+    alternate_sign=False, without its per-call overhead (about 20us instead
+    of 400us per query). There is no fitted vocabulary, so the weights file
+    is the whole model.
+    :param text: Input text.
+    :param n_features: Size of the hashed feature space.
+    :param ngram_range: Word n-gram sizes to hash.
+    :return: Feature indices and their values.
+    """
+    from sklearn.utils import murmurhash3_32
+
+    tokens = TOKEN_PATTERN.findall(text.lower())
+    counts: Dict[int, int] = {}
+    for size in range(ngram_range[0], ngram_range[1] + 1):
+        for start in range(len(tokens) - size + 1):
+            digest = murmurhash3_32(' '.join(tokens[start:start + size]), 0)
+            index = (2147483647 - (n_features - 1)) % n_features if digest == -2147483648 \
+                else abs(digest) % n_features
+            counts[index] = counts.get(index, 0) + 1
+    indices = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+    values = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+    if len(values):
+        values /= np.linalg.norm(values)
+    return indices, values
+
+
+def hash_feature_matrix(texts: Sequence[str], n_features: int = DEFAULT_N_FEATURES,
+                        ngram_range: Tuple[int, int] = DEFAULT_NGRAM_RANGE):
+    """
+    Hashed features of several texts as a sparse CSR matrix, for training.
+    :param texts: Input texts.
+    :param n_features: Size of the hashed feature space.
+    :param ngram_range: Word n-gram sizes to hash.
+    :return: scipy.sparse.csr_matrix of shape (len(texts), n_features).
+    """
+    from scipy.sparse import csr_matrix
+
+    rows = [hash_features(text, n_features, ngram_range) for text in texts]
+    indptr = np.cumsum([0] + [len(indices) for indices, _ in rows])
+    indices = np.concatenate([indices for indices, _ in rows]) if rows else np.empty(0, dtype=np.int64)
+    values = np.concatenate([values for _, values in rows]) if rows else np.empty(0, dtype=np.float32)
+    return csr_matrix((values, indices, indptr), shape=(len(texts), n_features))
+
+
+class QueryClassifier:
+    """
+    A linear model stored as a (features, labels) float32 weight matrix in a
+    memory-mapped ``.npy`` file, with a JSON sidecar holding the labels,
+    intercepts and vectorizer settings.
+
+    Prediction hashes each text once and sums the weight rows of the features
+    that occur, so a query costs tens of microseconds, only those rows are
+    paged in, and forked workers share the weights through the OS page cache.
+    """
+
+    def __init__(self, weights: np.ndarray, intercept: np.ndarray, labels: Sequence[str],
+                 n_features: int = DEFAULT_N_FEATURES, ngram_range: Tuple[int, int] = DEFAULT_NGRAM_RANGE):
+        if weights.shape != (n_features, len(labels)):
+            raise ValueError(f"Expected weights of shape ({n_features}, {len(labels)}), got {weights.shape}")
+        self.weights = weights
+        self.intercept = np.asarray(intercept, dtype=np.float32)
+        self.labels = list(labels)
+        self.n_features = n_features
+        self.ngram_range = tuple(ngram_range)
+        self._labels = np.asarray(self.labels, dtype=object)
+
+    @classmethod
+    def open(cls, path: str) -> 'QueryClassifier':
+        """
+        Load a classifier written by ``save``; the weights are memory-mapped.
+        :param path: Directory holding the classifier files.
+        :return: The loaded classifier.
+        """
+        with open(os.path.join(path, META_FILE), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        weights = np.load(os.path.join(path, WEIGHTS_FILE), mmap_mode='r')
+        return cls(weights, np.asarray(meta['intercept'], dtype=np.float32), meta['labels'],
+                   n_features=meta['n_features'], ngram_range=tuple(meta['ngram_range']))
+
+    def save(self, path: str):
+        """
+        Write the classifier; the metadata is replaced last, atomically, so
+        readers never see new labels with old weights.
+        :param path: Directory to write to.
+        """
+        os.makedirs(path, exist_ok=True)
+        tmp_weights = os.path.join(path, WEIGHTS_FILE + '.tmp')
+        with open(tmp_weights, 'wb') as f:
+            np.save(f, np.ascontiguousarray(self.weights, dtype=np.float32))
+        os.replace(tmp_weights, os.path.join(path, WEIGHTS_FILE))
+        tmp_meta = os.path.join(path, META_FILE + '.tmp')
+        with open(tmp_meta, 'w', encoding='utf-8') as f:
+            json.dump({'labels': self.labels, 'intercept': self.intercept.tolist(),
+                       'n_features': self.n_features, 'ngram_range': list(self.ngram_range)}, f)
+        os.replace(tmp_meta, os.path.join(path, META_FILE))
+
+    def decision_function(self, texts: Sequence[str]) -> np.ndarray:
+        """
+        Score every text against every label.
+        :param texts: Preprocessed texts.
+        :return: Scores of shape (len(texts), len(labels)).
+        """
+        scores = np.empty((len(texts), len(self.labels)), dtype=np.float32)
+        for row, text in enumerate(texts):
+            indices, values = hash_features(text, self.n_features, self.ngram_range)
+            scores[row] = values @ self.weights[indices] + self.intercept
+        return scores
+
+    def predict(self, texts: Sequence[str]) -> List[str]:
+        """
+        Classify texts in a single vectorize-and-score pass.
+        :param texts: Preprocessed texts.
+        :return: One label per text.
+        """
+        if not texts:
+            return []
+        return self._labels[np.argmax(self.decision_function(texts), axis=1)].tolist()
+
+
+def train_query_classifier(texts: Sequence[str], labels: Sequence[str],
+                           n_features: int = DEFAULT_N_FEATURES,
+                           ngram_range: Tuple[int, int] = DEFAULT_NGRAM_RANGE,
+                           alpha: float = 1e-5, epochs: int = 20, seed: int = 0) -> QueryClassifier:
+    """
+    Fit a logistic-loss linear model with SGD over hashed features.
+    :param texts: Training texts, preprocessed like the queries they will classify.
+    :param labels: One label per text; at least two distinct labels.
+    :param n_features: Size of the hashed feature space.
+    :param ngram_range: Word n-gram sizes to hash.
+    :param alpha: L2 regularization strength.
+    :param epochs: Passes over the training data.
+    :param seed: Random seed for shuffling.
+    :return: The trained classifier, held in memory.
+    """
+    from sklearn.linear_model import SGDClassifier
+
+    features = hash_feature_matrix(texts, n_features, ngram_range)
+    model = SGDClassifier(loss='log_loss', alpha=alpha, max_iter=epochs, tol=None, random_state=seed)
+    model.fit(features, list(labels))
+
+    coef = model.coef_.astype(np.float32)
+    intercept = model.intercept_.astype(np.float32)
+    if len(model.classes_) == 2:
+        # Binary models have one score for the second class; give each label a column
+        coef = np.vstack([-coef, coef])
+        intercept = np.concatenate([-intercept, intercept])
+    return QueryClassifier(np.ascontiguousarray(coef.T), intercept, [str(label) for label in model.classes_],
+                           n_features=n_features, ngram_range=ngram_range)
+
+
+def load_training_data(path: str) -> Tuple[List[str], List[str]]:
+    """
+    Read labelled examples from a JSON list of {"text": ..., "label": ...}
+    objects, or JSON Lines with one such object per line.
+    :param path: Training data file.
+    :return: Texts and labels.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    try:
+        examples: List[Dict[str, Any]] = json.loads(content)
+    except json.JSONDecodeError:
+        examples = [json.loads(line) for line in content.splitlines() if line.strip()]
+    return [example['text'] for example in examples], [example['label'] for example in examples]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Train the query classifier offline and write it to a directory.")
+    parser.add_argument('training_data', help='JSON list or JSON Lines of {"text": ..., "label": ...}')
+    parser.add_argument('output_dir')
+    parser.add_argument('--n-features', type=int, default=DEFAULT_N_FEATURES)
+    parser.add_argument('--max-ngram', type=int, default=DEFAULT_NGRAM_RANGE[1])
+    parser.add_argument('--alpha', type=float, default=1e-5)
+    parser.add_argument('--epochs', type=int, default=20)
+    parser.add_argument('--raw', action='store_true',
+                        help='Texts are already preprocessed (skip spaCy lemmatization)')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    texts, labels = load_training_data(args.training_data)
+    if not args.raw:
+        from blueprints.nlp.ai_engine import preprocess_queries
+        texts = preprocess_queries(texts)
+    classifier = train_query_classifier(texts, labels, n_features=args.n_features,
+                                        ngram_range=(1, args.max_ngram), alpha=args.alpha, epochs=args.epochs)
+    classifier.save(args.output_dir)
+    accuracy = float(np.mean(np.asarray(classifier.predict(texts)) == np.asarray(labels)))
+    logging.info("Trained query classifier on %d examples (%d labels, training accuracy %.3f) at %s",
+                 len(texts), len(classifier.labels), accuracy, args.output_dir)
@@ -1,13 +1,59 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required
-from blueprints.nlp.ai_engine import process_query
+import logging
+from flask import Blueprint, request, jsonify, url_for
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from blueprints.nlp.ai_engine import validate_query_input
+from services.async_tasks import submit_query_job, query_job_status
 
 nlp_bp = Blueprint('nlp', __name__)
 
+# Seconds clients are asked to wait between polls of a running job
+QUERY_POLL_INTERVAL = 1
+
 @nlp_bp.route('/query', methods=['POST'])
 @jwt_required()
 def handle_query():
-    data = request.get_json()
+    """
+    Submit a legal query. The answer is computed by a Celery worker; poll the
+    returned Location until the job is done. Resubmitting a query that is still
+    being answered returns the same job.
+    """
+    data = request.get_json(silent=True) or {}
     query = data.get('query')
-    result = process_query(query)
-    return jsonify(result), 200
+    if not isinstance(query, str) or not query.strip():
+        return jsonify({"error": "Query is required"}), 400
+    if not validate_query_input(query):
+        return jsonify({"error": "Invalid query format detected."}), 400
+
+    try:
+        job_id, deduplicated = submit_query_job(query, get_jwt_identity())
+    except Exception as e:
+        logging.error("Failed to submit query: %s", str(e))
+        return jsonify({"error": "Query service is unavailable. Please try again later."}), 503
+
+    response = jsonify({"job_id": job_id, "status": "queued", "deduplicated": deduplicated})
+    response.headers['Location'] = url_for('nlp.query_status', job_id=job_id)
+    response.headers['Retry-After'] = str(QUERY_POLL_INTERVAL)
+    return response, 202
+
+@nlp_bp.route('/query/<job_id>', methods=['GET'])
+@jwt_required()
+def query_status(job_id):
+    """
+    Status of a submitted query: 200 with the result once done, 202 while it
+    is queued or running, 404 for unknown or expired jobs.
+    """
+    try:
+        status = query_job_status(job_id, get_jwt_identity())
+    except Exception as e:
+        logging.error("Failed to read status of query job %s: %s", job_id, str(e))
+        return jsonify({"error": "Query service is unavailable. Please try again later."}), 503
+    if status is None:
+        return jsonify({"error": "Query job not found"}), 404
+
+    if status["status"] == 'done':
+        return jsonify(status), 200
+    if status["status"] == 'failed':
+        return jsonify(status), 500
+    response = jsonify(status)
+    response.headers['Retry-After'] = str(QUERY_POLL_INTERVAL)
+    return response, 202
@@ -0,0 +1,96 @@
+"""Vectorized embedding pooling, cosine similarity and top-k ranking."""
+from typing import List, Tuple
+import numpy as np
+
+POOLING_STRATEGIES = ('mean', 'cls')
+
+
+def pool_embeddings(token_embeddings, strategy: str = 'mean') -> np.ndarray:
+    """
+    Pool per-token embeddings into a single document vector.
+    :param token_embeddings: Array-like of shape (tokens, dim), or the raw
+        feature-extraction pipeline output of shape (1, tokens, dim).
+    :param strategy: 'mean' averages all tokens, 'cls' takes the first ([CLS]) token.
+    :return: float32 vector of shape (dim,).
+    """
+    tokens = np.asarray(token_embeddings, dtype=np.float32)
+    if tokens.ndim == 3:
+        tokens = tokens[0]
+    if tokens.ndim != 2:
+        raise ValueError(f"Expected token embeddings of shape (tokens, dim), got {tokens.shape}")
+    if strategy == 'mean':
+        return tokens.mean(axis=0)
+    if strategy == 'cls':
+        return tokens[0].copy()
+    raise ValueError(f"Unknown pooling strategy {strategy!r}; expected one of {POOLING_STRATEGIES}")
+
+
+def pool_batch(hidden_states, attention_mask, strategy: str = 'mean') -> np.ndarray:
+    """
+    Pool a padded batch of token embeddings, ignoring padding positions.
+    :param hidden_states: Array-like of shape (batch, tokens, dim).
+    :param attention_mask: Array-like of shape (batch, tokens), 1 for real tokens.
+    :param strategy: 'mean' averages the real tokens, 'cls' takes the first token.
+    :return: float32 matrix of shape (batch, dim).
+    """
+    hidden_states = np.asarray(hidden_states, dtype=np.float32)
+    if strategy == 'cls':
+        return hidden_states[:, 0].copy()
+    if strategy != 'mean':
+        raise ValueError(f"Unknown pooling strategy {strategy!r}; expected one of {POOLING_STRATEGIES}")
+    mask = np.asarray(attention_mask, dtype=np.float32)[:, :, np.newaxis]
+    counts = np.maximum(mask.sum(axis=1), 1.0)
+    return (hidden_states * mask).sum(axis=1) / counts
+
+
+def l2_normalize(vectors) -> np.ndarray:
+    """
+    L2-normalize a vector, or each row of a matrix. Zero vectors are left as zeros.
+    :param vectors: Array-like of shape (dim,) or (n, dim).
+    :return: float32 array of the same shape with unit-length rows.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def cosine_scores(query, candidates, normalized: bool = False) -> np.ndarray:
+    """
+    Score one query against N candidates with a single matrix-vector product.
+    :param query: Vector of shape (dim,).
+    :param candidates: Matrix of shape (n, dim).
+    :param normalized: Set when both inputs are already L2-normalized.
+    :return: float32 array of n cosine similarities.
+    """
+    if not normalized:
+        query = l2_normalize(query)
+        candidates = l2_normalize(candidates)
+    return np.asarray(candidates @ query, dtype=np.float32)
+
+
+def top_k(scores: np.ndarray, k: int) -> List[Tuple[int, float]]:
+    """
+    Select the k highest scores in O(n) with argpartition, then sort only those.
+    :param scores: 1-D array of scores; -inf entries are never returned.
+    :param k: Number of results to return.
+    :return: Up to k ``(index, score)`` pairs, best first.
+    """
+    k = min(k, int(np.isfinite(scores).sum()))
+    if k <= 0:
+        return []
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top], kind='stable')]
+    return [(int(i), float(scores[i])) for i in top]
+
+
+def rank(query, candidates, k: int = 1, normalized: bool = False) -> List[Tuple[int, float]]:
+    """
+    Rank candidates by cosine similarity to the query.
+    :param query: Vector of shape (dim,).
+    :param candidates: Matrix of shape (n, dim).
+    :param k: Number of results to return.
+    :param normalized: Set when both inputs are already L2-normalized.
+    :return: Up to k ``(index, score)`` pairs, best first.
+    """
+    return top_k(cosine_scores(query, candidates, normalized=normalized), k)
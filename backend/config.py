@@ -17,6 +17,15 @@ class Config:
     REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
     CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379/1')
     CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND', 'redis://localhost:6379/2')
+    # Largest accepted request body; uploads are streamed into the store in chunks
+    MAX_CONTENT_LENGTH = int(os.getenv('MAX_UPLOAD_BYTES', str(100 * 1024 * 1024)))
+    # When set (e.g. '/protected-uploads/'), downloads are answered with an
+    # X-Accel-Redirect to this internal location and nginx serves the bytes
+    DOWNLOAD_ACCEL_REDIRECT_PREFIX = os.getenv('DOWNLOAD_ACCEL_REDIRECT_PREFIX')
+    # Bearer token required by /metrics; unset, /metrics is only served in debug and testing
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+    # Load NLP models in the parent process so pre-fork workers share them copy-on-write
+    PRELOAD_MODELS = os.getenv('PRELOAD_MODELS', 'False').lower() == 'true'
 
     # OAuth 2.0 configuration for Gmail authentication
     GOOGLE_CLIENT_ID = os.getenv('GOOGLE_CLIENT_ID')
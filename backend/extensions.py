@@ -2,7 +2,9 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
 from flask_migrate import Migrate
+from flask import session
 from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
 from flask_cors import CORS
 from flask_redis import FlaskRedis
 from celery import Celery
@@ -10,7 +12,7 @@ from celery import Celery
 db = SQLAlchemy()
 jwt = JWTManager()
 migrate = Migrate()
-limiter = Limiter(key_func=lambda: 'global')
+limiter = Limiter(key_func=lambda: str(session.get('user_id') or get_remote_address()))
 cors = CORS()
 redis_client = FlaskRedis()
 celery = Celery(__name__)
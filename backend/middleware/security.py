@@ -5,12 +5,14 @@ from flask import request, abort, session
 def validate_request(func):
     """
     Decorator to validate that the request is a JSON request.
+    Requests without a body (e.g. GET) and file uploads (multipart/form-data) are let through.
     :param func: The function to be decorated.
     :return: Decorated function.
     """
     @wraps(func)
     def decorated_function(*args, **kwargs):
-        if not request.is_json:
+        has_body = bool(request.content_length) or 'Transfer-Encoding' in request.headers
+        if has_body and not request.is_json and request.mimetype != 'multipart/form-data':
             abort(400, description="Request is not JSON")
         return func(*args, **kwargs)
     return decorated_function
@@ -1,9 +1,79 @@
 """Asynchronous tasks for processing documents and legal queries."""
+import os
+import uuid
+import hashlib
 import logging
-from extensions import celery, db
-from services.caching import cache_set
-from blueprints.documents.models import Document
-from blueprints.nlp.ai_engine import process_legal_query
+from typing import Any, Dict, List, Optional, Tuple
+from celery import chord, group
+from celery.result import AsyncResult
+from celery.signals import worker_init
+from config import Config
+from extensions import celery, db, redis_client
+from services.caching import cache_set, cache_get_many, cache_set_many, normalize_query
+from services.metrics import span
+from services.file_store import file_store
+import services.task_metrics  # noqa: F401 -- records run time and outcome of every task
+from blueprints.documents.models import Document, DocumentAnalysis
+from blueprints.nlp.ai_engine import (process_legal_query, preprocess_queries, analyze_documents,
+                                      analysis_version, warm_up_models)
+
+# Documents loaded, analyzed and written per chunk task of process_documents_batch
+DOCUMENT_BATCH_CHUNK_SIZE = int(os.getenv('DOCUMENT_BATCH_CHUNK_SIZE', '100'))
+# How long batch progress is kept in Redis
+DOCUMENT_BATCH_TTL = int(os.getenv('DOCUMENT_BATCH_TTL', str(7 * 86400)))
+# How long a query job can be polled; keep in line with Celery's result_expires (1 day)
+QUERY_JOB_TTL = int(os.getenv('QUERY_JOB_TTL', '86400'))
+# Upper bound on how long a query stays marked in flight if its worker dies
+# without clearing it (the task itself may retry for a few minutes)
+QUERY_JOB_DEDUP_TTL = int(os.getenv('QUERY_JOB_DEDUP_TTL', '600'))
+
+# Deletes the in-flight marker only if it still names this job
+RELEASE_QUERY_JOB_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+@worker_init.connect
+def preload_models(**kwargs):
+    """
+    Load NLP models in the Celery master before the prefork pool starts,
+    so pool processes share them instead of each loading a copy.
+    """
+    if Config.PRELOAD_MODELS:
+        warm_up_models()
+
+def _save_analyses(analyses: Dict[str, Dict[str, Any]]) -> int:
+    """
+    Insert or update the DocumentAnalysis rows of several documents for the
+    current model version, with one lookup, bulk writes and one commit.
+    :param analyses: Dict of document ID to analyze_documents result.
+    :return: Number of rows written.
+    """
+    version = analysis_version()
+    existing = dict(db.session.query(DocumentAnalysis.document_id, DocumentAnalysis.id)
+                    .filter(DocumentAnalysis.document_id.in_(list(analyses)),
+                            DocumentAnalysis.model_version == version)
+                    .all())
+    inserts, updates = [], []
+    for document_id, analysis in analyses.items():
+        row = {
+            "document_id": document_id,
+            "model_version": version,
+            "text_hash": analysis["text_hash"],
+            "embedding": DocumentAnalysis.encode_embedding(analysis["embedding"]),
+            "classification": analysis["classification"],
+            "linked_cases": analysis["linked_cases"],
+        }
+        if document_id in existing:
+            updates.append(dict(row, id=existing[document_id]))
+        else:
+            inserts.append(row)
+    db.session.bulk_insert_mappings(DocumentAnalysis, inserts)
+    db.session.bulk_update_mappings(DocumentAnalysis, updates)
+    db.session.commit()
+    return len(inserts) + len(updates)
 
 @celery.task(bind=True)
 def process_document_async(self, document_id):
@@ -19,26 +89,29 @@ def process_document_async(self, document_id):
             logging.error("Document with ID %s not found.", document_id)
             return
 
-        # Process the document content
-        # (e.g., extract text, link to legal cases, etc.)
-        # Example: assuming `process_legal_query` can also process documents.
-        result = process_legal_query(document.content)
+        # Extract text, classify, embed and link to legal cases.
+        # Extraction is cached by file content, so re-runs skip parsing.
+        analysis = analyze_documents([document.stored_path])[0]
+        if "error" in analysis:
+            logging.error("Document with ID %s could not be analyzed: %s", document_id, analysis["error"])
+            return
 
-        # Save the processed result back to the database or another storage
-        document.processed_data = result  # Assuming Document model has a processed_data field
-        db.session.commit()
+        # Save the analysis so the NLP path can reuse it instead of recomputing
+        _save_analyses({document_id: analysis})
         logging.info("Document with ID %s processed successfully.", document_id)
 
     except Exception as e:
-        logging.error("Failed to process document with ID %s: {str(e)}", document_id)
+        logging.error("Failed to process document with ID %s: %s", document_id, str(e))
+        db.session.rollback()
         self.retry(exc=e, countdown=60, max_retries=3)
 
-@celery.task(bind=True)
-def process_query_async(self, query, user_id):
+@celery.task(bind=True, track_started=True)
+def process_query_async(self, query, user_id, inflight_key=None):
     """
     Asynchronously processes a legal query.
     :param query: The query string to be processed.
     :param user_id: The ID of the user who submitted the query.
+    :param inflight_key: Marker set by submit_query_job, cleared once the query is answered.
     :return: Result of the query processing.
     """
     try:
@@ -50,9 +123,240 @@ def process_query_async(self, query, user_id):
         cache_key = f"user:{user_id}:query:{query}"
         cache_set(cache_key, result, timeout=600)  # Cache for 10 minutes
 
-        logging.info("Query processed successfully for user {user_id}.")
+        logging.info("Query processed successfully for user %s.", user_id)
+        if inflight_key:
+            _release_query_job(inflight_key, self.request.id)
         return result
 
     except Exception as e:
-        logging.error("Failed to process query for user {user_id}: {str(e)}")
+        logging.error("Failed to process query for user %s: %s", user_id, str(e))
+        if inflight_key and self.request.retries >= 3:
+            _release_query_job(inflight_key, self.request.id)
+        self.retry(exc=e, countdown=60, max_retries=3)
+
+def _query_inflight_key(query: str, user_id) -> str:
+    # Per user, since the answer depends on the user's recent queries
+    digest = hashlib.sha256(normalize_query(query).encode('utf-8')).hexdigest()
+    return f"nlp:query:inflight:{user_id}:{digest}"
+
+def _query_owner_key(job_id: str) -> str:
+    return f"nlp:query:job:{job_id}"
+
+_release_script = None
+
+def _release_query_job(inflight_key: str, job_id: str):
+    """Clear the in-flight marker of a finished query job, unless another job has taken it over."""
+    global _release_script
+    try:
+        if _release_script is None:
+            _release_script = redis_client.register_script(RELEASE_QUERY_JOB_SCRIPT)
+        _release_script(keys=[inflight_key], args=[job_id])
+    except Exception as e:
+        logging.error("Failed to release query job %s: %s", job_id, str(e))
+
+def submit_query_job(query: str, user_id) -> Tuple[str, bool]:
+    """
+    Enqueue a legal query for process_query_async and return at once.
+    A query identical (after normalization) to one the same user already has
+    in flight is not enqueued again; its job ID is returned instead.
+    Raises if Redis or the broker is unavailable.
+    :param query: The query string.
+    :param user_id: The ID of the user submitting the query.
+    :return: Tuple of the job ID and whether it is an existing job.
+    """
+    job_id = str(uuid.uuid4())
+    inflight_key = _query_inflight_key(query, user_id)
+    # Record the owner first, so the job can be polled as soon as its ID is visible
+    redis_client.set(_query_owner_key(job_id), str(user_id), ex=QUERY_JOB_TTL)
+    if not redis_client.set(inflight_key, job_id, nx=True, ex=QUERY_JOB_DEDUP_TTL):
+        existing = redis_client.get(inflight_key)
+        if existing is not None:
+            redis_client.delete(_query_owner_key(job_id))
+            return (existing.decode('utf-8') if isinstance(existing, bytes) else existing), True
+        # The other job finished in between; take its place
+        redis_client.set(inflight_key, job_id, ex=QUERY_JOB_DEDUP_TTL)
+
+    try:
+        process_query_async.apply_async(args=[query, user_id], kwargs={"inflight_key": inflight_key},
+                                        task_id=job_id)
+    except Exception:
+        _release_query_job(inflight_key, job_id)
+        redis_client.delete(_query_owner_key(job_id))
+        raise
+    return job_id, False
+
+def query_job_status(job_id: str, user_id) -> Optional[Dict[str, Any]]:
+    """
+    State of a query job submitted with submit_query_job.
+    Raises if Redis is unavailable.
+    :param job_id: The job ID.
+    :param user_id: The ID of the user asking; only the submitter may see the job.
+    :return: Dict with the job ID, its status (queued, running, retrying, done
+             or failed) and, when done, the result; None if the job is unknown,
+             expired or belongs to another user.
+    """
+    owner = redis_client.get(_query_owner_key(job_id))
+    if owner is None or (owner.decode('utf-8') if isinstance(owner, bytes) else owner) != str(user_id):
+        return None
+
+    job = AsyncResult(job_id, app=celery)
+    status = {'PENDING': 'queued', 'RECEIVED': 'queued', 'STARTED': 'running', 'RETRY': 'retrying',
+              'SUCCESS': 'done'}.get(job.state, 'failed')
+    response: Dict[str, Any] = {"job_id": job_id, "status": status}
+    if status == 'done':
+        response["result"] = job.result
+    elif status == 'failed':
+        logging.error("Query job %s failed: %s", job_id, str(job.result))
+        response["error"] = "The query could not be processed. Please try again later."
+    return response
+
+@celery.task(bind=True)
+def process_queries_batch_async(self, queries, user_id=None):
+    """
+    Asynchronously processes a batch of legal queries, e.g. a backfill.
+    Cached results are read with one MGET, the misses are preprocessed together
+    in one spaCy pipe pass, and new results are written back in one pipeline.
+    :param queries: List of query strings to be processed.
+    :param user_id: The ID of the user who submitted the queries, if any.
+    :return: List of results, in the same order as the queries.
+    """
+    try:
+        cache_keys = [f"user:{user_id}:query:{query}" for query in queries]
+        cached = cache_get_many(cache_keys)
+
+        pending = [(key, query) for key, query in zip(cache_keys, queries) if key not in cached]
+        processed_queries = preprocess_queries([query for _, query in pending]) if pending else []
+
+        fresh = {}
+        for (key, query), processed_query in zip(pending, processed_queries):
+            fresh[key] = process_legal_query(query, user_id=user_id, processed_query=processed_query)
+        cache_set_many(fresh, timeout=600)  # Cache for 10 minutes
+
+        logging.info("Processed a batch of %d queries (%d cached).", len(queries), len(cached))
+        return [cached.get(key, fresh.get(key)) for key in cache_keys]
+
+    except Exception as e:
+        logging.error("Failed to process query batch: %s", str(e))
         self.retry(exc=e, countdown=60, max_retries=3)
+
+def _progress_key(batch_id):
+    return f"docbatch:{batch_id}"
+
+def _record_progress(batch_id, done=0, failed=0):
+    """Add a chunk's counts to the batch's progress hash."""
+    try:
+        pipeline = redis_client.pipeline(transaction=False)
+        pipeline.hincrby(_progress_key(batch_id), 'done', done)
+        pipeline.hincrby(_progress_key(batch_id), 'failed', failed)
+        pipeline.hincrby(_progress_key(batch_id), 'chunks_done', 1)
+        pipeline.expire(_progress_key(batch_id), DOCUMENT_BATCH_TTL)
+        pipeline.execute()
+    except Exception as e:
+        logging.error("Failed to record progress of document batch %s: %s", batch_id, str(e))
+
+def document_batch_progress(batch_id) -> Dict[str, Any]:
+    """
+    Progress of a process_documents_batch run.
+    :param batch_id: The batch ID returned by process_documents_batch.
+    :return: Dict with total, done, failed, chunks and chunks_done, or {} if unknown.
+    """
+    try:
+        raw = redis_client.hgetall(_progress_key(batch_id))
+    except Exception as e:
+        logging.error("Failed to read progress of document batch %s: %s", batch_id, str(e))
+        return {}
+    return {(key.decode() if isinstance(key, bytes) else key): int(value)
+            for key, value in raw.items()}
+
+@celery.task(bind=True)
+def process_documents_batch(self, document_ids, chunk_size=DOCUMENT_BATCH_CHUNK_SIZE):
+    """
+    Reprocess many documents, e.g. a backlog after a model change.
+    The IDs are split into chunks of `chunk_size`; each chunk is its own task
+    (run in parallel as a Celery chord) that loads its documents with one query,
+    analyzes them in batches and stores the results with bulk writes and one
+    commit. Documents already analyzed with the current models are skipped. A failing
+    chunk is retried on its own instead of restarting the whole job.
+    :param document_ids: IDs of the documents to process.
+    :param chunk_size: Documents per chunk task.
+    :return: Dict with the batch ID (for document_batch_progress) and chunk count.
+    """
+    batch_id = self.request.id or str(uuid.uuid4())
+    chunks = [list(document_ids[start:start + chunk_size])
+              for start in range(0, len(document_ids), chunk_size)]
+    try:
+        redis_client.hset(_progress_key(batch_id), mapping={
+            'total': len(document_ids), 'done': 0, 'failed': 0,
+            'chunks': len(chunks), 'chunks_done': 0})
+        redis_client.expire(_progress_key(batch_id), DOCUMENT_BATCH_TTL)
+    except Exception as e:
+        logging.error("Failed to initialise progress of document batch %s: %s", batch_id, str(e))
+
+    if chunks:
+        chord(group(process_document_chunk.s(batch_id, chunk) for chunk in chunks))(
+            finish_documents_batch.s(batch_id))
+    logging.info("Document batch %s: %d documents in %d chunks.", batch_id, len(document_ids), len(chunks))
+    return {"batch_id": batch_id, "chunks": len(chunks)}
+
+@celery.task(bind=True, max_retries=3)
+def process_document_chunk(self, batch_id, document_ids):
+    """
+    Process one chunk of a document batch.
+    Documents that cannot be analyzed are counted as failed; only errors that
+    affect the whole chunk (database, Redis, models) trigger a retry.
+    :param batch_id: The batch this chunk belongs to.
+    :param document_ids: IDs of the documents in the chunk.
+    :return: Dict with the chunk's done and failed counts.
+    """
+    try:
+        # Documents already analyzed with the current models are skipped
+        analyzed = {document_id for (document_id,) in db.session.query(DocumentAnalysis.document_id)
+                    .filter(DocumentAnalysis.document_id.in_(document_ids),
+                            DocumentAnalysis.model_version == analysis_version())}
+        pending_ids = [document_id for document_id in document_ids if document_id not in analyzed]
+        rows = (Document.query.with_entities(Document.id, Document.file_path)
+                .filter(Document.id.in_(pending_ids)).all()) if pending_ids else []
+        missing = len(set(pending_ids)) - len(rows)
+        if missing:
+            logging.error("Document batch %s: %d documents not found.", batch_id, missing)
+
+        self.update_state(state='PROGRESS', meta={"batch_id": batch_id, "documents": len(rows)})
+        with span('document_batch:analyze'):
+            analyses = analyze_documents([file_store.resolve(file_path) for _, file_path in rows])
+
+        results: Dict[str, Dict[str, Any]] = {}
+        failed = missing
+        for (document_id, _), analysis in zip(rows, analyses):
+            if "error" in analysis:
+                failed += 1
+                continue
+            results[document_id] = analysis
+        if results:
+            with span('document_batch:save'):
+                _save_analyses(results)
+        done = len(results) + len(analyzed)
+
+        _record_progress(batch_id, done=done, failed=failed)
+        return {"done": done, "failed": failed}
+
+    except Exception as e:
+        logging.error("Document batch %s: chunk of %d failed: %s", batch_id, len(document_ids), str(e))
+        db.session.rollback()
+        if self.request.retries >= self.max_retries:
+            # Give up on this chunk only, so the rest of the batch still completes
+            _record_progress(batch_id, failed=len(document_ids))
+            return {"done": 0, "failed": len(document_ids)}
+        raise self.retry(exc=e, countdown=60 * (self.request.retries + 1))
+
+@celery.task
+def finish_documents_batch(chunk_results: List[Dict[str, int]], batch_id):
+    """
+    Chord callback: log the outcome of a document batch.
+    :param chunk_results: Results of the chunk tasks.
+    :param batch_id: The finished batch.
+    :return: Dict with the batch's done and failed counts.
+    """
+    done = sum(result["done"] for result in chunk_results)
+    failed = sum(result["failed"] for result in chunk_results)
+    logging.info("Document batch %s finished: %d processed, %d failed.", batch_id, done, failed)
+    return {"batch_id": batch_id, "done": done, "failed": failed}
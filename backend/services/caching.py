@@ -1,7 +1,26 @@
 """Caching utilities for the application."""
-import pickle
+import time
+import uuid
+import hashlib
 import logging
+import argparse
+import threading
+from typing import Any, Callable, Dict, Optional
+from cachetools import TTLCache
 from extensions import redis_client
+from services.concurrency import SingleFlight
+from services.codecs import encode, decode, is_pickled
+from services.metrics import span
+
+# Deletes a lock only if it still holds the caller's token, so a holder whose
+# lock expired cannot release the lock another process has taken since
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+_release_lock_script = None
 
 
 def cache_set(key, value, timeout=300):
@@ -13,7 +32,7 @@ def cache_set(key, value, timeout=300):
     :return: None
     """
     try:
-        serialized_value = pickle.dumps(value)
+        serialized_value = encode(value)
         redis_client.setex(key, timeout, serialized_value)
         logging.debug("Value cached under key: %s", key)
     except Exception as err:
@@ -28,7 +47,7 @@ def cache_get(key):
     try:
         cached_value = redis_client.get(key)
         if cached_value is not None:
-            deserialized_value = pickle.loads(cached_value)
+            deserialized_value = decode(cached_value)
             logging.debug("Cache hit for key: %s", key)
             return deserialized_value
         logging.debug("Cache miss for key: %s", key)
@@ -48,3 +67,330 @@ def cache_delete(key):
         logging.debug("Cache key deleted: %s", key)
     except Exception as err:
         logging.error("Failed to delete cache for key %s: %s", key, str(err))
+
+def cache_get_many(keys):
+    """
+    Get several values from the Redis cache in one round-trip (MGET).
+    :param keys: Iterable of cache keys.
+    :return: Dict mapping each key that was found to its value.
+    """
+    keys = list(keys)
+    if not keys:
+        return {}
+    try:
+        cached_values = redis_client.mget(keys)
+    except Exception as e:
+        logging.error("Failed to get %d cache keys: %s", len(keys), str(e))
+        return {}
+
+    found = {}
+    for key, cached_value in zip(keys, cached_values):
+        if cached_value is None:
+            continue
+        try:
+            found[key] = decode(cached_value)
+        except Exception as e:
+            logging.error("Failed to decode cache for key %s: %s", key, str(e))
+    logging.debug("Cache get_many: %d/%d hits", len(found), len(keys))
+    return found
+
+def cache_set_many(mapping, timeout=300, batch_size=500):
+    """
+    Set several values in the Redis cache with pipelined SETEX commands.
+    :param mapping: Dict of cache key to value.
+    :param timeout: Cache expiration time in seconds (default is 300 seconds).
+    :param batch_size: Commands sent per pipeline round-trip.
+    :return: None
+    """
+    items = list(mapping.items())
+    try:
+        for start in range(0, len(items), batch_size):
+            pipeline = redis_client.pipeline(transaction=False)
+            for key, value in items[start:start + batch_size]:
+                pipeline.setex(key, timeout, encode(value))
+            pipeline.execute()
+        logging.debug("Cached %d values", len(items))
+    except Exception as err:
+        logging.error("Failed to set %d cache keys: %s", len(items), str(err))
+
+def cache_delete_pattern(pattern, batch_size=500):
+    """
+    Delete every key matching a glob pattern, walking the keyspace with SCAN
+    (never KEYS, which blocks Redis) and unlinking keys in pipelined batches.
+    :param pattern: Redis glob pattern, e.g. "user:42:query:*".
+    :param batch_size: SCAN page size and keys unlinked per round-trip.
+    :return: Number of keys deleted.
+    """
+    deleted = 0
+    try:
+        batch = []
+        for key in redis_client.scan_iter(match=pattern, count=batch_size):
+            batch.append(key)
+            if len(batch) == batch_size:
+                deleted += redis_client.unlink(*batch)
+                batch = []
+        if batch:
+            deleted += redis_client.unlink(*batch)
+        logging.debug("Deleted %d cache keys matching %s", deleted, pattern)
+    except Exception as err:
+        logging.error("Failed to delete cache keys matching %s: %s", pattern, str(err))
+    return deleted
+
+def migrate_legacy_entries(pattern, batch_size=500, dry_run=False):
+    """
+    Re-encode pickled cache entries (from the pickle-only cache, or written
+    with CACHE_ALLOW_PICKLE on) with the pickle-free codecs, keeping their TTLs.
+    This is the one place pickles are loaded when CACHE_ALLOW_PICKLE is off:
+    run it once, from a trusted shell, after upgrading. Entries that only
+    pickle can represent are deleted and recomputed on their next miss; keys
+    that are not pickled strings (other codecs, Celery results, hashes) are
+    left alone.
+    :param pattern: Redis glob pattern of the keys to migrate, e.g. "nlp:query:*".
+    :param batch_size: SCAN page size and keys read and written per round-trip.
+    :param dry_run: Only count what would change.
+    :return: Counts of keys scanned, migrated, dropped and skipped.
+    """
+    counts = {'scanned': 0, 'migrated': 0, 'dropped': 0, 'skipped': 0}
+    batch = []
+    for key in redis_client.scan_iter(match=pattern, count=batch_size):
+        batch.append(key)
+        if len(batch) == batch_size:
+            _migrate_batch(batch, counts, dry_run)
+            batch = []
+    if batch:
+        _migrate_batch(batch, counts, dry_run)
+    logging.info("Cache migration of %s: %s", pattern, counts)
+    return counts
+
+def _migrate_batch(keys, counts, dry_run):
+    """Migrate one SCAN batch: pipelined GET/PTTL, then pipelined rewrites."""
+    pipeline = redis_client.pipeline(transaction=False)
+    for key in keys:
+        pipeline.get(key)
+        pipeline.pttl(key)
+    replies = pipeline.execute(raise_on_error=False)
+
+    writes = redis_client.pipeline(transaction=False)
+    for key, data, ttl in zip(keys, replies[0::2], replies[1::2]):
+        counts['scanned'] += 1
+        # Non-string keys reply with an error; expired keys with None
+        if not isinstance(data, bytes) or not is_pickled(data) or ttl == -2:
+            counts['skipped'] += 1
+            continue
+        try:
+            value = decode(data, allow_pickle=True)
+        except Exception as err:
+            logging.warning("Left cache key %s alone, it does not unpickle: %s", key, str(err))
+            counts['skipped'] += 1
+            continue
+        try:
+            encoded = encode(value, allow_pickle=False)
+        except TypeError:
+            counts['dropped'] += 1
+            writes.delete(key)
+            continue
+        counts['migrated'] += 1
+        if ttl > 0:
+            writes.set(key, encoded, px=ttl)
+        else:
+            writes.set(key, encoded)
+    if not dry_run:
+        writes.execute()
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a query so that trivially different spellings share a cache key.
+    :param query: Query string.
+    :return: Lower-cased query with collapsed whitespace.
+    """
+    return ' '.join(query.lower().split())
+
+
+class _CountingTTLCache(TTLCache):
+    """TTLCache that reports capacity evictions."""
+
+    def __init__(self, maxsize, ttl, on_evict):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self._on_evict = on_evict
+
+    def popitem(self):
+        item = super().popitem()
+        self._on_evict()
+        return item
+
+
+class TieredCache:
+    """
+    Two-tier cache: a bounded in-process L1 in front of the shared Redis L2.
+
+    Keys are derived from the normalized query and a model version, so every
+    gunicorn and Celery worker finds results any other worker computed, and a
+    model upgrade never serves stale results. Concurrent misses on one key are
+    collapsed to a single computation: in-process with ``SingleFlight``, and
+    across processes with a Redis lock while the others poll L2. `lock_ttl`
+    and `lock_wait` must outlast the slowest computation, or waiters give up
+    and recompute; a waiter that sees the lock released without a value takes
+    the lock over instead of computing alongside others.
+    """
+
+    def __init__(self, namespace: str, model_version: str, l1_maxsize: int = 1024,
+                 l1_ttl: int = 60, l2_ttl: int = 600, lock_ttl: int = 90,
+                 lock_wait: float = 90.0, poll_interval: float = 0.05):
+        self.namespace = namespace
+        self.model_version = model_version
+        self.l2_ttl = l2_ttl
+        self.lock_ttl = lock_ttl
+        self.lock_wait = lock_wait
+        self.poll_interval = poll_interval
+        self._counters = {'l1_hits': 0, 'l2_hits': 0, 'misses': 0, 'evictions': 0, 'coalesced': 0}
+        self._counter_lock = threading.Lock()
+        self._l1 = _CountingTTLCache(l1_maxsize, l1_ttl, lambda: self._count('evictions'))
+        self._l1_lock = threading.Lock()
+        self._flight = SingleFlight()
+
+    def _count(self, name: str):
+        with self._counter_lock:
+            self._counters[name] += 1
+
+    def key(self, query: str) -> str:
+        """
+        Shared cache key of a query.
+        :param query: Query string.
+        :return: Redis key.
+        """
+        digest = hashlib.sha1(normalize_query(query).encode('utf-8')).hexdigest()
+        return f"{self.namespace}:{self.model_version}:{digest}"
+
+    def get(self, query: str) -> Optional[Any]:
+        """
+        Look a query up in L1, then L2 (promoting L2 hits into L1).
+        :param query: Query string.
+        :return: Cached value or None.
+        """
+        key = self.key(query)
+        with self._l1_lock:
+            value = self._l1.get(key)
+        if value is not None:
+            self._count('l1_hits')
+            return value
+        with span(f"{self.namespace}:l2_lookup"):
+            value = cache_get(key)
+        if value is not None:
+            self._count('l2_hits')
+            with self._l1_lock:
+                self._l1[key] = value
+            return value
+        self._count('misses')
+        return None
+
+    def set(self, query: str, value: Any):
+        """
+        Store a value in both tiers.
+        :param query: Query string.
+        :param value: Value to cache.
+        """
+        key = self.key(query)
+        with self._l1_lock:
+            self._l1[key] = value
+        cache_set(key, value, timeout=self.l2_ttl)
+
+    def get_or_compute(self, query: str, compute: Callable[[], Any],
+                       cacheable: Callable[[Any], bool] = lambda value: True) -> Any:
+        """
+        Return the cached value for a query, computing it at most once across
+        concurrent callers on a miss.
+        :param query: Query string.
+        :param compute: Zero-argument callable producing the value.
+        :param cacheable: Predicate deciding whether a computed value is stored.
+        :return: Cached or freshly computed value.
+        """
+        value = self.get(query)
+        if value is not None:
+            return value
+
+        key = self.key(query)
+        leader = []
+
+        def fill():
+            leader.append(True)
+            return self._compute_with_lock(query, key, compute, cacheable)
+
+        value = self._flight.do(key, fill)
+        if not leader:
+            self._count('coalesced')
+        return value
+
+    def _acquire_lock(self, lock_key: str, token: str) -> bool:
+        try:
+            return bool(redis_client.set(lock_key, token, nx=True, ex=self.lock_ttl))
+        except Exception as err:
+            logging.error("Failed to acquire cache lock %s: %s", lock_key, str(err))
+            return True
+
+    def _release_lock(self, lock_key: str, token: str):
+        global _release_lock_script
+        try:
+            if _release_lock_script is None:
+                _release_lock_script = redis_client.register_script(RELEASE_LOCK_SCRIPT)
+            _release_lock_script(keys=[lock_key], args=[token])
+        except Exception as err:
+            logging.error("Failed to release cache lock %s: %s", lock_key, str(err))
+
+    def _compute_with_lock(self, query, key, compute, cacheable):
+        lock_key = f"{key}:lock"
+        token = uuid.uuid4().hex
+        acquired = self._acquire_lock(lock_key, token)
+
+        if not acquired:
+            # Another process is computing this key; wait for it to land in L2,
+            # or take the lock over if it is released without a value
+            deadline = time.monotonic() + self.lock_wait
+            while time.monotonic() < deadline:
+                time.sleep(self.poll_interval)
+                value = cache_get(key)
+                if value is not None:
+                    self._count('coalesced')
+                    with self._l1_lock:
+                        self._l1[key] = value
+                    return value
+                if self._acquire_lock(lock_key, token):
+                    acquired = True
+                    break
+            else:
+                logging.warning("Gave up waiting %.0fs for cache lock %s", self.lock_wait, lock_key)
+
+        try:
+            value = compute()
+            if value is not None and cacheable(value):
+                self.set(query, value)
+            return value
+        finally:
+            if acquired:
+                self._release_lock(lock_key, token)
+
+    def stats(self) -> Dict[str, int]:
+        """Hit, miss, eviction and coalescing counters, plus the L1 size."""
+        with self._counter_lock:
+            stats = dict(self._counters)
+        stats['l1_size'] = len(self._l1)
+        return stats
+
+    def clear_local(self):
+        """Drop the in-process tier."""
+        with self._l1_lock:
+            self._l1.clear()
+
+
+if __name__ == '__main__':
+    # Usage: python -m services.caching --migrate-legacy "nlp:query:*" [--dry-run]
+    parser = argparse.ArgumentParser(description="One-off maintenance of the Redis cache.")
+    parser.add_argument('--migrate-legacy', metavar='PATTERN', required=True,
+                        help='Re-encode pickled entries of the keys matching PATTERN')
+    parser.add_argument('--dry-run', action='store_true', help='Only report what would change')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    from app import create_app
+    with create_app().app_context():
+        print(migrate_legacy_entries(args.migrate_legacy, dry_run=args.dry_run))
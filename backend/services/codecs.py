@@ -0,0 +1,242 @@
+"""Pluggable serialization codecs for cached values."""
+import os
+import json
+import zlib
+import pickle
+import struct
+import logging
+from typing import Any, Callable, Dict, NamedTuple, Optional
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional dependency
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:  # pragma: no cover - optional dependency
+    lz4_frame = None
+
+# Every encoded value starts with MAGIC, a codec id and a compression id.
+# Values written by the old pickle-only cache start with b'\x80' instead.
+MAGIC = 0xC1
+HEADER = struct.Struct('<BBB')
+
+# Preferred codec for JSON-like values: 'json' (orjson when installed) or 'msgpack'
+CACHE_CODEC = os.getenv('CACHE_CODEC', 'json')
+# Compression for payloads of at least CACHE_COMPRESS_THRESHOLD bytes: zstd, lz4, zlib or none
+CACHE_COMPRESSION = os.getenv('CACHE_COMPRESSION', 'zstd')
+CACHE_COMPRESS_THRESHOLD = int(os.getenv('CACHE_COMPRESS_THRESHOLD', '4096'))
+# Fall back to pickle for values no other codec can represent (and read pickled
+# entries). Off by default: unpickling cache data lets whoever can write to Redis
+# run code. Old entries are converted once with services.caching --migrate-legacy.
+CACHE_ALLOW_PICKLE = os.getenv('CACHE_ALLOW_PICKLE', 'False').lower() == 'true'
+
+
+class Codec(NamedTuple):
+    """
+    A serialization format: ``can_encode`` decides whether it applies to a value.
+    ``compressible`` is off for payloads that rarely shrink (e.g. float arrays),
+    to avoid paying for compression that is then thrown away.
+    """
+    codec_id: int
+    name: str
+    encode: Callable[[Any], bytes]
+    decode: Callable[[bytes], Any]
+    can_encode: Callable[[Any], bool]
+    compressible: bool = True
+
+
+class Compressor(NamedTuple):
+    """A compression algorithm applied to encoded payloads above the threshold."""
+    compression_id: int
+    name: str
+    compress: Callable[[bytes], bytes]
+    decompress: Callable[[bytes], bytes]
+
+
+_codecs: Dict[int, Codec] = {}
+_codecs_by_name: Dict[str, Codec] = {}
+_compressors: Dict[int, Compressor] = {}
+_compressors_by_name: Dict[str, Compressor] = {}
+
+
+def register_codec(codec: Codec):
+    """
+    Register a codec. Ids are persisted in cached data, so never reuse one.
+    :param codec: The codec to register.
+    """
+    _codecs[codec.codec_id] = codec
+    _codecs_by_name[codec.name] = codec
+
+
+def register_compressor(compressor: Compressor):
+    """
+    Register a compression algorithm. Ids are persisted in cached data.
+    :param compressor: The compressor to register.
+    """
+    _compressors[compressor.compression_id] = compressor
+    _compressors_by_name[compressor.name] = compressor
+
+
+def _is_json_like(value: Any) -> bool:
+    """Whether a value round-trips through JSON/msgpack unchanged."""
+    # Exact type checks: subclasses such as numpy.float64 or IntEnum do not round-trip
+    if value is None or type(value) in (str, bool, int, float):
+        return True
+    if type(value) is list:
+        return all(_is_json_like(item) for item in value)
+    if type(value) is dict:
+        return all(type(key) is str and _is_json_like(item) for key, item in value.items())
+    return False
+
+
+def _json_encode(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+
+def _json_decode(data: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(bytes(data))
+
+
+_ARRAY_HEADER = struct.Struct('<BB')
+
+
+def _ndarray_encode(array: np.ndarray) -> bytes:
+    """dtype string and shape, followed by the raw little-endian C-order buffer."""
+    dtype = array.dtype.newbyteorder('<') if array.dtype.byteorder == '>' else array.dtype
+    array = np.asarray(array, dtype=dtype, order='C')
+    dtype_str = array.dtype.str.encode('ascii')
+    return b''.join([
+        _ARRAY_HEADER.pack(len(dtype_str), array.ndim), dtype_str,
+        struct.pack(f'<{array.ndim}Q', *array.shape), array.reshape(-1).view(np.uint8).data])
+
+
+def _ndarray_decode(data: bytes) -> np.ndarray:
+    """Rebuild an array as a read-only view of the cached buffer."""
+    dtype_len, ndim = _ARRAY_HEADER.unpack_from(data)
+    offset = _ARRAY_HEADER.size
+    dtype = np.dtype(bytes(data[offset:offset + dtype_len]).decode('ascii'))
+    offset += dtype_len
+    shape = struct.unpack_from(f'<{ndim}Q', data, offset)
+    offset += 8 * ndim
+    return np.frombuffer(data, dtype=dtype, offset=offset).reshape(shape)
+
+
+register_codec(Codec(1, 'ndarray', _ndarray_encode, _ndarray_decode,
+                     lambda value: isinstance(value, np.ndarray) and value.dtype != object,
+                     compressible=False))
+register_codec(Codec(2, 'json', _json_encode, _json_decode, _is_json_like))
+if msgpack is not None:
+    register_codec(Codec(3, 'msgpack', lambda value: msgpack.packb(value, use_bin_type=True),
+                         lambda data: msgpack.unpackb(data, raw=False), _is_json_like))
+register_codec(Codec(4, 'pickle', lambda value: pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL),
+                     pickle.loads, lambda value: True))
+
+register_compressor(Compressor(0, 'none', lambda data: data, lambda data: data))
+register_compressor(Compressor(1, 'zlib', lambda data: zlib.compress(data, 1), zlib.decompress))
+if zstandard is not None:
+    register_compressor(Compressor(2, 'zstd', zstandard.ZstdCompressor(level=3).compress,
+                                   lambda data: zstandard.ZstdDecompressor().decompress(data)))
+if lz4_frame is not None:
+    register_compressor(Compressor(3, 'lz4', lz4_frame.compress, lz4_frame.decompress))
+
+if CACHE_CODEC not in _codecs_by_name:
+    logging.warning("Cache codec %s is not available (library not installed?), using json", CACHE_CODEC)
+if CACHE_COMPRESSION not in _compressors_by_name:
+    logging.warning("Cache compression %s is not available (library not installed?), using zlib",
+                    CACHE_COMPRESSION)
+
+
+def _select_codec(value: Any, allow_pickle: bool) -> Codec:
+    preferred = _codecs_by_name.get(CACHE_CODEC, _codecs_by_name['json'])
+    if preferred.can_encode(value) and (allow_pickle or preferred.name != 'pickle'):
+        return preferred
+    for codec in _codecs.values():
+        if codec.can_encode(value) and (allow_pickle or codec.name != 'pickle'):
+            return codec
+    raise TypeError(f"No cache codec can encode a value of type {type(value).__name__}")
+
+
+def _select_compressor() -> Compressor:
+    compressor = _compressors_by_name.get(CACHE_COMPRESSION)
+    if compressor is None:
+        # Requested library not installed (warned at import): degrade to zlib
+        compressor = _compressors_by_name['none' if CACHE_COMPRESSION == 'none' else 'zlib']
+    return compressor
+
+
+def encode(value: Any, codec: Optional[str] = None, allow_pickle: Optional[bool] = None) -> bytes:
+    """
+    Serialize a value for the cache.
+    :param value: Value to encode.
+    :param codec: Force a codec by name instead of picking one from the value.
+    :param allow_pickle: Whether pickle may be picked (default: CACHE_ALLOW_PICKLE).
+    :return: Header plus (possibly compressed) payload.
+    """
+    if allow_pickle is None:
+        allow_pickle = CACHE_ALLOW_PICKLE
+    chosen = _codecs_by_name[codec] if codec else _select_codec(value, allow_pickle)
+    payload = chosen.encode(value)
+    compressor = _compressors_by_name['none']
+    if chosen.compressible and len(payload) >= CACHE_COMPRESS_THRESHOLD:
+        candidate = _select_compressor()
+        compressed = candidate.compress(payload)
+        if len(compressed) < len(payload):
+            compressor, payload = candidate, compressed
+    return HEADER.pack(MAGIC, chosen.codec_id, compressor.compression_id) + payload
+
+
+def is_pickled(data: bytes) -> bool:
+    """
+    Whether a cached value is a pickle: a legacy entry from the pickle-only
+    cache, or one encoded with the pickle codec.
+    :param data: Raw cached bytes.
+    :return: True if decoding it means unpickling.
+    """
+    if not data:
+        return False
+    if data[0] != MAGIC:
+        return data[:1] == b'\x80'
+    return len(data) >= HEADER.size and data[1] in _codecs and _codecs[data[1]].name == 'pickle'
+
+
+def decode(data: bytes, allow_pickle: Optional[bool] = None) -> Any:
+    """
+    Deserialize a cached value.
+    :param data: Bytes produced by ``encode`` (or a legacy pickle).
+    :param allow_pickle: Whether pickles may be loaded (default: CACHE_ALLOW_PICKLE).
+    :return: The decoded value.
+    """
+    if allow_pickle is None:
+        allow_pickle = CACHE_ALLOW_PICKLE
+    if not data or data[0] != MAGIC:
+        if not allow_pickle:
+            raise ValueError("Refusing to unpickle a legacy cache entry")
+        logging.debug("Decoding legacy pickled cache entry")
+        return pickle.loads(data)
+    _, codec_id, compression_id = HEADER.unpack_from(data)
+    # A memoryview avoids copying the payload; uncompressed arrays decode zero-copy
+    payload = memoryview(data)[HEADER.size:]
+    if compression_id not in _compressors:
+        raise ValueError(f"Cache entry uses unavailable compression id {compression_id}")
+    if codec_id not in _codecs:
+        raise ValueError(f"Cache entry uses unavailable codec id {codec_id}")
+    if _codecs[codec_id].name == 'pickle' and not allow_pickle:
+        raise ValueError("Refusing to unpickle a cache entry")
+    return _codecs[codec_id].decode(_compressors[compression_id].decompress(payload))
@@ -0,0 +1,106 @@
+"""Concurrency helpers shared by the caching and HTTP layers."""
+import threading
+from concurrent.futures import Executor, Future
+from typing import Any, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key: the first caller runs the
+    function, callers arriving while it is in flight wait for and share its
+    result (or exception) instead of repeating the work.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight: Dict[Hashable, Future] = {}
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Any:
+        """
+        Run ``func`` once for all concurrent callers with the same key.
+        :param key: Identifies equivalent calls.
+        :param func: Zero-argument callable doing the work.
+        :return: The result of ``func``.
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._in_flight[key] = future
+        if not leader:
+            return future.result()
+
+        try:
+            result = func()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def in_flight(self) -> int:
+        """Number of keys currently being computed."""
+        with self._lock:
+            return len(self._in_flight)
+
+
+class WorkCounter:
+    """
+    Counts the work a caller has submitted to an executor that is still queued
+    or running, so its load can be reported without reading the executor's
+    private work queue. Work submitted to the executor directly is not counted.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+
+    @property
+    def queued(self) -> int:
+        """Submitted and not yet picked up by a worker."""
+        return self._queued
+
+    @property
+    def running(self) -> int:
+        """Picked up by a worker and not yet finished."""
+        return self._running
+
+    def submit(self, executor: Executor, func: Callable[[], Any]) -> Future:
+        """
+        Submit ``func`` to ``executor``, counting it until it finishes or is cancelled.
+        :param executor: Executor to run the work on.
+        :param func: Zero-argument callable doing the work.
+        :return: The executor's future for the work.
+        """
+        def run():
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+            try:
+                return func()
+            finally:
+                with self._lock:
+                    self._running -= 1
+
+        with self._lock:
+            self._queued += 1
+        try:
+            future = executor.submit(run)
+        except BaseException:
+            with self._lock:
+                self._queued -= 1
+            raise
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _on_done(self, future: Future):
+        # Cancelled work never ran, so it is still counted as queued
+        if future.cancelled():
+            with self._lock:
+                self._queued -= 1
@@ -0,0 +1,132 @@
+"""Bounded per-user query context, in process or shared through Redis."""
+import time
+import logging
+import threading
+from collections import OrderedDict, deque
+from typing import Deque, Tuple
+from extensions import redis_client
+
+
+class _Session:
+    """One user's context window with its combined string kept up to date."""
+
+    __slots__ = ('turns', 'tokens', 'combined', 'last_seen')
+
+    def __init__(self):
+        self.turns: Deque[Tuple[str, int]] = deque()
+        self.tokens = 0
+        self.combined = ''
+        self.last_seen = 0.0
+
+    def append(self, query: str, tokens: int):
+        self.turns.append((query, tokens))
+        self.tokens += tokens
+        self.combined = f"{self.combined} {query}" if len(self.turns) > 1 else query
+
+    def pop_oldest(self):
+        query, tokens = self.turns.popleft()
+        self.tokens -= tokens
+        # Drop the oldest query and the separating space from the front
+        self.combined = self.combined[len(query) + 1:] if self.turns else ''
+
+
+class QueryContextStore:
+    """
+    Keeps the most recent queries of each user as conversational context.
+
+    A user's window holds at most ``max_turns`` queries and ``max_tokens``
+    whitespace tokens (the newest query is always kept); older turns fall off
+    the front. The combined context string is maintained incrementally, so a
+    request costs the same however long the session has been running. Users
+    idle for ``idle_ttl`` seconds are evicted, as are the least recently seen
+    users beyond ``max_users``.
+
+    With ``use_redis`` the window lives in a Redis list per user instead, so
+    every worker sees the same context; if Redis is unreachable the local
+    store takes over.
+    """
+
+    def __init__(self, max_turns: int = 10, max_tokens: int = 512, idle_ttl: int = 1800,
+                 max_users: int = 10000, use_redis: bool = False, key_prefix: str = 'ctx'):
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.idle_ttl = idle_ttl
+        self.max_users = max_users
+        self.use_redis = use_redis
+        self.key_prefix = key_prefix
+        self._sessions: 'OrderedDict[str, _Session]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def append(self, user_id: str, query: str) -> str:
+        """
+        Add a query to a user's context.
+        :param user_id: The user the query belongs to.
+        :param query: The (preprocessed) query.
+        :return: The user's context window joined into one string.
+        """
+        if self.use_redis:
+            try:
+                return self._append_redis(user_id, query)
+            except Exception as err:
+                logging.error("Redis context store unavailable, using local store: %s", str(err))
+        return self._append_local(user_id, query)
+
+    def _append_local(self, user_id: str, query: str) -> str:
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            session = self._sessions.pop(user_id, None) or _Session()
+            self._sessions[user_id] = session
+            session.last_seen = now
+
+            session.append(query, len(query.split()))
+            while len(session.turns) > 1 and (len(session.turns) > self.max_turns
+                                              or session.tokens > self.max_tokens):
+                session.pop_oldest()
+
+            while len(self._sessions) > self.max_users:
+                self._sessions.popitem(last=False)
+            return session.combined
+
+    def _evict_idle(self, now: float):
+        """Sessions are ordered by last use, so idle ones are always at the front."""
+        while self._sessions:
+            user_id, session = next(iter(self._sessions.items()))
+            if now - session.last_seen < self.idle_ttl:
+                break
+            del self._sessions[user_id]
+
+    def _append_redis(self, user_id: str, query: str) -> str:
+        key = f"{self.key_prefix}:{user_id}"
+        pipeline = redis_client.pipeline(transaction=True)
+        pipeline.rpush(key, query)
+        pipeline.ltrim(key, -self.max_turns, -1)
+        pipeline.expire(key, self.idle_ttl)
+        pipeline.lrange(key, 0, -1)
+        turns = [turn.decode('utf-8') if isinstance(turn, bytes) else turn
+                 for turn in pipeline.execute()[-1]]
+
+        # Enforce the token budget from the newest turn backwards
+        window, tokens = [], 0
+        for turn in reversed(turns):
+            tokens += len(turn.split())
+            if window and tokens > self.max_tokens:
+                break
+            window.append(turn)
+        return ' '.join(reversed(window))
+
+    def clear(self, user_id: str):
+        """
+        Forget a user's context.
+        :param user_id: The user whose context to drop.
+        """
+        with self._lock:
+            self._sessions.pop(user_id, None)
+        if self.use_redis:
+            try:
+                redis_client.delete(f"{self.key_prefix}:{user_id}")
+            except Exception as err:
+                logging.error("Failed to clear context for user %s: %s", user_id, str(err))
@@ -0,0 +1,170 @@
+"""Content-addressed cache of extracted document text and embeddings."""
+import os
+import hashlib
+import logging
+import threading
+from typing import Optional
+import numpy as np
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def file_digest(file_path: str) -> str:
+    """
+    SHA-256 of a file's bytes, read in blocks.
+    :param file_path: Path to the file.
+    :return: Hex digest.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _load_text(path: str) -> str:
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+class ExtractionCache:
+    """
+    Extracted text and document embeddings keyed by the SHA-256 of the file bytes,
+    so re-uploads and identical files shared between users hit the same entries.
+
+    Entries live on local disk under ``<directory>/<digest[:2]>/``. Reads touch the
+    file's mtime, and when the directory grows past ``max_bytes`` the least recently
+    used entries are deleted. With ``use_redis`` entries are mirrored to Redis via
+    ``services.caching`` so other hosts can fill their disk cache from it.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, use_redis: bool = False,
+                 redis_timeout: int = 86400):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.use_redis = use_redis
+        self.redis_timeout = redis_timeout
+        self._size = None
+        self._lock = threading.Lock()
+
+    def _path(self, digest: str, name: str) -> str:
+        return os.path.join(self.directory, digest[:2], f"{digest}.{name}")
+
+    def _read(self, path: str, loader):
+        try:
+            value = loader(path)
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def _write(self, path: str, writer):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                writer(f)
+            os.replace(tmp_path, path)
+        except OSError as err:
+            logging.error("Failed to write extraction cache entry %s: %s", path, str(err))
+            return
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += os.path.getsize(path)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith('.tmp'):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    yield stat.st_mtime, stat.st_size, path
+
+    def _scan_size(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        """Delete least recently used entries until the cache is at 90% of its budget."""
+        entries = sorted(self._entries())
+        self._size = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * 0.9)
+        for _, size, path in entries:
+            if self._size <= target:
+                break
+            try:
+                os.remove(path)
+                self._size -= size
+            except FileNotFoundError:
+                pass
+        logging.debug("Extraction cache evicted down to %d bytes", self._size)
+
+    def _redis_get(self, key):
+        if not self.use_redis:
+            return None
+        from services.caching import cache_get
+        return cache_get(key)
+
+    def _redis_set(self, key, value):
+        if self.use_redis:
+            from services.caching import cache_set
+            cache_set(key, value, timeout=self.redis_timeout)
+
+    def get_text(self, digest: str) -> Optional[str]:
+        """
+        Cached extracted text of a file.
+        :param digest: SHA-256 of the file bytes.
+        :return: The text, or None on a miss.
+        """
+        path = self._path(digest, 'txt')
+        text = self._read(path, _load_text)
+        if text is None:
+            text = self._redis_get(f"extract:text:{digest}")
+            if text is not None:
+                self._write(path, lambda f: f.write(text.encode('utf-8')))
+        return text
+
+    def put_text(self, digest: str, text: str):
+        """
+        Cache the extracted text of a file.
+        :param digest: SHA-256 of the file bytes.
+        :param text: Extracted text.
+        """
+        self._write(self._path(digest, 'txt'), lambda f: f.write(text.encode('utf-8')))
+        self._redis_set(f"extract:text:{digest}", text)
+
+    def get_embedding(self, digest: str, model_version: str) -> Optional[np.ndarray]:
+        """
+        Cached document embedding of a file.
+        :param digest: SHA-256 of the file bytes.
+        :param model_version: Identifies the model and pooling that produced it.
+        :return: The embedding, or None on a miss.
+        """
+        name = f"{hashlib.sha1(model_version.encode()).hexdigest()[:12]}.npy"
+        path = self._path(digest, name)
+        vector = self._read(path, np.load)
+        if vector is None:
+            vector = self._redis_get(f"extract:embedding:{model_version}:{digest}")
+            if vector is not None:
+                self._write(path, lambda f: np.save(f, vector))
+        return vector
+
+    def put_embedding(self, digest: str, model_version: str, vector: np.ndarray):
+        """
+        Cache the document embedding of a file.
+        :param digest: SHA-256 of the file bytes.
+        :param model_version: Identifies the model and pooling that produced it.
+        :param vector: Document embedding.
+        """
+        name = f"{hashlib.sha1(model_version.encode()).hexdigest()[:12]}.npy"
+        self._write(self._path(digest, name), lambda f: np.save(f, vector))
+        self._redis_set(f"extract:embedding:{model_version}:{digest}", vector)
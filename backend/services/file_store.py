@@ -0,0 +1,228 @@
+"""Content-addressed storage for uploaded files."""
+import os
+import fcntl
+import hashlib
+import logging
+import tempfile
+from contextlib import contextmanager
+from typing import BinaryIO, Callable, Iterator, NamedTuple, Optional
+
+# Bytes read from the upload and written to disk per step
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', str(1024 * 1024)))
+# Root of the store; document rows record paths relative to it
+UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', os.path.join(os.getcwd(), 'uploads'))
+
+
+class UploadTooLarge(ValueError):
+    """Raised when an upload stream exceeds the size limit."""
+
+
+class StoredFile(NamedTuple):
+    """Result of saving a stream into the store."""
+    digest: str
+    # Relative to the store root, as recorded in Document.file_path
+    path: str
+    size: int
+    deduplicated: bool
+
+
+class SpooledUpload:
+    """
+    A file part being received, for use as the form parser's stream factory.
+    The parser writes the part into a temporary file in the store and it is
+    hashed on the way, so saving it is a rename instead of a second copy.
+    Closing it without saving it (e.g. a rejected upload) removes the file.
+    """
+
+    def __init__(self, tmp_dir: str):
+        fd, self.tmp_path = tempfile.mkstemp(dir=tmp_dir, suffix='.part')
+        self._file = os.fdopen(fd, 'w+b')
+        self._digest = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        """Append a chunk of the part, hashing it."""
+        self._digest.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def hexdigest(self) -> str:
+        """SHA-256 of the bytes written so far."""
+        return self._digest.hexdigest()
+
+    def close(self):
+        """Close the file, and remove it unless it was saved into the store."""
+        self._file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+    def __getattr__(self, name):
+        # read, seek, flush, ... go to the temporary file
+        return getattr(self._file, name)
+
+
+class ContentAddressedStore:
+    """
+    Files stored under the SHA-256 of their bytes, at ``<root>/<digest[:2]>/<digest><suffix>``.
+
+    Uploads are written into a temporary file in the store (same filesystem),
+    either by the request's form parser (see spool) or in UPLOAD_CHUNK_SIZE
+    chunks, hashed on the fly and renamed into place atomically, so a reader
+    never sees a partial file. Identical bytes map to
+    the same path: a duplicate upload only costs the hashing pass.
+
+    A stored file may be shared by several documents. Placing a file and
+    recording a reference to it, and removing a file once its last reference
+    is gone, both run under a per-content file lock, so a duplicate upload
+    never records a path that a concurrent delete is removing. The locks are
+    flock()s on the store's filesystem, which serialize every thread and
+    process on the host.
+    """
+
+    def __init__(self, root: str, chunk_size: int = UPLOAD_CHUNK_SIZE):
+        self.root = root
+        self.chunk_size = chunk_size
+        self._tmp_dir = os.path.join(root, 'tmp')
+        self._lock_dir = os.path.join(root, 'locks')
+        self._directories_ready = False
+
+    def _ensure_directories(self):
+        """Create the temporary and lock directories on first use rather than at import."""
+        if not self._directories_ready:
+            os.makedirs(self._tmp_dir, exist_ok=True)
+            os.makedirs(self._lock_dir, exist_ok=True)
+            self._directories_ready = True
+
+    def relative_path_for(self, digest: str, suffix: str = '') -> str:
+        """
+        Where the file with this digest is stored, relative to the store root.
+        :param digest: SHA-256 hex digest of the file bytes.
+        :param suffix: File extension, kept so the type can be told from the path.
+        :return: Relative path in the store.
+        """
+        return os.path.join(digest[:2], f"{digest}{suffix}")
+
+    def resolve(self, path: str) -> str:
+        """
+        Absolute path of a stored file.
+        :param path: Path returned by save (absolute paths are returned as is).
+        :return: Absolute path on disk.
+        """
+        return os.path.join(self.root, path)
+
+    def spool(self) -> SpooledUpload:
+        """
+        A new file to receive an upload into, hashed as it is written.
+        :return: Writable (and readable) spooled upload in the store's temporary directory.
+        """
+        self._ensure_directories()
+        return SpooledUpload(self._tmp_dir)
+
+    def _write_temporary(self, stream: BinaryIO, max_bytes: Optional[int]):
+        """Copy a stream into a temporary file in the store, hashing it; returns (path, digest, size)."""
+        digest = hashlib.sha256()
+        size = 0
+        self._ensure_directories()
+        fd, tmp_path = tempfile.mkstemp(dir=self._tmp_dir, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                for chunk in iter(lambda: stream.read(self.chunk_size), b''):
+                    size += len(chunk)
+                    if max_bytes is not None and size > max_bytes:
+                        raise UploadTooLarge(f"Upload exceeds {max_bytes} bytes")
+                    digest.update(chunk)
+                    tmp.write(chunk)
+                tmp.flush()
+                os.fsync(tmp.fileno())
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return tmp_path, digest.hexdigest(), size
+
+    @staticmethod
+    def _take_spooled(upload: SpooledUpload, max_bytes: Optional[int]):
+        """Finish a spooled upload in place; returns (path, digest, size)."""
+        if max_bytes is not None and upload.size > max_bytes:
+            raise UploadTooLarge(f"Upload exceeds {max_bytes} bytes")
+        upload.flush()
+        os.fsync(upload.fileno())
+        return upload.tmp_path, upload.hexdigest(), upload.size
+
+    @contextmanager
+    def _locked(self, path: str) -> Iterator[None]:
+        """Hold the lock of a stored file; files are striped over 256 lock files by name."""
+        self._ensure_directories()
+        lock_path = os.path.join(self._lock_dir, os.path.basename(path)[:2] + '.lock')
+        with open(lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @contextmanager
+    def save(self, stream: BinaryIO, suffix: str = '',
+             max_bytes: Optional[int] = None) -> Iterator[StoredFile]:
+        """
+        Put a file into the store. A SpooledUpload (see spool) is already hashed
+        and in the store, and is renamed into place; any other stream is copied
+        in chunks. Used as a context manager: the block runs
+        under the file's lock and must record the reference to the file (e.g.
+        commit the document row). If the block raises, a file this call placed
+        is removed again.
+        :param stream: Spooled upload, or readable binary stream consumed in chunks.
+        :param suffix: File extension to store the file under (e.g. '.pdf').
+        :param max_bytes: Reject the upload once it grows past this many bytes.
+        :return: The stored file's digest, relative path and size, and whether it already existed.
+        :raises UploadTooLarge: If the stream is larger than max_bytes.
+        """
+        if isinstance(stream, SpooledUpload):
+            tmp_path, digest, size = self._take_spooled(stream, max_bytes)
+        else:
+            tmp_path, digest, size = self._write_temporary(stream, max_bytes)
+
+        relative_path = self.relative_path_for(digest, suffix)
+        path = self.resolve(relative_path)
+        with self._locked(path):
+            deduplicated = os.path.exists(path)
+            try:
+                if deduplicated:
+                    os.remove(tmp_path)
+                    logging.debug("Upload deduplicated as %s", path)
+                else:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    os.replace(tmp_path, path)
+                yield StoredFile(digest, relative_path, size, deduplicated)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                if not deduplicated:
+                    self._remove(path)
+                raise
+
+    def release(self, path: str, is_referenced: Callable[[], bool]):
+        """
+        Remove a stored file unless something still references it. The check
+        runs under the file's lock, so it sees every reference recorded by a
+        save that deduplicated onto this file.
+        :param path: Path returned by save.
+        :param is_referenced: Returns whether any document still records the path.
+        """
+        absolute_path = self.resolve(path)
+        with self._locked(absolute_path):
+            if not is_referenced():
+                self._remove(absolute_path)
+
+    @staticmethod
+    def _remove(path: str):
+        """Delete a stored file, logging rather than raising on failure."""
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as err:
+            logging.error("Failed to delete stored file %s: %s", path, str(err))
+
+
+# Uploaded files, stored once per distinct content
+file_store = ContentAddressedStore(UPLOAD_FOLDER)
@@ -0,0 +1,41 @@
+"""Shared, pooled HTTP session for outbound API calls."""
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+HTTP_POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', '10'))
+HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', '20'))
+
+_lock = threading.Lock()
+_session = None
+_session_pid = None
+
+
+def _build_session() -> requests.Session:
+    """Session with keep-alive connection pools and retries on transient failures."""
+    session = requests.Session()
+    retries = Retry(total=2, backoff_factor=0.2, status_forcelist=(502, 503, 504),
+                    allowed_methods=frozenset(['GET']))
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS,
+                          pool_maxsize=HTTP_POOL_MAXSIZE, max_retries=retries)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session() -> requests.Session:
+    """
+    The process-wide HTTP session. Connections (and their TLS handshakes) are
+    reused across requests and threads; a forked child builds its own session
+    rather than sharing sockets with its parent.
+    :return: Shared requests session.
+    """
+    global _session, _session_pid
+    if _session is None or _session_pid != os.getpid():
+        with _lock:
+            if _session is None or _session_pid != os.getpid():
+                _session = _build_session()
+                _session_pid = os.getpid()
+    return _session
@@ -0,0 +1,160 @@
+"""Token-bucket rate limiting in Redis, with an in-process fallback."""
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional, Tuple
+from extensions import redis_client
+
+# Bucket size (burst) and refill rate per second, in tokens, for each kind of
+# identity; a request spends its route's cost from every one of its buckets.
+# IPs get more room than users since many users may share one (NAT, proxies).
+RATE_LIMITS = {
+    'user': (float(os.getenv('RATE_LIMIT_USER_CAPACITY', '60')),
+             float(os.getenv('RATE_LIMIT_USER_REFILL_PER_SECOND', '1'))),
+    'ip': (float(os.getenv('RATE_LIMIT_IP_CAPACITY', '300')),
+           float(os.getenv('RATE_LIMIT_IP_REFILL_PER_SECOND', '5'))),
+}
+# Cost per "METHOD endpoint" (Flask endpoint names, so paths that merely share
+# a prefix, like polling /nlp/query/<job_id>, are not charged); anything else costs 1 token
+RATE_LIMIT_ROUTE_COSTS = json.loads(os.getenv('RATE_LIMIT_ROUTE_COSTS', json.dumps({
+    'POST nlp.handle_query': 10,
+    'POST documents_bp.upload_document': 5,
+})))
+# After a Redis error, use the local buckets for this long before trying Redis again
+RATE_LIMIT_REDIS_RETRY = float(os.getenv('RATE_LIMIT_REDIS_RETRY', '5'))
+# Buckets kept by the local fallback (least recently used are dropped)
+RATE_LIMIT_LOCAL_MAX_KEYS = int(os.getenv('RATE_LIMIT_LOCAL_MAX_KEYS', '100000'))
+
+# Refills and spends every bucket in KEYS atomically, all or nothing.
+# ARGV: cost, then capacity and refill per second for each key.
+# Returns {allowed, tokens left in the emptiest bucket, retry after ms}.
+TOKEN_BUCKET_SCRIPT = """
+local cost = tonumber(ARGV[1])
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) * 1000 + math.floor(tonumber(now_parts[2]) / 1000)
+
+local tokens = {}
+local allowed = 1
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[2 * i])
+    local rate = tonumber(ARGV[2 * i + 1])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local level = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    level = math.min(capacity, level + math.max(0, now - ts) * rate / 1000)
+    tokens[i] = level
+    if level < cost then
+        allowed = 0
+        wait = math.max(wait, math.ceil((cost - level) / rate * 1000))
+    end
+end
+
+local lowest = nil
+for i, key in ipairs(KEYS) do
+    local level = tokens[i]
+    if allowed == 1 then
+        level = level - cost
+    end
+    if lowest == nil or level < lowest then
+        lowest = level
+    end
+    redis.call('HSET', key, 'tokens', tostring(level), 'ts', now)
+    redis.call('PEXPIRE', key, math.ceil(tonumber(ARGV[2 * i]) / tonumber(ARGV[2 * i + 1]) * 1000))
+end
+return {allowed, tostring(lowest), wait}
+"""
+
+
+class Decision(NamedTuple):
+    """Outcome of a rate limit check."""
+    allowed: bool
+    remaining: float
+    retry_after: float
+
+
+def route_cost(method: str, endpoint: Optional[str], costs: Optional[Dict[str, float]] = None) -> float:
+    """
+    Tokens a request to this endpoint costs.
+    :param method: HTTP method.
+    :param endpoint: Flask endpoint name (None when no route matched).
+    :param costs: "METHOD endpoint" to cost (default RATE_LIMIT_ROUTE_COSTS).
+    :return: The configured cost, or 1.
+    """
+    costs = RATE_LIMIT_ROUTE_COSTS if costs is None else costs
+    return float(costs.get(f"{method} {endpoint}", 1.0))
+
+
+class RateLimiter:
+    """
+    Token buckets per identity (user and client IP), checked together in one
+    atomic Lua call so a request costs a single Redis round-trip. A request
+    passes only if every bucket holds its cost, so a heavy user cannot get
+    around the limit by switching IPs, nor many users behind one IP exhaust it.
+
+    While Redis is unreachable, buckets are kept per process instead; limits are
+    then per worker rather than global, which is looser but still bounded.
+    """
+
+    def __init__(self, limits: Optional[Dict[str, Tuple[float, float]]] = None,
+                 key_prefix: str = 'ratelimit', redis_retry: float = RATE_LIMIT_REDIS_RETRY,
+                 local_max_keys: int = RATE_LIMIT_LOCAL_MAX_KEYS):
+        self.limits = RATE_LIMITS if limits is None else limits
+        self.key_prefix = key_prefix
+        self.redis_retry = redis_retry
+        self.local_max_keys = local_max_keys
+        self._script = None
+        self._redis_down_until = 0.0
+        self._local: 'OrderedDict[str, Tuple[float, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, identities: Dict[str, str], cost: float = 1.0) -> Decision:
+        """
+        Spend `cost` tokens from the bucket of every identity, or none if any is short.
+        :param identities: Kind of identity (a key of `limits`) to its value,
+                           e.g. {"user": "42", "ip": "10.0.0.1"}.
+        :param cost: Tokens the request costs.
+        :return: Whether the request is allowed, the tokens left in the emptiest
+                 bucket, and seconds until it could be allowed.
+        """
+        buckets = [(f"{self.key_prefix}:{kind}:{value}",) + self.limits[kind]
+                   for kind, value in identities.items()]
+        if time.monotonic() >= self._redis_down_until:
+            try:
+                return self._check_redis(buckets, cost)
+            except Exception as err:
+                self._redis_down_until = time.monotonic() + self.redis_retry
+                logging.error("Redis rate limiter unavailable, using local buckets: %s", str(err))
+        return self._check_local(buckets, cost)
+
+    def _check_redis(self, buckets, cost: float) -> Decision:
+        if self._script is None:
+            self._script = redis_client.register_script(TOKEN_BUCKET_SCRIPT)
+        args = [cost]
+        for _, capacity, rate in buckets:
+            args += [capacity, rate]
+        allowed, remaining, wait_ms = self._script(keys=[key for key, _, _ in buckets], args=args)
+        return Decision(bool(allowed), float(remaining), int(wait_ms) / 1000)
+
+    def _check_local(self, buckets, cost: float) -> Decision:
+        now = time.monotonic()
+        with self._lock:
+            levels = []
+            for key, capacity, rate in buckets:
+                tokens, updated = self._local.pop(key, (capacity, now))
+                levels.append(min(capacity, tokens + (now - updated) * rate))
+            allowed = all(level >= cost for level in levels)
+            if allowed:
+                levels = [level - cost for level in levels]
+            for (key, _, _), level in zip(buckets, levels):
+                self._local[key] = (level, now)
+            while len(self._local) > self.local_max_keys:
+                self._local.popitem(last=False)
+
+        wait = 0.0
+        if not allowed:
+            wait = max((cost - level) / rate for level, (_, _, rate) in zip(levels, buckets))
+        return Decision(allowed, min(levels), max(wait, 0.0))
@@ -0,0 +1,79 @@
+"""Celery task metrics, shared between workers and the web app through Redis."""
+import time
+import logging
+import threading
+from typing import Dict
+from celery.signals import task_prerun, task_postrun
+from config import Config
+from extensions import redis_client
+from services.metrics import Collected, Histogram
+
+RUNS_KEY = 'metrics:celery:runs'
+SECONDS_KEY = 'metrics:celery:seconds'
+
+TASK_SECONDS = Histogram('celery_task_duration_seconds',
+                         'Run time of Celery tasks executed in this process.', ['task'])
+
+_started: Dict[str, float] = {}
+_broker = None
+_broker_lock = threading.Lock()
+
+
+@task_prerun.connect
+def record_task_start(task_id=None, **kwargs):
+    """Remember when a task started running."""
+    _started[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def record_task_end(task_id=None, task=None, state=None, **kwargs):
+    """
+    Record a finished task run (success, failure or retry) locally, and add it
+    to the Redis totals the web app's /metrics reads, since worker processes
+    are not scraped themselves.
+    """
+    start = _started.pop(task_id, None)
+    if start is None or task is None:
+        return
+    duration = time.perf_counter() - start
+    TASK_SECONDS.observe(duration, task=task.name)
+    try:
+        pipeline = redis_client.pipeline(transaction=False)
+        pipeline.hincrby(RUNS_KEY, f"{task.name}|{state}", 1)
+        pipeline.hincrbyfloat(SECONDS_KEY, task.name, duration)
+        pipeline.execute()
+    except Exception as err:
+        logging.error("Failed to record metrics for task %s: %s", task.name, str(err))
+
+
+def _decode(value):
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+def _task_runs():
+    return {tuple(_decode(field).split('|', 1)): int(value)
+            for field, value in redis_client.hgetall(RUNS_KEY).items()}
+
+
+def _task_seconds():
+    return {(_decode(field),): float(value)
+            for field, value in redis_client.hgetall(SECONDS_KEY).items()}
+
+
+def _queue_length():
+    """Length of the default Celery queue, when the broker is Redis."""
+    global _broker
+    if not Config.CELERY_BROKER_URL.startswith('redis'):
+        return {}
+    with _broker_lock:
+        if _broker is None:
+            import redis
+            _broker = redis.Redis.from_url(Config.CELERY_BROKER_URL, socket_timeout=0.5)
+    return {('celery',): _broker.llen('celery')}
+
+
+Collected('celery_task_runs_total', 'Finished Celery task runs by final state (SUCCESS, FAILURE, RETRY).',
+          'counter', ['task', 'state'], _task_runs)
+Collected('celery_task_seconds_total', 'Total run time of Celery tasks across all workers.',
+          'counter', ['task'], _task_seconds)
+Collected('celery_queue_length', 'Tasks waiting in the broker queue.', 'gauge', ['queue'], _queue_length)
@@ -0,0 +1,91 @@
+"""Shared fixtures: run from backend/ with `python -m pytest tests`."""
+import os
+import sys
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class ScriptedServer(ThreadingHTTPServer):
+    """
+    HTTP/1.1 (keep-alive) server answering from a script of responses, like
+    the search stub in benchmarks.harness. Each request takes the next entry;
+    the last one repeats.
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), ScriptedHandler)
+        # Entries are {"status": int, "body": JSON-able, "delay": seconds}
+        self.script: List[Dict[str, Any]] = [{"status": 200, "body": {"items": [{"snippet": "Stub result."}]}}]
+        # One entry per request: method, path and the client's (host, port)
+        self.requests: List[Dict[str, Any]] = []
+        self.connections = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}/"
+
+    def next_response(self, method: str, path: str, client) -> Dict[str, Any]:
+        with self.lock:
+            self.requests.append({"method": method, "path": path, "client": client})
+            return self.script[min(len(self.requests), len(self.script)) - 1]
+
+
+class ScriptedHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def _respond(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        response = self.server.next_response(self.command, self.path, self.client_address)
+        time.sleep(response.get('delay', 0))
+        body = json.dumps(response.get('body', {})).encode()
+        self.send_response(response.get('status', 200))
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except OSError:
+            # The client timed out and hung up
+            pass
+
+    do_GET = _respond
+    do_POST = _respond
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def http_server():
+    """A scripted HTTP server on a free local port."""
+    server = ScriptedServer()
+    threading.Thread(target=server.serve_forever, name='scripted-http', daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    """Back extensions.redis_client with an in-process fakeredis server, as benchmarks.harness does."""
+    fakeredis = pytest.importorskip('fakeredis')
+    from extensions import redis_client
+
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(redis_client, '_redis_client', client, raising=False)
+    return client
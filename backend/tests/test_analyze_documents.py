@@ -0,0 +1,97 @@
+"""Batch document analysis: bounded classification passages and per-document failures."""
+import numpy as np
+import pytest
+from blueprints.nlp import ai_engine
+from blueprints.nlp.query_classifier import train_query_classifier
+
+SPACY_MAX_LENGTH = 1000000
+
+
+class StrictNLP:
+    """Whitespace 'spaCy' that, like spaCy, refuses texts over max_length."""
+    pipe_names = []
+
+    def __init__(self):
+        self.texts = []
+
+    def pipe(self, texts, batch_size=None, n_process=1, disable=()):
+        for text in texts:
+            if len(text) > SPACY_MAX_LENGTH:
+                raise ValueError(f"Text of length {len(text)} exceeds maximum of {SPACY_MAX_LENGTH}")
+            self.texts.append(text)
+            yield [Token(word) for word in text.split()]
+
+
+class Token:
+    def __init__(self, text):
+        self.lemma_ = text.lower()
+        self.is_stop = False
+        self.is_punct = not text.isalnum()
+
+
+class NoEmbeddingCache:
+    def get_embedding(self, text_hash, version):
+        return None
+
+    def put_embedding(self, text_hash, version, vector):
+        pass
+
+
+@pytest.fixture
+def documents(monkeypatch):
+    """Serve document texts by path, with stub models around the real classifier."""
+    texts = {}
+    nlp = StrictNLP()
+    classifier = train_query_classifier(
+        ["breach of contract damages", "agreement breach contract", "statute section act", "act statute provision"],
+        ["contract", "contract", "statute", "statute"], n_features=2 ** 12)
+    monkeypatch.setitem(ai_engine.models._models, 'spacy', nlp)
+    monkeypatch.setitem(ai_engine.models._models, 'classifier', classifier)
+    monkeypatch.setattr(ai_engine, 'parse_document', lambda path: texts[path])
+    monkeypatch.setattr(ai_engine, 'file_digest', lambda path: f"hash-{path}")
+    monkeypatch.setattr(ai_engine, 'extraction_cache', NoEmbeddingCache())
+    monkeypatch.setattr(ai_engine, 'embed_documents', lambda batch: [np.ones(4, dtype=np.float32) for _ in batch])
+    monkeypatch.setattr(ai_engine, 'current_case_index', lambda: None)
+    monkeypatch.setattr(ai_engine, 'embedding_version', lambda: 'test')
+    texts['nlp'] = nlp
+    return texts
+
+
+def test_document_over_spacy_max_length_is_classified(documents):
+    documents['long.pdf'] = "the statute section of the act applies. " * 30000
+    documents['short.pdf'] = "breach of contract damages claimed"
+    assert len(documents['long.pdf']) > SPACY_MAX_LENGTH
+
+    results = ai_engine.analyze_documents(['long.pdf', 'short.pdf'])
+
+    assert [result.get("classification") for result in results] == ['statute', 'contract']
+    assert all("error" not in result for result in results)
+    # Only bounded passages of the opening text reach spaCy and the classifier
+    passages = documents['nlp'].texts
+    assert max(len(passage) for passage in passages) <= ai_engine.DOCUMENT_PASSAGE_CHARS
+    assert sum(len(passage) for passage in passages) <= (ai_engine.DOCUMENT_CLASSIFY_CHARS
+                                                         + len(documents['short.pdf']))
+
+
+def test_failed_classification_only_fails_its_document(documents, monkeypatch):
+    documents['bad.pdf'] = "unparseable"
+    documents['good.pdf'] = "statute act provision"
+    classify_document = ai_engine.classify_document
+
+    def flaky(text):
+        if text == "unparseable":
+            raise RuntimeError("model error")
+        return classify_document(text)
+    monkeypatch.setattr(ai_engine, 'classify_document', flaky)
+
+    results = ai_engine.analyze_documents(['bad.pdf', 'good.pdf'])
+
+    assert results[0] == {"error": "Error classifying document."}
+    assert results[1]["classification"] == 'statute'
+    assert results[1]["text_hash"] == 'hash-good.pdf'
+
+
+def test_empty_document_has_no_classification(documents):
+    documents['blank.pdf'] = "   "
+
+    assert ai_engine.analyze_documents(['blank.pdf'])[0]["classification"] is None
@@ -0,0 +1,85 @@
+"""IVF approximate search: recall against exact search, updates and reloads."""
+import numpy as np
+import pytest
+from blueprints.nlp.case_index import CaseEmbeddingIndex
+from blueprints.nlp.ann_index import DEFAULT_NPROBE, IVFCaseIndex, open_case_index
+
+DIM = 32
+
+
+def clustered_vectors(count, clusters=40, seed=0):
+    """Points around random centres, like embeddings of related cases."""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, DIM))
+    labels = rng.integers(0, clusters, size=count)
+    return (centres[labels] + 0.3 * rng.standard_normal((count, DIM))).astype(np.float32)
+
+
+@pytest.fixture
+def indexes(tmp_path):
+    """An exact index of 4000 cases and an IVF index built over it."""
+    exact = CaseEmbeddingIndex.create(str(tmp_path / 'case_index'), dim=DIM)
+    vectors = clustered_vectors(4000)
+    exact.add_many({f"CASE-{i}": vector for i, vector in enumerate(vectors)})
+    return exact, IVFCaseIndex.build(exact), vectors
+
+
+def nearby_queries(vectors, count, seed=1):
+    """Queries close to (but not on) indexed cases."""
+    rng = np.random.default_rng(seed)
+    noise = 0.3 * rng.standard_normal((count, DIM)).astype(np.float32)
+    return vectors[rng.choice(len(vectors), size=count, replace=False)] + noise
+
+
+def recall(ivf, exact, queries, k, nprobe):
+    found = 0
+    for query in queries:
+        expected = {case_id for case_id, _ in exact.search(query, k)}
+        found += len(expected & {case_id for case_id, _ in ivf.search(query, k, nprobe=nprobe)})
+    return found / (k * len(queries))
+
+
+def test_recall_against_exact_search(indexes):
+    exact, ivf, vectors = indexes
+    queries = nearby_queries(vectors, 100)
+
+    assert recall(ivf, exact, queries, k=10, nprobe=DEFAULT_NPROBE) >= 0.95
+    # More probes never lose recall, and probing every list is exact search
+    assert (recall(ivf, exact, queries, k=10, nprobe=2) <= recall(ivf, exact, queries, k=10, nprobe=8)
+            <= recall(ivf, exact, queries, k=10, nprobe=DEFAULT_NPROBE))
+    assert recall(ivf, exact, queries, k=10, nprobe=ivf.nlist) == 1.0
+    for query in queries[:5]:
+        assert ivf.search(query, k=5, nprobe=ivf.nlist) == pytest.approx(exact.search(query, k=5))
+
+
+def test_adds_and_removes_are_searchable(indexes):
+    _, ivf, vectors = indexes
+    new_vector = clustered_vectors(1, seed=2)[0]
+
+    ivf.add('CASE-NEW', new_vector)
+    assert ivf.search(new_vector, k=1)[0][0] == 'CASE-NEW'
+    assert ivf.remove('CASE-17')
+    assert not ivf.remove('CASE-17')
+    assert 'CASE-17' not in [case_id for case_id, _ in ivf.search(vectors[17], k=10, nprobe=ivf.nlist)]
+    assert len(ivf) == 4000
+
+
+def test_reopen_and_refresh_after_a_write(indexes):
+    exact, ivf, vectors = indexes
+    reader = open_case_index(exact.path, backend='ivf')
+    assert isinstance(reader, IVFCaseIndex)
+    assert reader.nlist == ivf.nlist
+    assert reader.refresh() is reader
+    assert reader.search(vectors[5], k=1)[0][0] == 'CASE-5'
+
+    ivf.add_many({'CASE-NEW': clustered_vectors(1, seed=2)[0]})
+
+    refreshed = reader.refresh()
+    assert refreshed is not reader
+    assert 'CASE-NEW' in refreshed
+    assert refreshed.search(clustered_vectors(1, seed=2)[0], k=1)[0][0] == 'CASE-NEW'
+
+
+def test_empty_index_cannot_be_built(tmp_path):
+    with pytest.raises(ValueError):
+        IVFCaseIndex.build(CaseEmbeddingIndex.create(str(tmp_path / 'empty'), dim=DIM))
@@ -0,0 +1,52 @@
+"""Micro-batching of concurrent calls."""
+import threading
+import pytest
+from blueprints.nlp.batching import MicroBatcher
+
+
+def test_concurrent_calls_share_a_batch_and_get_their_own_results():
+    batches = []
+
+    def double(items):
+        batches.append(list(items))
+        return [item * 2 for item in items]
+    batcher = MicroBatcher(double, max_batch_size=8, max_wait=0.05, name='test-batcher')
+    results = {}
+
+    def call(item):
+        results[item] = batcher(item, timeout=5)
+    threads = [threading.Thread(target=call, args=(item,)) for item in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {item: item * 2 for item in range(8)}
+    assert len(batches) < 8
+    assert batcher.stats.snapshot()['items'] == 8
+
+
+@pytest.mark.parametrize('returned', [[], [1], [1, 2, 3]])
+def test_wrong_number_of_results_fails_every_caller(returned):
+    batcher = MicroBatcher(lambda items: returned, max_batch_size=2, max_wait=1, name='test-batcher')
+
+    futures = [batcher.submit(item) for item in ('a', 'b')]
+
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result(timeout=5)
+    assert batcher.stats.snapshot()['errors'] == 1
+
+
+def test_failed_batch_fails_its_callers_only():
+    def process(items):
+        if 'bad' in items:
+            raise RuntimeError("model error")
+        return items
+    batcher = MicroBatcher(process, max_batch_size=1, max_wait=0, name='test-batcher')
+
+    bad, good = batcher.submit('bad'), batcher.submit('good')
+
+    with pytest.raises(RuntimeError):
+        bad.result(timeout=5)
+    assert good.result(timeout=5) == 'good'
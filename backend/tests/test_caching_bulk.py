@@ -0,0 +1,152 @@
+"""Bulk Redis cache helpers: MGET reads, pipelined writes and SCAN deletes."""
+import pytest
+import numpy as np
+import redis
+from services import caching
+from services.caching import cache_get, cache_set, cache_get_many, cache_set_many, cache_delete_pattern
+
+
+class CommandCounter:
+    """Wraps a Redis client, counting MGET calls and executed pipelines."""
+
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def pipeline(self, *args, **kwargs):
+        pipeline = self.client.pipeline(*args, **kwargs)
+        execute = pipeline.execute
+
+        def counted_execute(*execute_args, **execute_kwargs):
+            self.calls.append(('pipeline', len(pipeline.command_stack)))
+            return execute(*execute_args, **execute_kwargs)
+        pipeline.execute = counted_execute
+        return pipeline
+
+    def mget(self, *args, **kwargs):
+        self.calls.append(('mget', len(args[0])))
+        return self.client.mget(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+class FailingRedis:
+    """A Redis that is down."""
+
+    def __getattr__(self, name):
+        def fail(*args, **kwargs):
+            raise redis.exceptions.ConnectionError("Connection refused")
+        return fail
+
+
+@pytest.fixture
+def counter(fake_redis, monkeypatch):
+    from extensions import redis_client
+
+    counter = CommandCounter(fake_redis)
+    monkeypatch.setattr(redis_client, '_redis_client', counter)
+    return counter
+
+
+def test_set_many_then_get_many_round_trips_values(fake_redis):
+    values = {
+        'result:1': {"response": "Answer", "classification": "contract", "score": 0.5},
+        'result:2': ["a", "b", 3],
+        'result:3': "plain text",
+    }
+    cache_set_many(values)
+
+    assert cache_get_many(values.keys()) == values
+    # Single-key reads see the same encoding
+    assert cache_get('result:1') == values['result:1']
+
+
+def test_arrays_round_trip(fake_redis):
+    vector = np.arange(16, dtype=np.float32)
+    cache_set_many({'embedding:1': vector})
+
+    cached = cache_get_many(['embedding:1'])['embedding:1']
+    assert cached.dtype == np.float32
+    np.testing.assert_array_equal(cached, vector)
+
+
+def test_get_many_returns_only_hits(fake_redis):
+    cache_set('hit:1', 1)
+    cache_set('hit:2', 2)
+
+    assert cache_get_many(['hit:1', 'miss:1', 'hit:2', 'miss:2']) == {'hit:1': 1, 'hit:2': 2}
+    assert cache_get_many(['miss:1']) == {}
+
+
+def test_get_many_uses_one_mget(counter):
+    cache_set_many({f"key:{i}": i for i in range(50)})
+    counter.calls.clear()
+
+    assert len(cache_get_many(f"key:{i}" for i in range(60))) == 50
+    assert counter.calls == [('mget', 60)]
+
+
+def test_get_many_without_keys_skips_redis(counter):
+    assert cache_get_many([]) == {}
+    assert counter.calls == []
+
+
+def test_set_many_pipelines_in_batches(counter):
+    cache_set_many({f"key:{i}": i for i in range(5)}, batch_size=2)
+
+    assert counter.calls == [('pipeline', 2), ('pipeline', 2), ('pipeline', 1)]
+    assert counter.client.dbsize() == 5
+
+
+def test_set_many_sets_the_ttl(fake_redis):
+    cache_set_many({'short': 1, 'other': 2}, timeout=30)
+
+    for key in ('short', 'other'):
+        assert 0 < fake_redis.ttl(key) <= 30
+    cache_set_many({'short': 1}, timeout=600)
+    assert 30 < fake_redis.ttl('short') <= 600
+
+
+def test_undecodable_entries_are_skipped(fake_redis):
+    cache_set('good', {"ok": True})
+    fake_redis.set('corrupt', b'\xc1\xff\x00garbage')
+
+    assert cache_get_many(['good', 'corrupt']) == {'good': {"ok": True}}
+
+
+def test_redis_errors_are_logged_not_raised(monkeypatch, caplog):
+    from extensions import redis_client
+
+    monkeypatch.setattr(redis_client, '_redis_client', FailingRedis(), raising=False)
+
+    assert cache_get_many(['a', 'b']) == {}
+    cache_set_many({'a': 1})
+    assert cache_delete_pattern('a*') == 0
+    assert "Failed to get 2 cache keys" in caplog.text
+    assert "Failed to set 1 cache keys" in caplog.text
+
+
+def test_delete_pattern_removes_only_matches(fake_redis):
+    cache_set_many({f"user:42:query:{i}": i for i in range(25)})
+    cache_set_many({f"user:43:query:{i}": i for i in range(5)})
+
+    assert cache_delete_pattern('user:42:query:*', batch_size=10) == 25
+    assert fake_redis.keys('user:42:*') == []
+    assert len(fake_redis.keys('user:43:*')) == 5
+    assert cache_delete_pattern('user:42:query:*') == 0
+
+
+def test_delete_pattern_unlinks_in_batches(fake_redis, monkeypatch):
+    cache_set_many({f"doomed:{i}": i for i in range(23)})
+    batches = []
+    unlink = fake_redis.unlink
+
+    def counted_unlink(*keys):
+        batches.append(len(keys))
+        return unlink(*keys)
+    monkeypatch.setattr(fake_redis, 'unlink', counted_unlink)
+
+    assert cache_delete_pattern('doomed:*', batch_size=10) == 23
+    assert batches == [10, 10, 3]
+    assert caching.redis_client.dbsize() == 0
@@ -0,0 +1,145 @@
+"""Case embedding index: persistence, rebuilds under live readers, and IVF search."""
+import json
+import os
+import numpy as np
+import pytest
+from blueprints.nlp.case_index import IDS_FILE, MIN_CAPACITY, CaseEmbeddingIndex, build_case_index
+
+DIM = 16
+
+
+def random_vectors(count, seed=0):
+    return np.random.default_rng(seed).standard_normal((count, DIM)).astype(np.float32)
+
+
+@pytest.fixture
+def index_path(tmp_path):
+    return str(tmp_path / 'case_index')
+
+
+def fill(path, count, seed=0):
+    index = CaseEmbeddingIndex.create(path, dim=DIM)
+    vectors = random_vectors(count, seed)
+    index.add_many({f"CASE-{i}": vector for i, vector in enumerate(vectors)})
+    return index, vectors
+
+
+def exact_top_k(vectors, ids, query, k):
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    scores = normalized @ (query / np.linalg.norm(query))
+    return [ids[i] for i in np.argsort(-scores, kind='stable')[:k]]
+
+
+def test_search_ranks_by_cosine_similarity(index_path):
+    index, vectors = fill(index_path, 300)
+    query = random_vectors(1, seed=9)[0]
+
+    results = index.search(query, k=10)
+
+    assert [case_id for case_id, _ in results] == exact_top_k(vectors, [f"CASE-{i}" for i in range(300)],
+                                                              query, 10)
+    assert index.search(vectors[42] * 5, k=1) == [('CASE-42', pytest.approx(1.0, abs=1e-5))]
+
+
+def test_add_replaces_and_remove_frees_rows(index_path):
+    index, vectors = fill(index_path, 10)
+
+    index.add('CASE-3', vectors[7])
+    assert len(index) == 10
+    assert sorted(case_id for case_id, _ in index.search(vectors[7], k=2)) == ['CASE-3', 'CASE-7']
+
+    assert index.remove('CASE-3')
+    assert not index.remove('CASE-3')
+    assert 'CASE-3' not in index
+    assert [case_id for case_id, _ in index.search(vectors[7], k=2)][0] == 'CASE-7'
+    assert 'CASE-3' not in [case_id for case_id, _ in index.search(vectors[7], k=10)]
+
+    # The next insert reuses the tombstoned row instead of growing the index
+    index.add('CASE-NEW', vectors[3])
+    index.save()
+    with open(os.path.join(index_path, IDS_FILE), encoding='utf-8') as f:
+        table = json.load(f)
+    assert table['size'] == 10
+    assert table['ids'][3] == 'CASE-NEW'
+
+
+def test_growth_and_compaction_persist(index_path):
+    index, vectors = fill(index_path, MIN_CAPACITY + 10)
+    reopened = CaseEmbeddingIndex.open(index_path)
+    assert len(reopened) == MIN_CAPACITY + 10
+    assert reopened.search(vectors[MIN_CAPACITY + 5], k=1)[0][0] == f"CASE-{MIN_CAPACITY + 5}"
+
+    for i in range(0, MIN_CAPACITY + 10, 2):
+        index.remove(f"CASE-{i}")
+    index.compact()
+
+    reopened = CaseEmbeddingIndex.open(index_path)
+    assert len(reopened) == (MIN_CAPACITY + 10) // 2
+    assert np.load(os.path.join(index_path, 'embeddings.npy'), mmap_mode='r').shape[0] == MIN_CAPACITY
+    for i in (1, 501, MIN_CAPACITY + 9):
+        assert reopened.search(vectors[i], k=1)[0][0] == f"CASE-{i}"
+    assert 'CASE-500' not in reopened
+
+
+def test_refresh_reloads_only_after_a_write(index_path):
+    writer, vectors = fill(index_path, 20)
+    reader = CaseEmbeddingIndex.open(index_path)
+    assert reader.refresh() is reader
+
+    writer.add('CASE-EXTRA', vectors[0] * -1)
+    # Nothing is published until the writer saves
+    assert reader.refresh() is reader
+    writer.save()
+
+    refreshed = reader.refresh()
+    assert refreshed is not reader
+    assert 'CASE-EXTRA' in refreshed
+    assert refreshed.refresh() is refreshed
+
+
+def test_open_rejects_an_id_table_that_does_not_fit(index_path):
+    fill(index_path, 5)
+    with open(os.path.join(index_path, IDS_FILE), 'w', encoding='utf-8') as f:
+        json.dump({'dim': DIM, 'size': MIN_CAPACITY + 1, 'ids': []}, f)
+
+    with pytest.raises(ValueError):
+        CaseEmbeddingIndex.open(index_path)
+
+
+def test_compact_keeps_mapped_readers_valid(index_path):
+    writer, vectors = fill(index_path, 5000)
+    reader = CaseEmbeddingIndex.open(index_path)
+    assert reader.search(vectors[4500], k=1)[0][0] == 'CASE-4500'
+
+    for i in range(1000, 5000):
+        writer.remove(f"CASE-{i}")
+    writer.compact()
+
+    # The reader still has the old matrix mapped and its old row layout; it must not fault
+    assert reader.search(vectors[10], k=1)[0][0] == 'CASE-10'
+    refreshed = reader.refresh()
+    assert refreshed is not reader
+    assert len(refreshed) == 1000
+    assert refreshed.search(vectors[10], k=1)[0][0] == 'CASE-10'
+    assert 'CASE-4500' not in refreshed
+
+
+def test_rebuild_publishes_only_the_complete_index(index_path):
+    fill(index_path, 200)
+    reader = CaseEmbeddingIndex.open(index_path)
+    cases = {f"NEW-{i}": f"text {i}" for i in range(150)}
+    vectors = random_vectors(150, seed=1)
+    seen_during_build = []
+
+    def embed_batch(texts):
+        # While the build runs, a refreshing reader still sees the old index
+        seen_during_build.append(len(reader.refresh()))
+        return [vectors[int(text.split()[1])] for text in texts]
+
+    built = build_case_index(index_path, cases, embed_batch, batch_size=50)
+
+    assert seen_during_build == [200, 200, 200]
+    assert len(built) == 150
+    refreshed = reader.refresh()
+    assert len(refreshed) == 150
+    assert refreshed.search(vectors[7], k=1)[0][0] == 'NEW-7'
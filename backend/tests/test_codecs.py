@@ -0,0 +1,72 @@
+"""Cache codecs without pickle, and the one-off migration of pickled entries."""
+import pickle
+import numpy as np
+import pytest
+from services import codecs
+from services.codecs import encode, decode, is_pickled
+from services.caching import migrate_legacy_entries, cache_get
+
+
+def test_pickle_is_off_by_default():
+    assert codecs.CACHE_ALLOW_PICKLE is False
+
+
+def test_json_like_values_and_arrays_do_not_use_pickle():
+    for value in ({"result": {"answer": "text", "score": 0.5}, "items": [1, None]}, "text",
+                  np.zeros(8, dtype=np.float32)):
+        data = encode(value)
+        assert not is_pickled(data)
+        decoded = decode(data)
+        if isinstance(value, np.ndarray):
+            np.testing.assert_array_equal(decoded, value)
+        else:
+            assert decoded == value
+
+
+def test_values_only_pickle_can_encode_are_refused():
+    with pytest.raises(TypeError):
+        encode({1, 2, 3})
+    assert is_pickled(encode({1, 2, 3}, allow_pickle=True))
+
+
+def test_pickled_entries_are_not_loaded():
+    legacy = pickle.dumps({"response": "old"})
+    tagged = encode({"response": "old"}, codec='pickle')
+    for data in (legacy, tagged):
+        assert is_pickled(data)
+        with pytest.raises(ValueError):
+            decode(data)
+        assert decode(data, allow_pickle=True) == {"response": "old"}
+
+
+def test_migration_rewrites_pickled_entries(fake_redis):
+    fake_redis.set('nlp:query:1', pickle.dumps({"response": "old answer"}), ex=300)
+    fake_redis.set('nlp:query:2', encode(np.arange(4, dtype=np.float32), codec='pickle'))
+    fake_redis.set('nlp:query:3', encode({"response": "already migrated"}))
+    fake_redis.set('nlp:query:4', pickle.dumps({("tuple", "key"): 1}))
+    fake_redis.set('nlp:query:5', b'\x80 not really a pickle')
+    fake_redis.hset('nlp:query:6', 'field', 'value')
+    fake_redis.set('celery-task-meta-1', b'{"status": "SUCCESS"}')
+
+    counts = migrate_legacy_entries('nlp:query:*', batch_size=2)
+
+    assert counts == {'scanned': 6, 'migrated': 2, 'dropped': 1, 'skipped': 3}
+    assert cache_get('nlp:query:1') == {"response": "old answer"}
+    assert 0 < fake_redis.ttl('nlp:query:1') <= 300
+    np.testing.assert_array_equal(cache_get('nlp:query:2'), np.arange(4, dtype=np.float32))
+    assert fake_redis.ttl('nlp:query:2') == -1
+    assert cache_get('nlp:query:3') == {"response": "already migrated"}
+    assert not fake_redis.exists('nlp:query:4')
+    assert fake_redis.get('nlp:query:5') == b'\x80 not really a pickle'
+    assert fake_redis.hget('nlp:query:6', 'field') == b'value'
+    assert fake_redis.get('celery-task-meta-1') == b'{"status": "SUCCESS"}'
+    # Nothing is left for a second run
+    assert migrate_legacy_entries('nlp:query:*')['migrated'] == 0
+
+
+def test_migration_dry_run_changes_nothing(fake_redis):
+    legacy = pickle.dumps({"response": "old"})
+    fake_redis.set('nlp:query:1', legacy)
+
+    assert migrate_legacy_entries('nlp:query:*', dry_run=True)['migrated'] == 1
+    assert fake_redis.get('nlp:query:1') == legacy
@@ -0,0 +1,99 @@
+"""Per-user query context: window limits and eviction, locally and in Redis."""
+import pytest
+from services import context_store
+from services.context_store import QueryContextStore
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(context_store.time, 'monotonic', clock)
+    return clock
+
+
+def test_window_keeps_the_latest_turns():
+    store = QueryContextStore(max_turns=3)
+
+    for query in ('one', 'two', 'three', 'four'):
+        combined = store.append('u1', query)
+
+    assert combined == 'two three four'
+    assert store.append('u2', 'other user') == 'other user'
+
+
+def test_window_keeps_within_the_token_budget_but_always_the_newest_query():
+    store = QueryContextStore(max_turns=10, max_tokens=5)
+
+    store.append('u1', 'a b c')
+    assert store.append('u1', 'd e') == 'a b c d e'
+    assert store.append('u1', 'f') == 'd e f'
+    assert store.append('u1', 'g h i j k l m') == 'g h i j k l m'
+
+
+def test_idle_users_are_evicted(clock):
+    store = QueryContextStore(idle_ttl=60)
+    store.append('idle', 'old question')
+    clock.now += 30
+    store.append('active', 'first')
+
+    clock.now += 45
+    assert store.append('active', 'second') == 'first second'
+    assert len(store) == 1
+    # The idle user starts over
+    assert store.append('idle', 'new question') == 'new question'
+
+
+def test_least_recently_seen_users_beyond_the_limit_are_evicted(clock):
+    store = QueryContextStore(max_users=2)
+    store.append('a', 'a1')
+    store.append('b', 'b1')
+    store.append('a', 'a2')
+    store.append('c', 'c1')
+
+    assert len(store) == 2
+    assert store.append('a', 'a3') == 'a1 a2 a3'
+    assert store.append('b', 'b2') == 'b2'
+
+
+def test_clear_forgets_a_user():
+    store = QueryContextStore()
+    store.append('u1', 'question')
+    store.clear('u1')
+
+    assert len(store) == 0
+    assert store.append('u1', 'again') == 'again'
+
+
+def test_redis_window_is_trimmed_and_expires(fake_redis):
+    store = QueryContextStore(max_turns=3, max_tokens=4, idle_ttl=60, use_redis=True)
+
+    for query in ('a', 'b c', 'd', 'e'):
+        combined = store.append('u1', query)
+
+    assert combined == 'b c d e'
+    assert fake_redis.lrange('ctx:u1', 0, -1) == [b'b c', b'd', b'e']
+    assert 0 < fake_redis.ttl('ctx:u1') <= 60
+    assert store.append('u1', 'f g h') == 'e f g h'
+    assert len(store) == 0
+    store.clear('u1')
+    assert not fake_redis.exists('ctx:u1')
+
+
+def test_redis_errors_fall_back_to_the_local_store(fake_redis, monkeypatch):
+    store = QueryContextStore(use_redis=True)
+
+    def unavailable(*args, **kwargs):
+        raise ConnectionError("Redis is down")
+    monkeypatch.setattr(store, '_append_redis', unavailable)
+
+    store.append('u1', 'first')
+    assert store.append('u1', 'second') == 'first second'
+    assert len(store) == 1
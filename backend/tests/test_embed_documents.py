@@ -0,0 +1,69 @@
+"""Batch document embedding: sizing documents up from a bounded prefix."""
+import re
+import numpy as np
+import pytest
+from blueprints.nlp import ai_engine
+
+
+class WordTokenizer:
+    """Whitespace 'tokenizer' with the parts of the Hugging Face API we use; records what it reads."""
+
+    def __init__(self):
+        self.chars_read = 0
+
+    def num_special_tokens_to_add(self):
+        return 2
+
+    def __call__(self, text, add_special_tokens=False, truncation=False, max_length=None,
+                 return_offsets_mapping=False):
+        if isinstance(text, list):
+            encodings = [self(item, add_special_tokens, truncation, max_length) for item in text]
+            return {'input_ids': [encoding['input_ids'] for encoding in encodings]}
+        self.chars_read += len(text)
+        words = list(re.finditer(r'\S+', text))
+        if truncation:
+            words = words[:max_length]
+        return {'input_ids': [len(word.group()) for word in words],
+                'offset_mapping': [word.span() for word in words]}
+
+
+@pytest.fixture
+def tokenizer(monkeypatch):
+    tokenizer = WordTokenizer()
+    monkeypatch.setitem(ai_engine.models._models, 'tokenizer', tokenizer)
+    monkeypatch.setattr(ai_engine, 'EMBED_MAX_LENGTH', 12)
+    monkeypatch.setattr(ai_engine, 'CHUNK_OVERLAP', 2)
+    monkeypatch.setattr(ai_engine, 'EMBED_SHORT_CHARS', 100)
+    windows = []
+
+    def embed_windows(batch):
+        windows.extend(batch)
+        return np.array([[len(ids), sum(ids)] for ids in batch], dtype=np.float32)
+    monkeypatch.setattr(ai_engine, 'embed_windows_batched', embed_windows)
+    tokenizer.windows = windows
+    return tokenizer
+
+
+def test_long_documents_are_tokenized_once_past_the_prefix(tokenizer):
+    long_text = "word " * 10000
+    short_text = "a short document"
+
+    vectors = ai_engine.embed_documents([long_text, short_text, "   "])
+
+    # The long text is read in full once (by the windowed path), not twice
+    assert tokenizer.chars_read <= len(long_text) + 100 + len(short_text) + 3
+    assert vectors[2] is None
+    np.testing.assert_array_equal(vectors[1], [3, 14])
+    assert vectors[0] is not None
+    # The short document went through the batcher as its own single window
+    assert tokenizer.windows.count([1, 5, 8]) == 1
+
+
+def test_vectors_match_whether_or_not_the_prefix_covers_the_text(tokenizer, monkeypatch):
+    texts = ["one two three four", "x " * 40, "y " * 200]
+    expected = ai_engine.embed_documents(texts)
+    # A prefix too short to settle the size only sends the text down the windowed path
+    monkeypatch.setattr(ai_engine, 'EMBED_SHORT_CHARS', 5)
+
+    for vector, other in zip(expected, ai_engine.embed_documents(texts)):
+        np.testing.assert_allclose(vector, other)
@@ -0,0 +1,112 @@
+"""Content-addressed upload store."""
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from services.file_store import ContentAddressedStore, UploadTooLarge
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ContentAddressedStore(str(tmp_path / 'uploads'), chunk_size=4)
+
+
+def test_directories_are_created_on_first_save(store):
+    assert not os.path.exists(store.root)
+
+    with store.save(io.BytesIO(b'first upload'), suffix='.pdf') as stored:
+        pass
+
+    assert sorted(os.listdir(store.root)) == sorted(['tmp', 'locks', stored.digest[:2]])
+    with open(store.resolve(stored.path), 'rb') as stored_file:
+        assert stored_file.read() == b'first upload'
+
+
+def test_concurrent_identical_uploads_store_one_file(store):
+    def upload(_):
+        with store.save(io.BytesIO(b'same bytes' * 100), suffix='.pdf') as stored:
+            return stored
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(upload, range(32)))
+
+    assert len({stored.path for stored in results}) == 1
+    assert [stored.deduplicated for stored in results].count(False) == 1
+    assert os.listdir(os.path.join(store.root, 'tmp')) == []
+    with open(store.resolve(results[0].path), 'rb') as stored_file:
+        assert stored_file.read() == b'same bytes' * 100
+
+
+def test_release_never_removes_a_file_a_concurrent_upload_references(store):
+    references = set()
+    checking = threading.Event()
+    recorded = threading.Event()
+
+    def upload(owner):
+        with store.save(io.BytesIO(b'shared content'), suffix='.pdf') as stored:
+            references.add(owner)
+        recorded.set()
+        return stored.path
+
+    def is_referenced():
+        # Give a duplicate upload every chance to slip in between this check and
+        # the removal; holding the file's lock keeps it out until release is done
+        checking.set()
+        recorded.wait(0.2)
+        return False
+
+    path = upload('first')
+    recorded.clear()
+    references.discard('first')
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        released = pool.submit(store.release, path, is_referenced)
+        checking.wait()
+        assert upload('second') == path
+        released.result()
+
+    # The second upload's reference is recorded, so its file must be there
+    assert references == {'second'}
+    assert os.path.exists(store.resolve(path))
+    store.release(path, lambda: False)
+    assert not os.path.exists(store.resolve(path))
+
+
+def test_failed_block_removes_only_a_file_it_placed(store):
+    with store.save(io.BytesIO(b'kept'), suffix='.pdf') as kept:
+        pass
+
+    with pytest.raises(RuntimeError):
+        with store.save(io.BytesIO(b'kept'), suffix='.pdf'):
+            raise RuntimeError("commit failed")
+    with pytest.raises(RuntimeError):
+        with store.save(io.BytesIO(b'new'), suffix='.pdf') as placed:
+            raise RuntimeError("commit failed")
+
+    assert os.path.exists(store.resolve(kept.path))
+    assert not os.path.exists(store.resolve(placed.path))
+    assert os.listdir(os.path.join(store.root, 'tmp')) == []
+
+
+def test_spooled_upload_is_renamed_into_place(store):
+    upload = store.spool()
+    upload.write(b'spooled ')
+    upload.write(b'bytes')
+
+    with store.save(upload, suffix='.docx', max_bytes=100) as stored:
+        pass
+    upload.close()
+
+    assert stored.size == 13
+    assert stored.path.endswith('.docx')
+    assert os.listdir(os.path.join(store.root, 'tmp')) == []
+    with open(store.resolve(stored.path), 'rb') as stored_file:
+        assert stored_file.read() == b'spooled bytes'
+
+
+def test_oversized_upload_is_refused_and_cleaned_up(store):
+    with pytest.raises(UploadTooLarge):
+        with store.save(io.BytesIO(b'x' * 100), max_bytes=10):
+            pass
+
+    assert os.listdir(os.path.join(store.root, 'tmp')) == []
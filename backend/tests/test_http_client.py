@@ -0,0 +1,125 @@
+"""Search client: connection reuse, timeouts and retries of the shared HTTP session."""
+import threading
+import pytest
+import requests
+from services import http_client
+from blueprints.nlp import ai_engine
+
+
+@pytest.fixture(autouse=True)
+def fresh_session(monkeypatch):
+    """Each test starts with a new process-wide session."""
+    monkeypatch.setattr(http_client, '_session', None)
+    monkeypatch.setattr(http_client, '_session_pid', None)
+
+
+@pytest.fixture
+def search_api(http_server, monkeypatch):
+    """Point web search at the scripted server, with an empty result cache."""
+    monkeypatch.setattr(ai_engine, 'SEARCH_API_URL', http_server.url)
+    monkeypatch.setenv('GOOGLE_API_KEY', 'test')
+    monkeypatch.setenv('SEARCH_ENGINE_ID', 'test')
+    ai_engine.web_search_cache.clear()
+    yield http_server
+    ai_engine.web_search_cache.clear()
+
+
+def test_session_is_shared_and_rebuilt_after_fork(monkeypatch):
+    session = http_client.get_session()
+    assert http_client.get_session() is session
+
+    monkeypatch.setattr(http_client.os, 'getpid', lambda: -1)
+    assert http_client.get_session() is not session
+
+
+def test_requests_reuse_one_connection(http_server):
+    for _ in range(5):
+        assert http_client.get_session().get(http_server.url, timeout=5).status_code == 200
+
+    assert len(http_server.requests) == 5
+    assert http_server.connections == 1
+    assert len({request['client'] for request in http_server.requests}) == 1
+
+
+def test_concurrent_requests_share_the_pool(http_server):
+    http_server.script = [{"status": 200, "delay": 0.05}]
+    session = http_client.get_session()
+
+    def call():
+        for _ in range(5):
+            session.get(http_server.url, timeout=5)
+
+    threads = [threading.Thread(target=call) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(http_server.requests) == 20
+    # At most one connection per thread, kept alive across its calls
+    assert http_server.connections <= 4
+
+
+def test_get_is_retried_on_transient_errors(http_server):
+    http_server.script = [{"status": 503}, {"status": 502}, {"status": 200, "body": {"ok": True}}]
+
+    response = http_client.get_session().get(http_server.url, timeout=5)
+
+    assert response.json() == {"ok": True}
+    assert len(http_server.requests) == 3
+
+
+def test_retries_are_bounded(http_server):
+    http_server.script = [{"status": 503}]
+
+    with pytest.raises(requests.exceptions.RetryError):
+        http_client.get_session().get(http_server.url, timeout=5)
+    # The first attempt plus two retries
+    assert len(http_server.requests) == 3
+
+
+def test_client_errors_and_posts_are_not_retried(http_server):
+    http_server.script = [{"status": 404}]
+    assert http_client.get_session().get(http_server.url, timeout=5).status_code == 404
+    assert len(http_server.requests) == 1
+
+    http_server.script = [{"status": 503}]
+    assert http_client.get_session().post(http_server.url, json={}, timeout=5).status_code == 503
+    assert len(http_server.requests) == 2
+
+
+def test_read_timeout_is_raised(http_server):
+    http_server.script = [{"status": 200, "delay": 0.5}]
+
+    with pytest.raises(requests.exceptions.RequestException):
+        http_client.get_session().get(http_server.url, timeout=0.1)
+    # Timed-out reads are retried like transient errors, within the same bound
+    assert len(http_server.requests) == 3
+
+
+def test_web_search_returns_the_first_snippet(search_api):
+    search_api.script = [{"status": 200, "body": {"items": [{"snippet": "First."}, {"snippet": "Second."}]}}]
+
+    assert ai_engine.web_search("breach of contract") == "First."
+    assert ai_engine.web_search("Breach of contract ") == "First."
+
+    # The second call is answered from the cache
+    assert len(search_api.requests) == 1
+    assert 'q=breach+of+contract' in search_api.requests[0]['path']
+
+
+def test_web_search_retries_then_succeeds(search_api):
+    search_api.script = [{"status": 503}, {"status": 200, "body": {"items": [{"snippet": "Recovered."}]}}]
+
+    assert ai_engine.web_search("tenancy") == "Recovered."
+    assert len(search_api.requests) == 2
+
+
+def test_web_search_timeout_is_reported_and_not_cached(search_api, monkeypatch):
+    monkeypatch.setattr(ai_engine, 'SEARCH_TIMEOUT', 0.1)
+    search_api.script = [{"status": 200, "delay": 0.5}]
+
+    assert ai_engine.web_search("slow query") == "Web search failed."
+
+    search_api.script = [{"status": 200, "body": {"items": [{"snippet": "Fast."}]}}]
+    assert ai_engine.web_search("slow query") == "Fast."
@@ -0,0 +1,90 @@
+"""Document listing: download URLs and keyset pagination."""
+import json
+from datetime import datetime, timedelta
+import pytest
+from flask import url_for
+from config import Config
+from app import create_app
+from extensions import db
+from blueprints.documents.models import Document
+from blueprints.documents.listing import decode_cursor, encode_cursor, iter_page_json, page_query
+
+
+class ListingConfig(Config):
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+
+
+@pytest.fixture
+def app():
+    return create_app(ListingConfig)
+
+
+def test_download_url_matches_the_route(app):
+    with app.test_request_context():
+        for document_id in ('0b7c2b58-4a8e-4f0e-9a52-3f1f6f0e2c11', 'odd id'):
+            assert Document.download_url(document_id) == url_for('documents_bp.download_document',
+                                                                 doc_id=document_id)
+
+
+def test_download_url_needs_no_request_context():
+    assert Document.download_url('abc') == '/documents/documents/abc/download'
+
+
+@pytest.fixture
+def documents(app):
+    """Documents of owner 1 (several sharing each timestamp) and owner 2, newest first."""
+    start = datetime(2024, 1, 1, 12, 0, 0, 123456)
+    owned = []
+    with app.app_context():
+        db.create_all()
+        for number in range(23):
+            owner_id = 2 if number % 5 == 0 else 1
+            upload_date = start + timedelta(seconds=number // 3)
+            db.session.add(Document(id=f"doc-{number:02d}", title=f"Document {number}",
+                                    filename=f"document-{number}.pdf", file_path=f"ab/{number}.pdf",
+                                    upload_date=upload_date, owner_id=owner_id))
+            if owner_id == 1:
+                owned.append((upload_date, f"doc-{number:02d}"))
+        db.session.commit()
+        yield [document_id for _, document_id in sorted(owned, reverse=True)]
+
+
+def test_cursor_round_trips():
+    upload_date = datetime(2024, 1, 1, 12, 0, 0, 123456)
+
+    assert decode_cursor(encode_cursor(upload_date, 'doc-07')) == (upload_date, 'doc-07')
+    for malformed in ('', 'not a cursor', encode_cursor(upload_date, 'x')[:-3] + '!!!'):
+        with pytest.raises(ValueError):
+            decode_cursor(malformed)
+
+
+def test_pages_walk_every_document_once_in_order(app, documents):
+    seen, after = [], None
+    with app.app_context():
+        while True:
+            rows = page_query(1, after, limit=4).all()
+            if not rows:
+                break
+            seen.extend(row.id for row in rows)
+            # The next page starts from a cursor that went through its string form
+            after = decode_cursor(encode_cursor(rows[-1].upload_date, rows[-1].id))
+
+    assert seen == documents
+
+
+def test_streamed_pages_link_by_next_cursor(app, documents):
+    seen, cursor, pages = [], None, 0
+    with app.app_context():
+        while True:
+            after = decode_cursor(cursor) if cursor else None
+            page = json.loads(''.join(iter_page_json(1, after, limit=5)))
+            seen.extend(entry["id"] for entry in page["documents"])
+            pages += 1
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+
+    assert seen == documents
+    # 18 documents in pages of 5; the last page is known to be last without an empty page
+    assert pages == 4
+    assert page["documents"][-1]["file_url"] == Document.download_url(documents[-1])
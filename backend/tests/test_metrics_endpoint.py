@@ -0,0 +1,49 @@
+"""Access to the /metrics scrape endpoint."""
+import pytest
+from config import Config
+from app import create_app
+
+
+class MetricsConfig(Config):
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    METRICS_TOKEN = None
+
+
+def make_client(token=None, debug=False, testing=False):
+    config = type('Config', (MetricsConfig,), {'METRICS_TOKEN': token})
+    app = create_app(config)
+    app.debug = debug
+    app.testing = testing
+    return app.test_client()
+
+
+def test_refused_without_a_token_in_production():
+    response = make_client().get('/metrics')
+
+    assert response.status_code == 403
+    assert response.get_json()["code"] == 403
+    assert b'legal_' not in response.data
+
+
+@pytest.mark.parametrize('mode', ['debug', 'testing'])
+def test_served_without_a_token_in_debug_and_testing(mode):
+    response = make_client(**{mode: True}).get('/metrics')
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+
+
+def test_token_is_required_when_configured():
+    client = make_client(token='scrape-secret')
+
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    response = client.get('/metrics', headers={'Authorization': 'Bearer scrape-secret'})
+    assert response.status_code == 200
+    assert b'http_request_duration_seconds' in response.data
+
+
+def test_token_is_required_in_debug_too():
+    client = make_client(token='scrape-secret', debug=True)
+
+    assert client.get('/metrics').status_code == 401
@@ -0,0 +1,119 @@
+"""Concurrent query stages: deadlines counted from stage start, and pool saturation."""
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from blueprints.nlp import ai_engine
+from services.concurrency import WorkCounter
+
+
+@pytest.fixture
+def stage_pool(monkeypatch):
+    """A two-worker stage pool with short deadlines."""
+    executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='test-stage')
+    monkeypatch.setattr(ai_engine, 'stage_executor', executor)
+    monkeypatch.setattr(ai_engine, 'stage_work', WorkCounter())
+    monkeypatch.setattr(ai_engine, 'QUERY_STAGE_WORKERS', 2)
+    monkeypatch.setattr(ai_engine, 'QUERY_CONCURRENT_STAGES', True)
+    monkeypatch.setattr(ai_engine, 'STAGE_QUEUE_TIMEOUT', 0.3)
+    monkeypatch.setattr(ai_engine, 'STAGE_DEADLINES', {'fast': 0.5, 'slow': 0.2})
+    yield executor
+    executor.shutdown(wait=True)
+
+
+def sleeper(seconds, value):
+    def stage():
+        time.sleep(seconds)
+        return value
+    return stage
+
+
+def test_stages_run_in_parallel(stage_pool):
+    started = time.monotonic()
+    results, incomplete = ai_engine.run_query_stages({'fast': sleeper(0.1, 'a'), 'slow': sleeper(0.1, 'b')})
+
+    assert results == {'fast': 'a', 'slow': 'b'}
+    assert incomplete == []
+    assert time.monotonic() - started < 0.19
+
+
+def test_late_stage_is_incomplete(stage_pool):
+    results, incomplete = ai_engine.run_query_stages({'fast': sleeper(0.01, 'a'), 'slow': sleeper(0.4, 'b')})
+
+    assert results == {'fast': 'a', 'slow': None}
+    assert incomplete == ['slow']
+
+
+def test_failed_stage_is_incomplete(stage_pool):
+    def fail():
+        raise RuntimeError("search is down")
+
+    results, incomplete = ai_engine.run_query_stages({'fast': fail, 'slow': sleeper(0.01, 'b')})
+
+    assert results == {'fast': None, 'slow': 'b'}
+    assert incomplete == ['fast']
+
+
+def test_deadline_counts_from_stage_start(stage_pool):
+    # Both workers are busy for 0.15s, which is most of the 'slow' deadline;
+    # the stages still get their full deadline once they start
+    release = threading.Event()
+    for _ in range(2):
+        stage_pool.submit(release.wait, 0.15)
+
+    results, incomplete = ai_engine.run_query_stages({'fast': sleeper(0.1, 'a'), 'slow': sleeper(0.1, 'b')})
+
+    assert results == {'fast': 'a', 'slow': 'b'}
+    assert incomplete == []
+
+
+def test_saturated_pool_drops_queued_stages(stage_pool):
+    release = threading.Event()
+    for _ in range(2):
+        stage_pool.submit(release.wait, 5)
+    ran = []
+
+    started = time.monotonic()
+    results, incomplete = ai_engine.run_query_stages({'fast': lambda: ran.append('fast'),
+                                                      'slow': lambda: ran.append('slow')})
+    elapsed = time.monotonic() - started
+    release.set()
+    stage_pool.shutdown(wait=True)
+
+    assert results == {'fast': None, 'slow': None}
+    assert incomplete == ['fast', 'slow']
+    # Dropped after the queue timeout, and never run afterwards
+    assert 0.3 <= elapsed < 0.5
+    assert ran == []
+    assert (ai_engine.stage_work.queued, ai_engine.stage_work.running) == (0, 0)
+
+
+def test_queued_and_running_stages_are_counted(stage_pool):
+    release = threading.Event()
+    counts = []
+
+    def count():
+        counts.append((ai_engine.stage_work.queued, ai_engine.stage_work.running))
+        release.wait(5)
+    # Two stages hold both workers while a third waits for one
+    for _ in range(2):
+        ai_engine.stage_work.submit(stage_pool, count)
+    queued = ai_engine.stage_work.submit(stage_pool, count)
+    time.sleep(0.05)
+
+    assert (ai_engine.stage_work.queued, ai_engine.stage_work.running) == (1, 2)
+    release.set()
+    queued.result(timeout=5)
+    # Nothing was left queued once the third stage got a worker
+    assert counts[-1][0] == 0
+    stage_pool.shutdown(wait=True)
+    assert (ai_engine.stage_work.queued, ai_engine.stage_work.running) == (0, 0)
+
+
+def test_sequential_mode_runs_every_stage(stage_pool, monkeypatch):
+    monkeypatch.setattr(ai_engine, 'QUERY_CONCURRENT_STAGES', False)
+
+    results, incomplete = ai_engine.run_query_stages({'fast': sleeper(0, 'a'), 'slow': sleeper(0, 'b')})
+
+    assert results == {'fast': 'a', 'slow': 'b'}
+    assert incomplete == []
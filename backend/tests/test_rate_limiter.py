@@ -0,0 +1,121 @@
+"""Rate limiting: route costs and token buckets."""
+import time
+import pytest
+from config import Config
+from app import create_app
+from services.rate_limiter import RATE_LIMIT_ROUTE_COSTS, RateLimiter, route_cost
+
+
+class RateLimitConfig(Config):
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+
+
+@pytest.fixture(scope='module')
+def app():
+    return create_app(RateLimitConfig)
+
+
+def test_every_route_cost_names_a_real_endpoint(app):
+    routes = {(method, rule.endpoint) for rule in app.url_map.iter_rules() for method in rule.methods}
+
+    for key in RATE_LIMIT_ROUTE_COSTS:
+        method, endpoint = key.split(' ', 1)
+        assert (method, endpoint) in routes, f"{key} matches no route"
+
+
+def test_expensive_routes_are_charged_and_polls_are_not(app):
+    adapter = app.url_map.bind('localhost')
+
+    def cost(method, path):
+        endpoint, _ = adapter.match(path, method=method)
+        return route_cost(method, endpoint)
+
+    assert cost('POST', '/nlp/query') == 10
+    assert cost('POST', '/documents/upload') == 5
+    assert cost('GET', '/nlp/query/job-1') == 1
+    assert route_cost('GET', None) == 1
+
+
+def test_route_cost_uses_the_given_mapping():
+    costs = {'POST nlp.handle_query': 10}
+
+    assert route_cost('POST', 'nlp.handle_query', costs) == 10
+    assert route_cost('GET', 'nlp.handle_query', costs) == 1
+    assert route_cost('POST', 'documents_bp.upload_document', {}) == 1
+
+
+LIMITS = {'user': (3, 1), 'ip': (5, 1)}
+
+
+@pytest.fixture(params=['redis', 'local'])
+def limiter(request, fake_redis, monkeypatch):
+    """A limiter over fakeredis (the Lua script), or over its local fallback."""
+    limiter = RateLimiter(limits=dict(LIMITS))
+    if request.param == 'local':
+        monkeypatch.setattr(limiter, '_check_redis', failing_redis)
+    return limiter
+
+
+def failing_redis(buckets, cost):
+    raise ConnectionError("Redis is down")
+
+
+def test_bucket_allows_its_capacity_then_refuses(limiter):
+    identities = {'user': '1', 'ip': '10.0.0.1'}
+
+    decisions = [limiter.check(identities) for _ in range(4)]
+
+    assert [decision.allowed for decision in decisions] == [True, True, True, False]
+    assert decisions[2].remaining == pytest.approx(0, abs=0.01)
+    # One token refills per second
+    assert 0.9 < decisions[3].retry_after <= 1.0
+
+
+def test_cost_is_spent_from_every_bucket_or_none(limiter):
+    assert limiter.check({'user': '1', 'ip': '10.0.0.1'}, cost=3).allowed
+    # Another user behind the same IP: the IP bucket has 2 tokens left, so this
+    # request is refused and the new user's bucket is not charged
+    refused = limiter.check({'user': '2', 'ip': '10.0.0.1'}, cost=3)
+    assert not refused.allowed
+    assert refused.remaining == pytest.approx(2, abs=0.01)
+    assert limiter.check({'user': '2', 'ip': '10.0.0.2'}, cost=3).allowed
+
+
+def test_bucket_refills_over_time(fake_redis):
+    limiter = RateLimiter(limits={'user': (1, 20)})
+
+    assert limiter.check({'user': '1'}).allowed
+    assert not limiter.check({'user': '1'}).allowed
+    time.sleep(0.06)
+    assert limiter.check({'user': '1'}).allowed
+
+
+def test_redis_errors_fall_back_to_local_buckets_for_a_while(fake_redis, monkeypatch):
+    limiter = RateLimiter(limits=dict(LIMITS), redis_retry=0.05)
+    check_redis = limiter._check_redis
+    calls = []
+
+    def flaky(buckets, cost):
+        calls.append(cost)
+        if len(calls) == 1:
+            raise ConnectionError("Redis is down")
+        return check_redis(buckets, cost)
+    monkeypatch.setattr(limiter, '_check_redis', flaky)
+
+    assert limiter.check({'user': '1'}).allowed
+    assert limiter.check({'user': '1'}).allowed
+    assert len(calls) == 1
+    time.sleep(0.06)
+    assert limiter.check({'user': '1'}).allowed
+    assert len(calls) == 2
+
+
+def test_local_buckets_are_bounded(monkeypatch):
+    limiter = RateLimiter(limits=dict(LIMITS), local_max_keys=4)
+    monkeypatch.setattr(limiter, '_check_redis', failing_redis)
+
+    for user in range(10):
+        limiter.check({'user': str(user), 'ip': '10.0.0.1'})
+
+    assert len(limiter._local) == 4
+    assert 'ratelimit:ip:10.0.0.1' in limiter._local